@@ -0,0 +1,514 @@
+# -*- coding: ISO-8859-15 -*-
+
+"""
+On-disk caches for OGC service documents and map tiles.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+import urllib2
+import urlparse
+from StringIO import StringIO
+from urllib import urlencode, quote
+
+from owslib.util import openURL, log
+
+
+def normalize_url(url):
+    """Return a canonical form of a KVP request url: lower case scheme,
+    host and parameter names, and parameters sorted, so that equivalent
+    requests share a cache entry."""
+    pieces = urlparse.urlsplit(url.strip())
+    params = sorted((k.lower(), v) for k, v in
+                    urlparse.parse_qsl(pieces.query, keep_blank_values=True))
+    return urlparse.urlunsplit((pieces.scheme.lower(), pieces.netloc.lower(),
+                                pieces.path, urlencode(params), ''))
+
+
+class CapabilitiesCache(object):
+    """
+    Cache of raw GetCapabilities documents on disk.
+
+    Each document is stored with its ETag and Last-Modified validators.
+    Within ttl seconds of being fetched it is served without any HTTP
+    request, after that it is revalidated with a conditional GET.  When
+    max_size (in bytes) is given the least recently used documents are
+    evicted to keep the cache under that size.
+
+    The same cache directory may be shared by several processes.
+
+    Parameters
+    ----------
+
+    - directory: the cache directory, created if missing
+    - ttl: number of seconds a document is used without revalidation (None to
+      revalidate on every read)
+    - max_size: maximum total size in bytes of the cached documents
+
+    """
+
+    def __init__(self, directory, ttl=3600, max_size=None):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_size = max_size
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def key(self, url, username=None):
+        """Return the cache key of a capabilities request url"""
+        material = normalize_url(url)
+        if username:
+            material = '%s %s' % (username, material)
+        return hashlib.sha1(material).hexdigest()
+
+    def _paths(self, key):
+        base = os.path.join(self.directory, key)
+        return base + '.xml', base + '.json'
+
+    def _write(self, path, content):
+        # write then rename, so that concurrent readers never see partial files
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.rename(tmp, path)
+
+    def _load(self, key):
+        data_path, meta_path = self._paths(key)
+        try:
+            with open(meta_path, 'rb') as f:
+                meta = json.load(f)
+            with open(data_path, 'rb') as f:
+                content = f.read()
+        except (IOError, OSError, ValueError):
+            return None, None
+        return meta, content
+
+    def _store(self, key, url, content, headers):
+        data_path, meta_path = self._paths(key)
+        meta = {
+            'url': url,
+            'fetched': time.time(),
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+        }
+        self._write(data_path, content)
+        self._write(meta_path, json.dumps(meta))
+        if self.max_size is not None:
+            self.evict(self.max_size)
+
+    def _touch(self, key):
+        # the data file modification time records the last use, for LRU eviction
+        try:
+            os.utime(self._paths(key)[0], None)
+        except OSError:
+            pass
+
+    def read(self, url, username=None, password=None, cookies=None, timeout=30, session=None):
+        """
+
+        Return the raw document for a capabilities request url, from the
+        cache when fresh or still valid, from the server otherwise.
+
+        Parameters
+        ----------
+
+        - url: the full GetCapabilities request url
+        - username, password: optional credentials for HTTP Basic authentication
+        - cookies: optional cookies sent with the request
+        - timeout: timeout in seconds
+        - session: optional util.Session used for the request
+
+        """
+        key = self.key(url, username)
+        meta, content = self._load(key)
+        if meta is not None and self.ttl is not None and time.time() - meta['fetched'] < self.ttl:
+            self._touch(key)
+            return content
+
+        headers = {}
+        if meta is not None:
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+
+        spliturl = url.split('?', 1)
+        try:
+            u = openURL(spliturl[0], spliturl[1] if len(spliturl) > 1 else '', method='Get',
+                        cookies=cookies, username=username, password=password,
+                        timeout=timeout, session=session, headers=headers)
+            if getattr(u, 'code', 200) == 304:
+                u.read()
+                u = None
+        except urllib2.HTTPError, e:
+            if e.code != 304 or meta is None:
+                raise
+            u = None
+        except (urllib2.URLError, socket.error), e:
+            if meta is None:
+                raise
+            log.warning('Could not revalidate %s, using cached copy: %s' % (url, e))
+            return content
+
+        if u is None:  # not modified
+            meta['fetched'] = time.time()
+            self._write(self._paths(key)[1], json.dumps(meta))
+            self._touch(key)
+            return content
+
+        content = u.read()
+        self._store(key, url, content, u.headers)
+        return content
+
+    def evict(self, max_size=0):
+        """Remove least recently used documents until the cache holds at most max_size bytes"""
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith('.xml'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name[:-4]))
+            total += stat.st_size
+        for mtime, size, key in sorted(entries):
+            if total <= max_size:
+                break
+            for path in self._paths(key):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= size
+
+    def clear(self):
+        """Remove all cached documents"""
+        self.evict(0)
+
+
+class CachedTile(StringIO):
+    """File-like tile served by a TileCache, in place of the HTTP response"""
+
+    def __init__(self, data, url=None, format=None):
+        StringIO.__init__(self, data)
+        self.url = url
+        self.headers = {}
+        if format:
+            self.headers['Content-Type'] = format
+
+    def info(self):
+        return self.headers
+
+    def geturl(self):
+        return self.url
+
+
+class TileCache(object):
+    """
+    Base class of the local tile caches of WebMapTileService and
+    TileMapService.
+
+    Tiles are keyed by (service url, layer, style, format, tile matrix set,
+    tile matrix, row, column) tuples.  Tiles older than ttl seconds are
+    fetched again, and when max_size (in bytes) is given the least recently
+    used tiles are evicted to keep the cache under that size.
+
+    The mode sets how the cache is used by read():
+
+    - 'rw': tiles are served from the cache, missing tiles are fetched and
+      stored (read-through and write-through)
+    - 'r': tiles are served from the cache, missing tiles are fetched but
+      not stored, for instance to use a seeded cache without growing it
+    - 'w': tiles are always fetched and stored, to seed or refresh the cache
+
+    Parameters
+    ----------
+
+    - ttl: number of seconds a tile is served (None to keep tiles forever)
+    - max_size: maximum total size in bytes of the cached tiles
+    - mode: 'rw', 'r' or 'w'
+
+    """
+
+    def __init__(self, ttl=None, max_size=None, mode='rw'):
+        if mode not in ('rw', 'r', 'w'):
+            raise ValueError("mode should be 'rw', 'r' or 'w', not %r" % (mode,))
+        self.ttl = ttl
+        self.max_size = max_size
+        self.mode = mode
+        # total size of the tiles, counted from the first write on
+        self._size = None
+        self._lock = threading.Lock()
+
+    def read(self, key, fetch):
+        """Return the tile data of key, from the cache or from fetch()"""
+        if 'r' in self.mode:
+            data = self.get(key)
+            if data is not None:
+                return data
+        data = fetch()
+        if 'w' in self.mode:
+            self.put(key, data)
+        return data
+
+    def _expired(self, fetched):
+        return self.ttl is not None and time.time() - fetched >= self.ttl
+
+    def _added(self, size):
+        # replaced tiles are counted twice until the next eviction recounts
+        if self.max_size is None:
+            return
+        if self._size is None:
+            total = self.size()
+            with self._lock:
+                self._size = total
+        else:
+            with self._lock:
+                self._size += size
+        if self._size > self.max_size:
+            self.evict(self.max_size)
+
+    def get(self, key):
+        """Return the data of a tile, or None when missing or expired"""
+        raise NotImplementedError
+
+    def put(self, key, data):
+        """Store the data of a tile"""
+        raise NotImplementedError
+
+    def size(self):
+        """Return the total size in bytes of the cached tiles"""
+        raise NotImplementedError
+
+    def evict(self, max_size=0):
+        """Remove least recently used tiles until the cache holds at most max_size bytes"""
+        raise NotImplementedError
+
+    def clear(self):
+        """Remove all cached tiles"""
+        self.evict(0)
+
+
+class MBTilesCache(TileCache):
+    """
+    Tile cache in a SQLite database, laid out after MBTiles.
+
+    The tiles table has the zoom_level (tile matrix identifier),
+    tile_column, tile_row and tile_data columns of MBTiles, plus the other
+    parts of the tile keys and the times of fetch and last use, so one
+    database holds the tiles of several services and layers.  Rows are
+    counted from the top as in WMTS, not from the bottom as in MBTiles.
+
+    Parameters
+    ----------
+
+    - path: the database file, created if missing
+    - ttl, max_size, mode: as for TileCache
+
+    """
+
+    # last use times are only updated when older than this, to save writes
+    _TOUCH_INTERVAL = 60
+
+    def __init__(self, path, ttl=None, max_size=None, mode='rw'):
+        TileCache.__init__(self, ttl, max_size, mode)
+        self.path = path
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.text_factory = str
+        with self._lock:
+            with self._db:
+                self._db.execute('CREATE TABLE IF NOT EXISTS metadata '
+                                 '(name TEXT PRIMARY KEY, value TEXT)')
+                self._db.execute('CREATE TABLE IF NOT EXISTS tiles ('
+                                 'service TEXT, layer TEXT, style TEXT, format TEXT, '
+                                 'tilematrixset TEXT, zoom_level TEXT, '
+                                 'tile_column INTEGER, tile_row INTEGER, tile_data BLOB, '
+                                 'fetched REAL, accessed REAL, PRIMARY KEY (service, layer, '
+                                 'style, format, tilematrixset, zoom_level, tile_column, tile_row))')
+                self._db.execute('CREATE INDEX IF NOT EXISTS tiles_accessed ON tiles (accessed)')
+                self._db.execute("INSERT OR IGNORE INTO metadata VALUES ('name', 'owslib tile cache')")
+
+    def _where(self, key):
+        service, layer, style, format, tilematrixset, tilematrix, row, column = key
+        return ('service = ? AND layer = ? AND style = ? AND format = ? AND tilematrixset = ? '
+                'AND zoom_level = ? AND tile_column = ? AND tile_row = ?',
+                (service, layer, style or '', format or '', tilematrixset or '',
+                 str(tilematrix), int(column), int(row)))
+
+    def get(self, key):
+        where, params = self._where(key)
+        with self._lock:
+            row = self._db.execute('SELECT tile_data, fetched, accessed FROM tiles WHERE ' + where,
+                                   params).fetchone()
+            if row is None or self._expired(row[1]):
+                return None
+            now = time.time()
+            if now - row[2] > self._TOUCH_INTERVAL:
+                with self._db:
+                    self._db.execute('UPDATE tiles SET accessed = ? WHERE ' + where, (now,) + params)
+        return str(row[0])
+
+    def put(self, key, data):
+        where, params = self._where(key)
+        now = time.time()
+        with self._lock:
+            with self._db:
+                self._db.execute('INSERT OR REPLACE INTO tiles (service, layer, style, format, '
+                                 'tilematrixset, zoom_level, tile_column, tile_row, tile_data, '
+                                 'fetched, accessed) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                 params + (sqlite3.Binary(data), now, now))
+        self._added(len(data))
+
+    def size(self):
+        with self._lock:
+            return self._db.execute('SELECT COALESCE(SUM(LENGTH(tile_data)), 0) FROM tiles').fetchone()[0]
+
+    def evict(self, max_size=0):
+        with self._lock:
+            with self._db:
+                if max_size <= 0:
+                    self._db.execute('DELETE FROM tiles')
+                    self._size = 0
+                    return
+                rows = self._db.execute('SELECT rowid, LENGTH(tile_data) FROM tiles '
+                                        'ORDER BY accessed').fetchall()
+                total = sum(size for rowid, size in rows)
+                evicted = []
+                for rowid, size in rows:
+                    if total <= max_size:
+                        break
+                    evicted.append((rowid,))
+                    total -= size
+                self._db.executemany('DELETE FROM tiles WHERE rowid = ?', evicted)
+                self._size = total
+
+    def close(self):
+        """Close the database"""
+        self._db.close()
+
+
+class DirectoryTileCache(TileCache):
+    """
+    Tile cache in a directory tree, with a file per tile under
+    service/layer/style/tilematrixset/tilematrix/column/row.ext, the
+    z/x/y layout of tile servers.
+
+    The service directory is named after a hash of the service url, the
+    other names are URL-quoted.  The modification time of a tile file is the
+    time it was fetched, its access time the time it was last used.  The
+    same directory may be shared by several processes.
+
+    Parameters
+    ----------
+
+    - directory: the cache directory, created if missing
+    - ttl, max_size, mode: as for TileCache
+
+    """
+
+    def __init__(self, directory, ttl=None, max_size=None, mode='rw'):
+        TileCache.__init__(self, ttl, max_size, mode)
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def path(self, key):
+        """Return the file of a tile"""
+        service, layer, style, format, tilematrixset, tilematrix, row, column = key
+        extension = ''
+        if format:
+            extension = '.' + _quote_name(format.split(';')[0].split('/')[-1].strip().replace('jpeg', 'jpg'))
+        return os.path.join(self.directory, hashlib.sha1(normalize_url(service)).hexdigest()[:16],
+                            _quote_name(layer), _quote_name(style), _quote_name(tilematrixset),
+                            _quote_name(tilematrix), str(int(column)), str(int(row)) + extension)
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            mtime = os.stat(path).st_mtime
+            if self._expired(mtime):
+                return None
+            with open(path, 'rb') as f:
+                data = f.read()
+            # the access time records the last use, for LRU eviction
+            os.utime(path, (time.time(), mtime))
+        except (IOError, OSError):
+            return None
+        return data
+
+    def put(self, key, data):
+        path = self.path(key)
+        directory = os.path.dirname(path)
+        try:
+            os.makedirs(directory)
+        except OSError:
+            if not os.path.isdir(directory):
+                raise
+        # write then rename, so that concurrent readers never see partial files
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.rename(tmp, path)
+        self._added(len(data))
+
+    def _files(self):
+        for root, dirs, names in os.walk(self.directory):
+            for name in names:
+                if not name.endswith('.tmp'):
+                    yield os.path.join(root, name)
+
+    def size(self):
+        total = 0
+        for path in self._files():
+            try:
+                total += os.path.getsize(path)
+            except OSError:
+                pass
+        return total
+
+    def evict(self, max_size=0):
+        entries = []
+        total = 0
+        for path in self._files():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_atime, stat.st_size, path))
+            total += stat.st_size
+        for atime, size, path in sorted(entries):
+            if total <= max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+        with self._lock:
+            self._size = total
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+        with self._lock:
+            self._size = 0
+
+
+def _quote_name(value):
+    """Return value as a file name: URL-quoted, never empty nor a relative directory"""
+    if value is None or value == '':
+        return '@'  # never the result of quote()
+    name = quote(str(value), '')
+    if name.startswith('.'):
+        name = '%2E' + name[1:]
+    return name
@@ -34,12 +34,13 @@ class WebCoverageService_1_0_0(WCSBase):
         else:
             raise KeyError, "No content named %s" % name
     
-    def __init__(self,url,xml, cookies):
+    def __init__(self,url,xml, cookies, cache=None):
         self.version='1.0.0'
         self.url = url   
         self.cookies=cookies
+        self.cache=cache
         # initialize from saved capability document or access the server
-        reader = WCSCapabilitiesReader(self.version, self.cookies)
+        reader = WCSCapabilitiesReader(self.version, self.cookies, self.cache)
         if xml:
             self._capabilities = reader.readString(xml)
         else:
@@ -106,7 +107,8 @@ class WebCoverageService_1_0_0(WCSBase):
 
         is equivalent to:
         http://myhost/mywcs?SERVICE=WCS&REQUEST=GetCoverage&IDENTIFIER=TuMYrRQ4&VERSION=1.1.0&BOUNDINGBOX=-180,-90,180,90&TIME=2792-06-01T00:00:00.0&FORMAT=cf-netcdf
-           
+
+        wcsdecoder.WCSDecoder(cvg).getCoverages(unpackdir) streams the response to files in unpackdir
         """
         if log.isEnabledFor(logging.DEBUG):
             log.debug('WCS 1.0.0 DEBUG: Parameters passed to GetCoverage: identifier=%s, bbox=%s, time=%s, format=%s, crs=%s, width=%s, height=%s, resx=%s, resy=%s, resz=%s, parameter=%s, method=%s, other_arguments=%s'%(identifier, bbox, time, format, crs, width, height, resx, resy, resz, parameter, method, str(kwargs)))
@@ -158,6 +160,10 @@ class WebCoverageService_1_0_0(WCSBase):
         u=openURL(base_url, data, method, self.cookies)
 
         return u
+
+    def _getCoverageTile(self, identifier, tile, format, **kwargs):
+        return self.getCoverage(identifier=identifier, bbox=tile.bbox, crs=tile.crs, width=tile.width,
+                                height=tile.height, format=format, **kwargs)
     
 
                
@@ -290,6 +296,10 @@ class ContentMetadata(object):
         gridelem= self.descCov.find(ns('CoverageOffering/')+ns('domainSet/')+ns('spatialDomain/')+'{http://www.opengis.net/gml}RectifiedGrid')
         if gridelem is not None:
             grid=RectifiedGrid(gridelem)
+            if grid.srsName is None:
+                envelope=self.descCov.find(ns('CoverageOffering/')+ns('domainSet/')+ns('spatialDomain/')+'{http://www.opengis.net/gml}Envelope')
+                if envelope is not None:
+                    grid.srsName=envelope.get('srsName')
         else:
             gridelem=self.descCov.find(ns('CoverageOffering/')+ns('domainSet/')+ns('spatialDomain/')+'{http://www.opengis.net/gml}Grid')
             grid=Grid(gridelem)
@@ -404,6 +414,7 @@ class RectifiedGrid(Grid):
     ''' RectifiedGrid class, extends Grid with additional offset vector information '''
     def __init__(self, rectifiedgrid):
         super(RectifiedGrid,self).__init__(rectifiedgrid)
+        self.srsName=rectifiedgrid.get('srsName')
         self.origin=rectifiedgrid.find('{http://www.opengis.net/gml}origin/{http://www.opengis.net/gml}pos').text.split()
         self.offsetvectors=[]
         for offset in rectifiedgrid.findall('{http://www.opengis.net/gml}offsetVector'):
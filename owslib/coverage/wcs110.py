@@ -38,12 +38,13 @@ class WebCoverageService_1_1_0(WCSBase):
         else:
             raise KeyError, "No content named %s" % name
     
-    def __init__(self,url,xml, cookies):
+    def __init__(self,url,xml, cookies, cache=None):
         self.version='1.1.0'
         self.url = url   
         self.cookies=cookies
+        self.cache=cache
         # initialize from saved capability document or access the server
-        reader = WCSCapabilitiesReader(self.version)
+        reader = WCSCapabilitiesReader(self.version, cache=self.cache)
         if xml:
             self._capabilities = reader.readString(xml)
         else:
@@ -134,6 +135,8 @@ class WebCoverageService_1_1_0(WCSBase):
         
         if store = true, returns a coverages XML file
         if store = false, returns a multipart mime
+
+        wcsdecoder.WCSDecoder(cvg).getCoverages(unpackdir) streams the response to files in unpackdir
         """
         if log.isEnabledFor(logging.DEBUG):
             log.debug('WCS 1.1.0 DEBUG: Parameters passed to GetCoverage: identifier=%s, bbox=%s, time=%s, format=%s, rangesubset=%s, gridbaseCRS=%s, gridtype=%s, gridCS=%s, gridorigin=%s, gridoffsets=%s, method=%s, other_arguments=%s'%(identifier, bbox, time, format, rangesubset, gridbaseCRS, gridtype, gridCS, gridorigin, gridoffsets, method, str(kwargs)))
@@ -152,7 +155,8 @@ class WebCoverageService_1_1_0(WCSBase):
         request['identifier']=identifier
         #request['identifier'] = ','.join(identifier)
         if bbox:
-            request['boundingbox']=','.join([repr(x) for x in bbox])
+            # the crs, if any, is the last item of the bbox
+            request['boundingbox']=','.join([x if isinstance(x, basestring) else repr(x) for x in bbox])
         if time:
             request['timesequence']=','.join(time)
         request['format']=format
@@ -184,6 +188,17 @@ class WebCoverageService_1_1_0(WCSBase):
         
         u=openURL(base_url, data, method, self.cookies)
         return u
+
+    def _getCoverageTile(self, identifier, tile, format, **kwargs):
+        # the grid of the tile starts at the center of its upper left cell
+        resx, resy = tile.resolution
+        bbox = tile.bbox
+        if tile.crs is not None:
+            bbox += (tile.crs,)
+        return self.getCoverage(identifier=identifier, bbox=bbox, format=format,
+                                gridbaseCRS=tile.crs, gridtype='urn:ogc:def:method:WCS:1.1:2dSimpleGrid',
+                                gridorigin='%r,%r' % (tile.bbox[0] + resx / 2, tile.bbox[3] - resy / 2),
+                                gridoffsets='%r,%r' % (resx, -resy), **kwargs)
         
         
     def getOperationByName(self, name):
@@ -364,15 +379,11 @@ class ContentMetadata(object):
     #grid is either a gml:Grid or a gml:RectifiedGrid if supplied as part of the DescribeCoverage response.
     def _getGrid(self):
         grid=None
-        #TODO- convert this to 1.1 from 1.0
-        #if not hasattr(self, 'descCov'):
-                #self.descCov=self._service.getDescribeCoverage(self.id)
-        #gridelem= self.descCov.find(ns('CoverageOffering/')+ns('domainSet/')+ns('spatialDomain/')+'{http://www.opengis.net/gml}RectifiedGrid')
-        #if gridelem is not None:
-            #grid=RectifiedGrid(gridelem)
-        #else:
-            #gridelem=self.descCov.find(ns('CoverageOffering/')+ns('domainSet/')+ns('spatialDomain/')+'{http://www.opengis.net/gml}Grid')
-            #grid=Grid(gridelem)
+        if not hasattr(self, 'descCov'):
+            self.descCov=self._service.getDescribeCoverage(self.id)
+        domain=self.descCov.find(ns('CoverageDescription/')+ns('Domain/')+ns('SpatialDomain'))
+        if domain is not None and domain.find(ns('GridCRS')) is not None:
+            grid=RectifiedGrid(domain)
         return grid
     grid=property(_getGrid, None)
         
@@ -402,3 +413,29 @@ class ContentMetadata(object):
             except:
                 value = None
         return value  
+
+
+class RectifiedGrid(object):
+    ''' Grid of a coverage, from the GridCRS of its spatial domain, with the attributes of a
+    gml:RectifiedGrid (see wcs100.RectifiedGrid).  The limits of the grid are those of the
+    imageCRS bounding box of the domain, when it has one '''
+    def __init__(self, domain):
+        gridcrs=domain.find(ns('GridCRS'))
+        self.srsName=testXMLValue(gridcrs.find(ns('GridBaseCRS')))
+        # the origin defaults to 0 0
+        self.origin=(testXMLValue(gridcrs.find(ns('GridOrigin'))) or '0 0').split()
+        offsets=testXMLValue(gridcrs.find(ns('GridOffsets'))).split()
+        if len(offsets) == 2:
+            # 2dSimpleGrid: offsets along the axes of the base crs
+            self.offsetvectors=[[offsets[0], '0'], ['0', offsets[1]]]
+        else:
+            self.offsetvectors=[offsets[:2], offsets[2:4]]
+        self.dimension=len(self.origin)
+        self.axislabels=[]
+        self.lowlimits=[]
+        self.highlimits=[]
+        for owsns in ('{http://www.opengis.net/ows/1.1}', '{http://www.opengis.net/ows}'):
+            for bbox in domain.findall(owsns+'BoundingBox'):
+                if bbox.get('crs', '').endswith('imageCRS'):
+                    self.lowlimits=[str(int(float(v))) for v in testXMLValue(bbox.find(owsns+'LowerCorner')).split()]
+                    self.highlimits=[str(int(float(v))) for v in testXMLValue(bbox.find(owsns+'UpperCorner')).split()]
@@ -12,7 +12,11 @@
 from urllib import urlencode
 from urllib2 import urlopen, Request
 from owslib.etree import etree
+from owslib.util import concurrent_map, reraise
+from owslib.coverage.wcsdecoder import WCSDecoder, _makedir
 import cgi
+import math
+import os
 from StringIO import StringIO
 
 
@@ -33,17 +37,19 @@ class ServiceException(Exception):
 
 class WCSBase(object):
     """Base class to be subclassed by version dependent WCS classes. Provides 'high-level' version independent methods"""
-    def __new__(self,url, xml, cookies):
+    def __new__(self,url, xml, cookies, cache=None):
         """ overridden __new__ method 
         
         @type url: string
         @param url: url of WCS capabilities document
         @type xml: string
         @param xml: elementtree object
+        @type cache: owslib.cache.CapabilitiesCache
+        @param cache: optional on-disk cache of the GetCapabilities document
         @return: inititalised WCSBase object
         """
         obj=object.__new__(self)
-        obj.__init__(url, xml, cookies)
+        obj.__init__(url, xml, cookies, cache)
         self.cookies=cookies
         self._describeCoverage = {} #cache for DescribeCoverage responses
         return obj
@@ -57,20 +63,150 @@ class WCSBase(object):
             reader = DescribeCoverageReader(self.version, identifier, self.cookies)
             self._describeCoverage[identifier] = reader.read(self.url)
         return self._describeCoverage[identifier]
+
+
+    def getCoverageTiles(self, identifier, bbox=None, width=None, height=None, crs=None, format=None,
+                         maxsize=(1024, 1024), unpackdir='./unpacked', max_workers=4, **kwargs):
+        ''' Request a large coverage as tiles of at most maxsize (width, height) cells, downloaded
+        concurrently by max_workers threads and unpacked to a directory per tile in unpackdir.
+
+        Without width and height, the tiles are aligned to the native grid of the coverage (its
+        RectifiedGrid): bbox, in the CRS of the grid, is extended to whole grid cells and limited to the
+        grid, and each tile covers whole cells, so tiles are returned without resampling.  Otherwise
+        the width x height raster of bbox (in crs) is split into tiles.
+
+        Returns the CoverageTile list, row by row from the upper left tile; the georeferencing of
+        the tiles (bbox, size, offset in the whole raster) allows mosaicking them.
+        Other arguments are those of getCoverage.
+        '''
+        if width is None or height is None:
+            grid = self.contents[identifier].grid
+            bbox, width, height = _snapToGrid(grid, bbox)
+            if crs is None:
+                crs = grid.srsName
+        elif bbox is None:
+            raise ValueError('A bbox is needed with width and height')
+        tiles = _tileRaster(bbox, width, height, maxsize, crs)
+        _makedir(unpackdir)
+
+        def fetch(tile):
+            u = self._getCoverageTile(identifier, tile, format, **kwargs)
+            tile.paths = WCSDecoder(u).getCoverages(os.path.join(unpackdir, 'tile-%03d-%03d' % (tile.row, tile.column)))
+            return tile
+
+        for tile, result, error in concurrent_map(fetch, tiles, max_workers):
+            if error is not None:
+                reraise(error)
+        return tiles
+
+
+class CoverageTile(object):
+    """A tile of a coverage requested by WCSBase.getCoverageTiles
+
+    Attributes:
+        bbox -- (minx, miny, maxx, maxy) of the tile, in crs
+        crs -- the CRS of bbox
+        width, height -- size of the tile in cells
+        column, row -- position of the tile in the tiling, from the upper left tile
+        x, y -- offset in cells of the upper left corner of the tile in the whole raster
+        paths -- the files the tile was unpacked to
+    """
+
+    def __init__(self, bbox, crs, width, height, column, row, x, y):
+        self.bbox = bbox
+        self.crs = crs
+        self.width = width
+        self.height = height
+        self.column = column
+        self.row = row
+        self.x = x
+        self.y = y
+        self.paths = []
+
+    @property
+    def resolution(self):
+        return ((self.bbox[2] - self.bbox[0]) / self.width, (self.bbox[3] - self.bbox[1]) / self.height)
+
+    @property
+    def transform(self):
+        """(upper left x, cell width, 0, upper left y, 0, -cell height), the affine transform of
+        the tile cells, in the GDAL geotransform order"""
+        resx, resy = self.resolution
+        return (self.bbox[0], resx, 0.0, self.bbox[3], 0.0, -resy)
+
+    def __repr__(self):
+        return '<CoverageTile %d,%d: %dx%d at %d,%d>' % (self.column, self.row, self.width, self.height, self.x, self.y)
+
+
+def _snapToGrid(grid, bbox=None):
+    """ Return the (bbox, width, height) of the cells of a rectified grid covering bbox
+    (by default the whole grid); cells are centered on the points of the grid """
+    if getattr(grid, 'origin', None) is None or len(getattr(grid, 'offsetvectors', [])) < 2:
+        raise ValueError('The coverage has no rectified grid, width and height are needed')
+    origin = [float(v) for v in grid.origin[:2]]
+    (dx, skewx), (skewy, dy) = [[float(v) for v in vector[:2]] for vector in grid.offsetvectors[:2]]
+    if skewx or skewy:
+        raise ValueError('Rotated grids are not supported')
+    if grid.lowlimits and grid.highlimits:
+        low = [int(v) for v in grid.lowlimits[:2]]
+        high = [int(v) for v in grid.highlimits[:2]]
+    elif bbox is None:
+        raise ValueError('The grid of the coverage has no limits, a bbox is needed')
+    else:
+        low = high = None
+
+    def cells(axis, offset):
+        # the range of indices of the cells of axis intersecting bbox
+        if bbox is None:
+            return low[axis], high[axis]
+        a = (float(bbox[axis]) - origin[axis]) / offset + 0.5
+        b = (float(bbox[axis + 2]) - origin[axis]) / offset + 0.5
+        a, b = min(a, b), max(a, b)
+        first = int(math.floor(a + 1e-9))
+        last = int(math.ceil(b - 1e-9)) - 1
+        if low is not None:
+            first, last = max(low[axis], first), min(high[axis], last)
+        if last < first:
+            raise ValueError('The bbox %s is outside of the grid' % (bbox,))
+        return first, last
+
+    (i0, i1), (j0, j1) = cells(0, dx), cells(1, dy)
+    xs = origin[0] + (i0 - 0.5) * dx, origin[0] + (i1 + 0.5) * dx
+    ys = origin[1] + (j0 - 0.5) * dy, origin[1] + (j1 + 0.5) * dy
+    return (min(xs), min(ys), max(xs), max(ys)), i1 - i0 + 1, j1 - j0 + 1
+
+
+def _tileRaster(bbox, width, height, maxsize, crs):
+    """ Split the width x height raster of bbox into CoverageTiles of at most maxsize cells """
+    minx, miny, maxx, maxy = [float(v) for v in bbox[:4]]
+    resx, resy = (maxx - minx) / width, (maxy - miny) / height
+    tiles = []
+    for row, y in enumerate(range(0, height, maxsize[1])):
+        h = min(maxsize[1], height - y)
+        for column, x in enumerate(range(0, width, maxsize[0])):
+            w = min(maxsize[0], width - x)
+            # the edges of the last tiles are those of bbox, not sums of resolutions
+            tilebbox = (minx + x * resx, maxy - (y + h) * resy if y + h < height else miny,
+                        minx + (x + w) * resx if x + w < width else maxx, maxy - y * resy)
+            tiles.append(CoverageTile(tilebbox, crs, w, h, column, row, x, y))
+    return tiles
         
         
 class WCSCapabilitiesReader(object):
     """Read and parses WCS capabilities document into a lxml.etree infoset
     """
 
-    def __init__(self, version=None, cookies = None):
+    def __init__(self, version=None, cookies = None, cache=None):
         """Initialize
         @type version: string
         @param version: WCS Version parameter e.g '1.0.0'
+        @type cache: owslib.cache.CapabilitiesCache
+        @param cache: optional on-disk cache of the GetCapabilities document
         """
         self.version = version
         self._infoset = None
         self.cookies = cookies
+        self.cache = cache
 
     def capabilities_url(self, service_url):
         """Return a capabilities url
@@ -106,6 +242,8 @@ class WCSCapabilitiesReader(object):
         @return: An elementtree tree representation of the capabilities document
         """
         request = self.capabilities_url(service_url)
+        if self.cache is not None:
+            return etree.fromstring(self.cache.read(request, cookies=self.cookies, timeout=timeout))
         req = Request(request)
         if self.cookies is not None:
             req.add_header('Cookie', self.cookies)   
@@ -15,8 +15,26 @@
 
 import os
 from owslib.etree import etree
+from owslib.util import StreamingURL, sniff_root, xmltag_split
+import base64
+import cgi
 import email
 import errno
+import mimetypes
+import quopri
+import re
+
+# start of a MIME header line, such as 'Content-Type: multipart/related; boundary=...'
+_MIME_HEADER = re.compile(r'[A-Za-z][\w-]*:')
+
+def _makedir(unpackdir):
+    #create the directory (and its parents) if it doesn't exist:
+    try:
+        os.makedirs(unpackdir)
+    except OSError, e:
+        # Ignore directory exists error
+        if e.errno <> errno.EEXIST:
+            raise
 
 class WCSDecoder(object):
     def __init__(self, u):
@@ -25,18 +43,39 @@ class WCSDecoder(object):
         self._getType()
 
     def _getType(self):
-        ''' determine whether it is a Multipart Mime or a Coverages XML file'''
+        ''' determine whether it is a Multipart Mime, a Coverages XML file or the coverage itself.
+        The start of the stream is read ahead, and replayed by self.u'''
         
-        #what's the best way to test this? 
-        #for now read start of file
-        tempu=self.u
-        if tempu.readline()[:14] == '<?xml version=':              
+        try:
+            self.contentType = self.u.info().get('Content-Type') or ''
+        except AttributeError:
+            self.contentType = ''
+        maintype = self.contentType.split(';')[0].strip().lower()
+        line = self.u.readline(1024)
+        if line[:14] != '<?xml version=' and ('xml' in maintype or line.lstrip()[:1] == '<'):
+            # XML without declaration: a Coverages document is known by its root element
+            tag, line = sniff_root(StreamingURL(self.u, line))
+            self.u = StreamingURL(self.u, line)
+            if tag is not None and xmltag_split(tag) == 'Coverages':
+                self.urlType='XML'
+                return
+        else:
+            self.u = StreamingURL(self.u, line)
+        if line[:14] == '<?xml version=':              
             self.urlType='XML'       
+        elif maintype.startswith('multipart/') or line.startswith('--') or _MIME_HEADER.match(line):
+            self.urlType='Multipart'
+        elif maintype:
+            # the coverage itself, e.g. a GeoTIFF returned by WCS 1.0.0
+            self.urlType='File'
         else:
             self.urlType='Multipart'
         
       
-    def getCoverages(self, unpackdir='./unpacked'):
+    def getCoverages(self, unpackdir='./unpacked', chunksize=65536):
+        ''' returns the urls of the coverages of a Coverages XML file, or unpacks the parts of
+        a Multipart Mime (or the coverage itself) to unpackdir and returns their paths.
+        Files are written chunksize bytes at a time, the response is never held in memory.'''
         if self.urlType=='XML': 
             paths=[]              
             u_xml = self.u.read()
@@ -44,14 +83,32 @@ class WCSDecoder(object):
             for ref in u_tree.findall('{http://www.opengis.net/wcs/1.1}Coverage/{http://www.opengis.net/wcs/1.1}Reference'):
                 path = ref.attrib['{http://www.w3.org/1999/xlink}href']
                 paths.append(path)         
-            for ref in u_tree.findall('{http://www.opengis.net/wcs/1.1.0/owcs}Coverage/{{http://www.opengis.net/wcs/1.1.0/owcs}Reference'):
+            for ref in u_tree.findall('{http://www.opengis.net/wcs/1.1.0/owcs}Coverage/{http://www.opengis.net/wcs/1.1.0/owcs}Reference'):
                 path = ref.attrib['{http://www.w3.org/1999/xlink}href']
                 paths.append(path)         
         elif self.urlType=='Multipart':
-            #Decode multipart mime and return fileobjects
-            u_mpart=self.u.read()
-            mpart =MpartMime(u_mpart)
-            paths= mpart.unpackToDir(unpackdir)
+            #Decode multipart mime as it is read and write out the files
+            boundary = cgi.parse_header(self.contentType)[1].get('boundary')
+            mpart = MpartMimeStream(self.u, boundary, chunksize)
+            paths = mpart.unpackToDir(unpackdir)
+        else:
+            _makedir(unpackdir)
+            filename = cgi.parse_header(getattr(self.u, 'info', lambda: {})().get('Content-Disposition') or '')[1].get('filename')
+            if filename:
+                filename = os.path.basename(filename)
+            else:
+                filename = 'coverage%s' % (mimetypes.guess_extension(self.contentType.split(';')[0].strip()) or '.bin')
+            fullpath = os.path.join(unpackdir, filename)
+            fp = open(fullpath, 'wb')
+            try:
+                while True:
+                    chunk = self.u.read(chunksize)
+                    if not chunk:
+                        break
+                    fp.write(chunk)
+            finally:
+                fp.close()
+            paths = [fullpath]
         return paths
 
 class MpartMime(object):
@@ -63,13 +120,7 @@ class MpartMime(object):
         """ unpacks contents of Multipart mime to a given directory"""
         
         names=[]
-        #create the directory if it doesn't exist:
-        try:
-            os.mkdir(unpackdir)
-        except OSError, e:
-            # Ignore directory exists error
-            if e.errno <> errno.EEXIST:
-                raise
+        _makedir(unpackdir)
                
         #now walk through the multipart mime and write out files
         msg = email.message_from_string(self.mpartmime)
@@ -96,3 +147,172 @@ class MpartMime(object):
             fp.write(part.get_payload(decode=True))
             fp.close()
         return names
+
+
+class _Base64Writer(object):
+    """ decodes base64 data written in chunks of any size """
+    def __init__(self, fp):
+        self.fp = fp
+        self._pending = ''
+
+    def write(self, data):
+        data = self._pending + ''.join(data.split())
+        n = len(data) // 4 * 4
+        self.fp.write(base64.b64decode(data[:n]))
+        self._pending = data[n:]
+
+    def close(self):
+        if self._pending:
+            self.fp.write(base64.b64decode(self._pending))
+        self.fp.close()
+
+
+class _QuotedPrintableWriter(object):
+    """ decodes quoted-printable data written in chunks of any size, line by line """
+    def __init__(self, fp):
+        self.fp = fp
+        self._pending = ''
+
+    def write(self, data):
+        data = self._pending + data
+        n = data.rfind('\n') + 1
+        self.fp.write(quopri.decodestring(data[:n]))
+        self._pending = data[n:]
+
+    def close(self):
+        if self._pending:
+            self.fp.write(quopri.decodestring(self._pending))
+        self.fp.close()
+
+
+class MpartMimeStream(object):
+    """ Multipart mime read from a stream (such as a WCS GetCoverage response) and unpacked as it is read:
+    parts are written out chunksize bytes at a time, so that parts of any size are unpacked in bounded memory.
+    boundary is taken from the Content-Type header of the response; when it is not given it is found in
+    the stream, from its first delimiter or its own MIME headers."""
+    def __init__(self, u, boundary=None, chunksize=65536):
+        self.u = u
+        self.boundary = boundary
+        self.chunksize = chunksize
+        self._buffer = ''
+
+    def _fill(self):
+        chunk = self.u.read(self.chunksize)
+        self._buffer += chunk
+        return chunk != ''
+
+    def _readline(self):
+        while '\n' not in self._buffer:
+            if not self._fill():
+                line, self._buffer = self._buffer, ''
+                return line
+        n = self._buffer.index('\n') + 1
+        line, self._buffer = self._buffer[:n], self._buffer[n:]
+        return line
+
+    def _readheaders(self, line=None):
+        lines = []
+        if line is None:
+            line = self._readline()
+        while line.strip():
+            lines.append(line)
+            line = self._readline()
+        return email.message_from_string(''.join(lines))
+
+    def _copy(self, delimiter, write):
+        """ passes the data up to the next delimiter (excluded, along with its line break) to write,
+        returns False when the stream ends first """
+        keep = len(delimiter)
+        while True:
+            i = self._buffer.find(delimiter)
+            if i >= 0:
+                data, self._buffer = self._buffer[:i], self._buffer[i + len(delimiter):]
+                if data.endswith('\r'):
+                    data = data[:-1]
+                if write is not None:
+                    write(data)
+                return True
+            # the end of the buffer may hold the start of the delimiter
+            if len(self._buffer) > keep:
+                data, self._buffer = self._buffer[:-keep], self._buffer[-keep:]
+                if write is not None:
+                    write(data)
+            if not self._fill():
+                data, self._buffer = self._buffer, ''
+                if write is not None:
+                    write(data)
+                return False
+
+    def unpackToDir(self, unpackdir):
+        """ unpacks contents of Multipart mime to a given directory, returns the paths of the files written """
+        
+        names=[]
+        _makedir(unpackdir)
+        
+        boundary = self.boundary
+        if boundary is None:
+            line = self._readline()
+            while line and not line.strip():
+                line = self._readline()
+            if line.startswith('--'):
+                # the first delimiter: put it back
+                boundary = line.strip()[2:]
+                self._buffer = line + self._buffer
+            else:
+                boundary = self._readheaders(line).get_param('boundary')
+                if boundary is None:
+                    raise ValueError('Multipart mime without boundary')
+        self._unpackParts(boundary, unpackdir, names)
+        return names
+
+    def _unpackParts(self, boundary, unpackdir, names):
+        """ unpacks the parts delimited by boundary to unpackdir and appends their paths to names,
+        returns False when the stream ends before the closing delimiter """
+        # the first delimiter may start the stream, without a preceding line break
+        delimiter = '\n--' + boundary
+        self._buffer = '\n' + self._buffer
+        if not self._copy(delimiter, None):
+            return False
+        
+        while True:
+            # the end of the delimiter line; '--' closes the multipart
+            if self._readline().startswith('--'):
+                return True
+            part = self._readheaders()
+            if part.get_content_maintype() == 'multipart':
+                # a nested multipart, unpacked with its own boundary
+                nested = part.get_param('boundary')
+                if nested is None:
+                    raise ValueError('Nested multipart mime without boundary')
+                if not self._unpackParts(nested, unpackdir, names):
+                    return False
+                # skip its epilogue, up to our next delimiter
+                self._buffer = '\n' + self._buffer
+                if not self._copy(delimiter, None):
+                    return False
+                continue
+            counter = len(names) + 1
+            # the filename is not trusted to point outside unpackdir
+            filename = part.get_filename()
+            if filename:
+                filename = os.path.basename(filename)
+            if not filename:
+                ext = mimetypes.guess_extension(part.get_content_type())
+                if not ext:
+                    # Use a generic extension
+                    ext = '.bin'
+                filename = 'part-%03d%s' % (counter, ext)
+            fullpath=os.path.join(unpackdir, filename)
+            names.append(fullpath)
+            fp = open(fullpath, 'wb')
+            encoding = (part.get('Content-Transfer-Encoding') or '').strip().lower()
+            if encoding == 'base64':
+                fp = _Base64Writer(fp)
+            elif encoding == 'quoted-printable':
+                fp = _QuotedPrintableWriter(fp)
+            try:
+                more = self._copy(delimiter, fp.write)
+            finally:
+                fp.close()
+            if not more:
+                return False
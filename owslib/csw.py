@@ -14,7 +14,10 @@ import inspect
 import warnings
 import StringIO
 import random
-from urllib import urlencode
+import sqlite3
+from collections import deque
+from multiprocessing.pool import ThreadPool
+from urllib import urlencode, quote
 from urllib2 import Request, urlopen
 
 from owslib.util import OrderedDict
@@ -31,6 +34,8 @@ from owslib.util import cleanup_namespaces, bind_url, add_namespaces
 
 # default variables
 outputformat = 'application/xml'
+# longest URL of the GET requests of getrecordsbyid
+MAX_URL_LENGTH = 2000
 
 def get_namespaces():
     n = Namespaces()
@@ -42,7 +47,7 @@ schema_location = '%s %s' % (namespaces['csw'], schema)
 class CatalogueServiceWeb:
     """ csw request class """
     def __init__(self, url, lang='en-US', version='2.0.2', timeout=10, skip_caps=False,
-                 username=None, password=None):
+                 username=None, password=None, session=None):
         """
 
         Construct and process a GetCapabilities request
@@ -57,6 +62,7 @@ class CatalogueServiceWeb:
         - skip_caps: whether to skip GetCapabilities processing on init (default is False)
         - username: username for HTTP basic authentication
         - password: password for HTTP basic authentication
+        - session: optional util.Session pooling HTTP connections between requests
 
         """
 
@@ -66,6 +72,7 @@ class CatalogueServiceWeb:
         self.timeout = timeout
         self.username = username
         self.password = password
+        self.session = session
         self.service = 'CSW'
         self.exceptionreport = None
         self.owscommon = ows.OwsCommon('1.0.0')
@@ -283,6 +290,81 @@ class CatalogueServiceWeb:
             self.records = OrderedDict()
             self._parserecords(outputschema, esn)
 
+    def getrecordsbyid(self, ids, esn='full', outputschema=namespaces['csw'], format=outputformat, operation='GetRecordById', typenames='csw:Record', propertyname='dc:identifier', batchsize=100, max_workers=4):
+        """
+
+        Fetch the records of any number of identifiers, in batches of
+        concurrent requests.  Returns an OrderedDict of the records found,
+        by identifier, in the order of ids.  self.records is left untouched.
+
+        With GetRecordById, identifiers are packed into requests up to
+        batchsize identifiers or MAX_URL_LENGTH characters of URL; with
+        GetRecords, each request holds batchsize PropertyIsEqualTo filters
+        on propertyname joined with Or.
+
+        Parameters
+        ----------
+
+        - ids: the list of Ids
+        - esn: the ElementSetName 'full', 'brief' or 'summary' (default is 'full')
+        - outputschema: the outputSchema (default is 'http://www.opengis.net/cat/csw/2.0.2')
+        - format: the outputFormat (default is 'application/xml')
+        - operation: 'GetRecordById' (default) or 'GetRecords'
+        - typenames: the typeNames to query with GetRecords (default is csw:Record)
+        - propertyname: the queryable holding identifiers, for GetRecords (default is dc:identifier)
+        - batchsize: the maximum number of identifiers per request (default is 100)
+        - max_workers: the number of concurrent requests (default is 4)
+
+        """
+
+        if operation.lower() == 'getrecordbyid':
+            data = {
+                'service': self.service,
+                'version': self.version,
+                'request': 'GetRecordById',
+                'outputFormat': format,
+                'outputSchema': outputschema,
+                'elementsetname': esn,
+            }
+            base = '%s%s&id=' % (bind_url(self.url), urlencode(data))
+
+            batches = [[]]
+            length = len(base)
+            for i in ids:
+                size = len(quote(i, safe='')) + 3  # and an encoded comma
+                if batches[-1] and (len(batches[-1]) >= batchsize or length + size > MAX_URL_LENGTH):
+                    batches.append([])
+                    length = len(base)
+                batches[-1].append(i)
+                length += size
+
+            def fetch(batch):
+                request = base + quote(','.join(batch), safe='')
+                return self._parseresponse(self._send(request, 'getrecordbyid')[1])
+        elif operation.lower() == 'getrecords':
+            batches = [ids[i:i + batchsize] for i in range(0, len(ids), batchsize)]
+
+            def fetch(batch):
+                constraints = [fes.PropertyIsEqualTo(propertyname, i) for i in batch]
+                request = self._getrecordsrequest(constraints, None, typenames, esn, outputschema,
+                                                  format, 0, len(batch), None, 'results')
+                return self._parseresponse(self._send(request, 'getrecords')[1])
+        else:
+            raise ValueError('Unsupported operation %s' % operation)
+
+        found = {}
+        for batch, exml, error in util.concurrent_map(fetch, [b for b in batches if b], max_workers):
+            if error is not None:
+                util.reraise(error)
+            for identifier, record in self._readrecords(exml, outputschema, esn):
+                found[identifier] = record
+
+        records = OrderedDict()
+        for i in ids:
+            if i in found:
+                records[i] = found[i]
+        return records
+
     def getrecords2(self, constraints=[], sortby=None, typenames='csw:Record', esn='summary', outputschema=namespaces['csw'], format=outputformat, startposition=0, maxrecords=10, cql=None, xml=None, resulttype='results'):
         """
 
@@ -311,42 +393,9 @@ class CatalogueServiceWeb:
             if val is not None:
                 esn = util.testXMLValue(val)
         else:
-            # construct request
-            node0 = self._setrootelement('csw:GetRecords')
-            if etree.__name__ != 'lxml.etree':  # apply nsmap manually
-                node0.set('xmlns:ows', namespaces['ows'])
-                node0.set('xmlns:gmd', namespaces['gmd'])
-                node0.set('xmlns:dif', namespaces['dif'])
-                node0.set('xmlns:fgdc', namespaces['fgdc'])
-            node0.set('outputSchema', outputschema)
-            node0.set('outputFormat', format)
-            node0.set('version', self.version)
-            node0.set('service', self.service)
-            node0.set('resultType', resulttype)
-            if startposition > 0:
-                node0.set('startPosition', str(startposition))
-            node0.set('maxRecords', str(maxrecords))        
-            node0.set(util.nspath_eval('xsi:schemaLocation', namespaces), schema_location)
-
-            node1 = etree.SubElement(node0, util.nspath_eval('csw:Query', namespaces))
-            node1.set('typeNames', typenames)
-        
-            etree.SubElement(node1, util.nspath_eval('csw:ElementSetName', namespaces)).text = esn
-
-            if any([len(constraints) > 0, cql is not None]): 
-                node2 = etree.SubElement(node1, util.nspath_eval('csw:Constraint', namespaces))
-                node2.set('version', '1.1.0')
-                flt = fes.FilterRequest()
-                if len(constraints) > 0:
-                    node2.append(flt.setConstraintList(constraints))
-                # Now add a CQL filter if passed in
-                elif cql is not None:
-                    etree.SubElement(node2, util.nspath_eval('csw:CqlText', namespaces)).text = cql
-                
-            if sortby is not None and isinstance(sortby, fes.SortBy):
-                node1.append(sortby.toXML())
-
-            self.request = node0
+            self.request = self._getrecordsrequest(constraints, sortby, typenames, esn,
+                                                   outputschema, format, startposition,
+                                                   maxrecords, cql, resulttype)
 
         self._invoke()
  
@@ -373,6 +422,160 @@ class CatalogueServiceWeb:
 
             self._parserecords(outputschema, esn)
 
+    def count(self, constraints=[], typenames='csw:Record', cql=None):
+        """
+
+        Return the number of records matching a query, without fetching
+        them: a GetRecords request with resultType="hits" is made and only
+        the numberOfRecordsMatched attribute of the response is parsed.
+        Returns None when the response does not tell it.
+
+        No record is parsed: self.records is left untouched, and
+        self.results tells the number of matches, with none returned.
+
+        Parameters
+        ----------
+
+        - constraints: the list of constraints (OgcExpression from owslib.fes module)
+        - typenames: the typeNames to query against (default is csw:Record)
+        - cql: common query language text.  Note this overrides constraints
+
+        """
+
+        self.request = self._getrecordsrequest(constraints, None, typenames, 'brief',
+                                               namespaces['csw'], outputformat, 0, 0,
+                                               cql, 'hits')
+        self._invoke(parse=False)
+
+        tag, attrib = util.sniff_attributes(StringIO.StringIO(self.response),
+                                            ('SearchResults', 'ExceptionReport'))
+        if tag != 'SearchResults':
+            self._exml = etree.parse(StringIO.StringIO(self.response))
+            if tag == 'ExceptionReport':
+                raise ows.ExceptionReport(self._exml, self.owscommon.namespace)
+            raise RuntimeError, 'Document is XML, but not CSW-ish'
+        self.exceptionreport = None
+        self._exml = None
+        matches = util.testXMLValue(attrib.get('numberOfRecordsMatched'), True)
+        if matches is not None:
+            matches = int(matches)
+        self.results = {'matches': matches, 'returned': 0, 'nextrecord': None}
+        return matches
+
+    def iterrecords(self, constraints=[], sortby=None, typenames='csw:Record', esn='summary', outputschema=namespaces['csw'], format=outputformat, startposition=1, pagesize=10, maxrecords=None, cql=None, max_workers=1):
+        """
+
+        Page through the result set of a query with successive GetRecords
+        requests, yielding records one at a time.
+
+        Records are parsed a page at a time and pages are dropped once read,
+        so result sets of any size are iterated in bounded memory; unlike
+        getrecords2, self.records is left untouched.  Once the first page
+        tells the number of matching records, the following pages may be
+        fetched from a pool of max_workers threads, keeping at most
+        max_workers pages in flight.  Records are yielded in result set order.
+
+        Parameters
+        ----------
+
+        - constraints, sortby, typenames, esn, outputschema, format, cql: as for getrecords2
+        - startposition: the position of the first record (default is 1)
+        - pagesize: the number of records requested at a time (default is 10)
+        - maxrecords: the maximum number of records to yield (default is all)
+        - max_workers: the number of pages fetched concurrently (default is 1)
+
+        """
+
+        def size(position):
+            # the number of records requested from position
+            if maxrecords is None:
+                return pagesize
+            return min(pagesize, startposition + maxrecords - position)
+
+        def end():
+            # the position past the last record to read, None while unknown
+            stop = results['matches'] + 1 if results.get('matches') is not None else None
+            if maxrecords is not None:
+                stop = startposition + maxrecords if stop is None else min(stop, startposition + maxrecords)
+            return stop
+
+        def fetch(position, stream=False):
+            request = self._getrecordsrequest(constraints, sortby, typenames, esn, outputschema,
+                                              format, position, size(position), cql, 'results')
+            return self._send(request, 'getrecords', stream)[1]
+
+        pool = ThreadPool(max_workers) if max_workers > 1 else None
+        pending = deque()  # (position, page) of the pages fetched ahead
+        results = {}
+        # the next position to fetch ahead; pages are only fetched ahead once the
+        # first page shows that the server returns as many records as requested,
+        # servers capping maxRecords being read page after page
+        ahead = [None]
+        capped = [False]
+
+        def schedule():
+            if pool is None or capped[0]:
+                return
+            if ahead[0] is None:
+                if results.get('returned') != size(startposition):
+                    return
+                ahead[0] = startposition + pagesize
+            stop = end()
+            while stop is not None and len(pending) < max_workers and ahead[0] < stop:
+                pending.append((ahead[0], pool.apply_async(fetch, (ahead[0],))))
+                ahead[0] += pagesize
+
+        # the page being read is parsed as it is downloaded, pages fetched
+        # ahead are held as bytes until their turn
+        position = startposition
+        source = fetch(position, stream=True)
+        try:
+            while source is not None:
+                returned = 0
+                try:
+                    for record in self._iterparserecords(source, outputschema, esn, results):
+                        schedule()
+                        yield record
+                        returned += 1
+                finally:
+                    if hasattr(source, 'close'):
+                        source.close()
+                if returned == 0:  # no more records, whatever the server says
+                    break
+                requested = size(position)
+                position += returned
+                stop = end()
+                if stop is not None and position >= stop:
+                    break
+                if returned < requested:
+                    # the next page starts after the records actually returned
+                    if not capped[0]:
+                        util.log.debug('CSW returned %d records of %d requested, reading pages in turn' % (returned, requested))
+                    capped[0] = True
+                elif ahead[0] is None and position == startposition + pagesize:
+                    # the first page was full, without telling numberOfRecordsReturned;
+                    # the page at position is fetched next
+                    ahead[0] = position + pagesize
+                if pending and pending[0][0] == position:
+                    source = StringIO.StringIO(pending.popleft()[1].get())
+                else:
+                    pending.clear()
+                    source = fetch(position, stream=True)
+                schedule()
+        finally:
+            if pool is not None:
+                pool.terminate()
+
+    def harvestchanges(self, state, **kwargs):
+        """
+
+        Return an IncrementalHarvest of the records added or changed since
+        the last harvest recorded in state (a HarvestState); see
+        IncrementalHarvest for the keyword arguments.
+
+        """
+        return IncrementalHarvest(self, state, **kwargs)
+
     def transaction(self, ttype=None, typename='csw:Record', record=None, propertyname=None, propertyvalue=None, bbox=None, keywords=[], cql=None, identifier=None):
         """
 
@@ -517,26 +720,80 @@ class CatalogueServiceWeb:
                 self.results['insertresults'].append(util.testXMLValue(j))
 
     def _parserecords(self, outputschema, esn):
+        for identifier, record in self._readrecords(self._exml, outputschema, esn):
+            self.records[identifier] = record
+
+    def _readrecords(self, exml, outputschema, esn):
+        # yield the (identifier, record) of each record of a response
         if outputschema == namespaces['gmd']: # iso 19139
-            for i in self._exml.findall('.//'+util.nspath_eval('gmd:MD_Metadata', namespaces)) or self._exml.findall('.//'+util.nspath_eval('gmi:MI_Metadata', namespaces)):
+            for i in exml.findall('.//'+util.nspath_eval('gmd:MD_Metadata', namespaces)) or exml.findall('.//'+util.nspath_eval('gmi:MI_Metadata', namespaces)):
                 val = i.find(util.nspath_eval('gmd:fileIdentifier/gco:CharacterString', namespaces))
                 identifier = self._setidentifierkey(util.testXMLValue(val))
-                self.records[identifier] = MD_Metadata(i)
+                yield identifier, MD_Metadata(i)
         elif outputschema == namespaces['fgdc']: # fgdc csdgm
-            for i in self._exml.findall('.//metadata'):
+            for i in exml.findall('.//metadata'):
                 val = i.find('idinfo/datasetid')
                 identifier = self._setidentifierkey(util.testXMLValue(val))
-                self.records[identifier] = Metadata(i)
+                yield identifier, Metadata(i)
         elif outputschema == namespaces['dif']: # nasa dif
-            for i in self._exml.findall('.//'+util.nspath_eval('dif:DIF', namespaces)):
+            for i in exml.findall('.//'+util.nspath_eval('dif:DIF', namespaces)):
                 val = i.find(util.nspath_eval('dif:Entry_ID', namespaces))
                 identifier = self._setidentifierkey(util.testXMLValue(val))
-                self.records[identifier] = DIF(i)
+                yield identifier, DIF(i)
         else: # process default
-            for i in self._exml.findall('.//'+util.nspath_eval('csw:%s' % self._setesnel(esn), namespaces)):
+            for i in exml.findall('.//'+util.nspath_eval('csw:%s' % self._setesnel(esn), namespaces)):
                 val = i.find(util.nspath_eval('dc:identifier', namespaces))
                 identifier = self._setidentifierkey(util.testXMLValue(val))
-                self.records[identifier] = CswRecord(i)
+                yield identifier, CswRecord(i)
+
+    def _iterparserecords(self, source, outputschema, esn, results=None):
+        # incrementally parse the GetRecords response read from source,
+        # yielding each record as its element closes; the element is then
+        # detached from the document, so that only the records still
+        # referenced by the caller are kept in memory.  The attributes of
+        # csw:SearchResults are stored in results as getrecords2 does
+        if outputschema == namespaces['gmd']: # iso 19139
+            tags, parse = (util.nspath_eval('gmd:MD_Metadata', namespaces), util.nspath_eval('gmi:MI_Metadata', namespaces)), MD_Metadata
+        elif outputschema == namespaces['fgdc']: # fgdc csdgm
+            tags, parse = ('metadata',), Metadata
+        elif outputschema == namespaces['dif']: # nasa dif
+            tags, parse = (util.nspath_eval('dif:DIF', namespaces),), DIF
+        else: # process default
+            tags, parse = (util.nspath_eval('csw:%s' % self._setesnel(esn), namespaces),), CswRecord
+        searchresults = util.nspath_eval('csw:SearchResults', namespaces)
+        exceptionreport = util.nspath_eval('ows:ExceptionReport', namespaces)
+
+        stack = []
+        inside = 0  # number of open record elements
+        for event, elem in etree.iterparse(source, events=('start', 'end')):
+            if event == 'start':
+                if not stack and elem.tag not in (util.nspath_eval('csw:GetRecordsResponse', namespaces), exceptionreport):
+                    raise RuntimeError, 'Document is XML, but not CSW-ish'
+                stack.append(elem)
+                if elem.tag in tags:
+                    inside += 1
+                elif elem.tag == searchresults and results is not None:
+                    for key, attr in (('matches', 'numberOfRecordsMatched'),
+                                      ('returned', 'numberOfRecordsReturned'),
+                                      ('nextrecord', 'nextRecord')):
+                        val = elem.attrib.get(attr)
+                        results[key] = int(util.testXMLValue(val, True)) if val is not None else None
+                continue
+
+            stack.pop()
+            if not stack:
+                if elem.tag == exceptionreport:
+                    raise ows.ExceptionReport(elem, self.owscommon.namespace)
+                break
+            if elem.tag in tags:
+                inside -= 1
+                if inside == 0:
+                    record = parse(elem)
+                    stack[-1].remove(elem)
+                    yield record
+            elif inside == 0 and stack[0].tag != exceptionreport:
+                # search status and the like, already read
+                stack[-1].remove(elem)
 
     def _parsetransactionsummary(self):
         val = self._exml.find(util.nspath_eval('csw:TransactionSummary', namespaces))
@@ -571,6 +828,45 @@ class CatalogueServiceWeb:
         else:
             return etree.Element(util.nspath_eval(el, namespaces))
 
+    def _getrecordsrequest(self, constraints, sortby, typenames, esn, outputschema, format,
+                           startposition, maxrecords, cql, resulttype):
+        # construct GetRecords request
+        node0 = self._setrootelement('csw:GetRecords')
+        if etree.__name__ != 'lxml.etree':  # apply nsmap manually
+            node0.set('xmlns:ows', namespaces['ows'])
+            node0.set('xmlns:gmd', namespaces['gmd'])
+            node0.set('xmlns:dif', namespaces['dif'])
+            node0.set('xmlns:fgdc', namespaces['fgdc'])
+        node0.set('outputSchema', outputschema)
+        node0.set('outputFormat', format)
+        node0.set('version', self.version)
+        node0.set('service', self.service)
+        node0.set('resultType', resulttype)
+        if startposition > 0:
+            node0.set('startPosition', str(startposition))
+        node0.set('maxRecords', str(maxrecords))        
+        node0.set(util.nspath_eval('xsi:schemaLocation', namespaces), schema_location)
+
+        node1 = etree.SubElement(node0, util.nspath_eval('csw:Query', namespaces))
+        node1.set('typeNames', typenames)
+    
+        etree.SubElement(node1, util.nspath_eval('csw:ElementSetName', namespaces)).text = esn
+
+        if any([len(constraints) > 0, cql is not None]): 
+            node2 = etree.SubElement(node1, util.nspath_eval('csw:Constraint', namespaces))
+            node2.set('version', '1.1.0')
+            flt = fes.FilterRequest()
+            if len(constraints) > 0:
+                node2.append(flt.setConstraintList(constraints))
+            # Now add a CQL filter if passed in
+            elif cql is not None:
+                etree.SubElement(node2, util.nspath_eval('csw:CqlText', namespaces)).text = cql
+            
+        if sortby is not None and isinstance(sortby, fes.SortBy):
+            node1.append(sortby.toXML())
+
+        return node0
+
     def _setconstraint(self, parent, qtype=None, propertyname='csw:AnyText', keywords=[], bbox=None, cql=None, identifier=None):
         if keywords or bbox is not None or qtype is not None or cql is not None or identifier is not None:
             node0 = etree.SubElement(parent, util.nspath_eval('csw:Constraint', namespaces))
@@ -587,25 +883,37 @@ class CatalogueServiceWeb:
                 flt = fes.FilterRequest()
                 node0.append(flt.set(qtype=qtype, keywords=keywords, propertyname=propertyname,bbox=bbox))
     
-    def _invoke(self):
-        # do HTTP request
+    def _invoke(self, parse=True):
+        caller = inspect.stack()[1][3]
+        if caller in ('getrecords2', 'count'): caller = 'getrecords'
+        self.request, self.response = self._send(self.request, caller)
+
+        if not parse:
+            return
 
-        if isinstance(self.request, basestring):  # GET KVP
-            req = Request(self.request)
+        self._exml = self._parseresponse(self.response)
+        self.exceptionreport = None
+
+    def _send(self, request, operation, stream=False):
+        # do HTTP request, returning the request as sent and the response,
+        # as a file-like object to read and close when stream is True
+
+        if isinstance(request, basestring):  # GET KVP
+            req = Request(request)
             if self.username is not None and self.password is not None:
                 base64string = base64.encodestring('%s:%s' % (self.username, self.password))[:-1]
                 req.add_header('Authorization', 'Basic %s' % base64string)
-            self.response = urlopen(req, timeout=self.timeout).read()
+            response = util.http_open(req, timeout=self.timeout, session=self.session)
+            if not stream:
+                response = response.read()
         else:
             xml_post_url = self.url
             # Get correct POST URL based on Operation list.
             # If skip_caps=True, then self.operations has not been set, so use
             # default URL.
             if hasattr(self, 'operations'):
-                caller = inspect.stack()[1][3] 
-                if caller == 'getrecords2': caller = 'getrecords'
                 try:
-                    op = self.get_operation_by_name(caller)
+                    op = self.get_operation_by_name(operation)
                     post_verbs = filter(lambda x: x.get('type').lower() == 'post', op.methods)
                     if len(post_verbs) > 1:
                         # Filter by constraints.  We must match a PostEncoding of "XML"
@@ -619,23 +927,27 @@ class CatalogueServiceWeb:
                 except:  # no such luck, just go with xml_post_url
                     pass
 
-            self.request = cleanup_namespaces(self.request)
+            request = cleanup_namespaces(request)
             # Add any namespaces used in the "typeNames" attribute of the
             # csw:Query element to the query's xml namespaces.
-            for query in self.request.findall(util.nspath_eval('csw:Query', namespaces)):
+            for query in request.findall(util.nspath_eval('csw:Query', namespaces)):
                 ns = query.get("typeNames", None)
                 if ns is not None:
                     # Pull out "gmd" from something like "gmd:MD_Metadata" from the list
                     # of typenames
                     ns_keys = [x.split(':')[0] for x in ns.split(' ')]
-                    self.request = add_namespaces(self.request, ns_keys)
+                    request = add_namespaces(request, ns_keys)
 
-            self.request = util.element_to_string(self.request, encoding='utf-8')
+            request = util.element_to_string(request, encoding='utf-8')
 
-            self.response = util.http_post(xml_post_url, self.request, self.lang, self.timeout, self.username, self.password)
+            response = util.http_post(xml_post_url, request, self.lang, self.timeout, self.username, self.password,
+                                      session=self.session, stream=stream)
 
+        return request, response
+
+    def _parseresponse(self, response):
         # parse result see if it's XML
-        self._exml = etree.parse(StringIO.StringIO(self.response))
+        exml = etree.parse(StringIO.StringIO(response))
 
         # it's XML.  Attempt to decipher whether the XML response is CSW-ish """
         valid_xpaths = [
@@ -649,24 +961,26 @@ class CatalogueServiceWeb:
             util.nspath_eval('csw:TransactionResponse', namespaces)
         ]
 
-        if self._exml.getroot().tag not in valid_xpaths:
+        if exml.getroot().tag not in valid_xpaths:
             raise RuntimeError, 'Document is XML, but not CSW-ish'
 
         # check if it's an OGC Exception
-        val = self._exml.find(util.nspath_eval('ows:Exception', namespaces))
+        val = exml.find(util.nspath_eval('ows:Exception', namespaces))
         if val is not None:
-            raise ows.ExceptionReport(self._exml, self.owscommon.namespace)
-        else:
-            self.exceptionreport = None
+            raise ows.ExceptionReport(exml, self.owscommon.namespace)
+        return exml
 
 class CswRecord(object):
-    """ Process csw:Record, csw:BriefRecord, csw:SummaryRecord """
+    """ Process csw:Record, csw:BriefRecord, csw:SummaryRecord
+
+    Fields are parsed from the record element when first accessed, and xml
+    is serialized only when asked for.
+    """
     def __init__(self, record):
 
         if hasattr(record, 'getroot'):  # standalone document
-            self.xml = etree.tostring(record.getroot())
-        else:  # part of a larger document
-            self.xml = etree.tostring(record)
+            record = record.getroot()
+        self._element = record
 
         # check to see if Dublin Core record comes from
         # rdf:RDF/rdf:Description container
@@ -676,120 +990,324 @@ class CswRecord(object):
         if rdf is not None:
             self.rdf = True
             record = rdf
+        self._record = record
 
-        # some CSWs return records with multiple identifiers based on 
-        # different schemes.  Use the first dc:identifier value to set
-        # self.identifier, and set self.identifiers as a list of dicts
-        val = record.find(util.nspath_eval('dc:identifier', namespaces))
-        self.identifier = util.testXMLValue(val)
+    def _find(self, path):
+        return util.nsfind(self._record, path, namespaces)
 
-        self.identifiers = []
-        for i in record.findall(util.nspath_eval('dc:identifier', namespaces)):
+    def _findall(self, path):
+        return util.nsfindall(self._record, path, namespaces)
+
+    @util.cached_property
+    def xml(self):
+        return etree.tostring(self._element)
+
+    # some CSWs return records with multiple identifiers based on 
+    # different schemes.  Use the first dc:identifier value to set
+    # self.identifier, and set self.identifiers as a list of dicts
+    @util.cached_property
+    def identifier(self):
+        return util.testXMLValue(self._find('dc:identifier'))
+
+    @util.cached_property
+    def identifiers(self):
+        identifiers = []
+        for i in self._findall('dc:identifier'):
             d = {}
             d['scheme'] = i.attrib.get('scheme')
             d['identifier'] = i.text
-            self.identifiers.append(d)
+            identifiers.append(d)
+        return identifiers
 
-        val = record.find(util.nspath_eval('dc:type', namespaces))
-        self.type = util.testXMLValue(val)
+    @util.cached_property
+    def type(self):
+        return util.testXMLValue(self._find('dc:type'))
 
-        val = record.find(util.nspath_eval('dc:title', namespaces))
-        self.title = util.testXMLValue(val)
+    @util.cached_property
+    def title(self):
+        return util.testXMLValue(self._find('dc:title'))
 
-        val = record.find(util.nspath_eval('dct:alternative', namespaces))
-        self.alternative = util.testXMLValue(val)
+    @util.cached_property
+    def alternative(self):
+        return util.testXMLValue(self._find('dct:alternative'))
 
-        val = record.find(util.nspath_eval('dct:isPartOf', namespaces))
-        self.ispartof = util.testXMLValue(val)
+    @util.cached_property
+    def ispartof(self):
+        return util.testXMLValue(self._find('dct:isPartOf'))
 
-        val = record.find(util.nspath_eval('dct:abstract', namespaces))
-        self.abstract = util.testXMLValue(val)
+    @util.cached_property
+    def abstract(self):
+        return util.testXMLValue(self._find('dct:abstract'))
 
-        val = record.find(util.nspath_eval('dc:date', namespaces))
-        self.date = util.testXMLValue(val)
+    @util.cached_property
+    def date(self):
+        return util.testXMLValue(self._find('dc:date'))
 
-        val = record.find(util.nspath_eval('dct:created', namespaces))
-        self.created = util.testXMLValue(val)
+    @util.cached_property
+    def created(self):
+        return util.testXMLValue(self._find('dct:created'))
 
-        val = record.find(util.nspath_eval('dct:issued', namespaces))
-        self.issued = util.testXMLValue(val)
+    @util.cached_property
+    def issued(self):
+        return util.testXMLValue(self._find('dct:issued'))
 
-        val = record.find(util.nspath_eval('dc:relation', namespaces))
-        self.relation = util.testXMLValue(val)
+    @util.cached_property
+    def relation(self):
+        return util.testXMLValue(self._find('dc:relation'))
 
-        val = record.find(util.nspath_eval('dct:temporal', namespaces))
-        self.temporal = util.testXMLValue(val)
+    @util.cached_property
+    def temporal(self):
+        return util.testXMLValue(self._find('dct:temporal'))
 
-        self.uris = []  # list of dicts
-        for i in record.findall(util.nspath_eval('dc:URI', namespaces)):
+    @util.cached_property
+    def uris(self):
+        uris = []  # list of dicts
+        for i in self._findall('dc:URI'):
             uri = {}
             uri['protocol'] = util.testXMLValue(i.attrib.get('protocol'), True)
             uri['name'] = util.testXMLValue(i.attrib.get('name'), True)
             uri['description'] = util.testXMLValue(i.attrib.get('description'), True)
             uri['url'] = util.testXMLValue(i)
 
-            self.uris.append(uri)
+            uris.append(uri)
+        return uris
 
-        self.references = []  # list of dicts
-        for i in record.findall(util.nspath_eval('dct:references', namespaces)):
+    @util.cached_property
+    def references(self):
+        references = []  # list of dicts
+        for i in self._findall('dct:references'):
             ref = {}
             ref['scheme'] = util.testXMLValue(i.attrib.get('scheme'), True)
             ref['url'] = util.testXMLValue(i)
 
-            self.references.append(ref)
+            references.append(ref)
+        return references
 
-        val = record.find(util.nspath_eval('dct:modified', namespaces))
-        self.modified = util.testXMLValue(val)
+    @util.cached_property
+    def modified(self):
+        return util.testXMLValue(self._find('dct:modified'))
 
-        val = record.find(util.nspath_eval('dc:creator', namespaces))
-        self.creator = util.testXMLValue(val)
+    @util.cached_property
+    def creator(self):
+        return util.testXMLValue(self._find('dc:creator'))
 
-        val = record.find(util.nspath_eval('dc:publisher', namespaces))
-        self.publisher = util.testXMLValue(val)
+    @util.cached_property
+    def publisher(self):
+        return util.testXMLValue(self._find('dc:publisher'))
 
-        val = record.find(util.nspath_eval('dc:coverage', namespaces))
-        self.coverage = util.testXMLValue(val)
+    @util.cached_property
+    def coverage(self):
+        return util.testXMLValue(self._find('dc:coverage'))
 
-        val = record.find(util.nspath_eval('dc:contributor', namespaces))
-        self.contributor = util.testXMLValue(val)
+    @util.cached_property
+    def contributor(self):
+        return util.testXMLValue(self._find('dc:contributor'))
 
-        val = record.find(util.nspath_eval('dc:language', namespaces))
-        self.language = util.testXMLValue(val)
+    @util.cached_property
+    def language(self):
+        return util.testXMLValue(self._find('dc:language'))
 
-        val = record.find(util.nspath_eval('dc:source', namespaces))
-        self.source = util.testXMLValue(val)
+    @util.cached_property
+    def source(self):
+        return util.testXMLValue(self._find('dc:source'))
 
-        val = record.find(util.nspath_eval('dct:rightsHolder', namespaces))
-        self.rightsholder = util.testXMLValue(val)
+    @util.cached_property
+    def rightsholder(self):
+        return util.testXMLValue(self._find('dct:rightsHolder'))
 
-        val = record.find(util.nspath_eval('dct:accessRights', namespaces))
-        self.accessrights = util.testXMLValue(val)
+    @util.cached_property
+    def accessrights(self):
+        return util.testXMLValue(self._find('dct:accessRights'))
 
-        val = record.find(util.nspath_eval('dct:license', namespaces))
-        self.license = util.testXMLValue(val)
+    @util.cached_property
+    def license(self):
+        return util.testXMLValue(self._find('dct:license'))
 
-        val = record.find(util.nspath_eval('dc:format', namespaces))
-        self.format = util.testXMLValue(val)
+    @util.cached_property
+    def format(self):
+        return util.testXMLValue(self._find('dc:format'))
 
-        self.subjects = []
-        for i in record.findall(util.nspath_eval('dc:subject', namespaces)):
-            self.subjects.append(util.testXMLValue(i))
+    @util.cached_property
+    def subjects(self):
+        return [util.testXMLValue(i) for i in self._findall('dc:subject')]
 
-        self.rights = []
-        for i in record.findall(util.nspath_eval('dc:rights', namespaces)):
-            self.rights.append(util.testXMLValue(i))
+    @util.cached_property
+    def rights(self):
+        return [util.testXMLValue(i) for i in self._findall('dc:rights')]
 
-        val = record.find(util.nspath_eval('dct:spatial', namespaces))
-        self.spatial = util.testXMLValue(val)
+    @util.cached_property
+    def spatial(self):
+        return util.testXMLValue(self._find('dct:spatial'))
 
-        val = record.find(util.nspath_eval('ows:BoundingBox', namespaces))
+    @util.cached_property
+    def bbox(self):
+        val = self._find('ows:BoundingBox')
         if val is not None:
-            self.bbox = ows.BoundingBox(val, namespaces['ows'])
-        else:
-            self.bbox = None
+            return ows.BoundingBox(val, namespaces['ows'])
+        return None
 
-        val = record.find(util.nspath_eval('ows:WGS84BoundingBox', namespaces))
+    @util.cached_property
+    def bbox_wgs84(self):
+        val = self._find('ows:WGS84BoundingBox')
         if val is not None:
-            self.bbox_wgs84 = ows.WGS84BoundingBox(val, namespaces['ows'])
-        else:
-            self.bbox_wgs84 = None
+            return ows.WGS84BoundingBox(val, namespaces['ows'])
+        return None
+
+
+class HarvestState(object):
+    """
+
+    Persistent state of incremental harvests, in a SQLite database: the
+    watermark (latest modification date seen) of each harvest, and the
+    modification date of each record harvested, to tell added records from
+    changed ones.
+
+    Parameters
+    ----------
+
+    - path: the database file, created if missing
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._db = sqlite3.connect(path, timeout=30)
+        self._db.text_factory = str
+        with self._db:
+            self._db.execute('CREATE TABLE IF NOT EXISTS watermarks '
+                             '(harvest TEXT PRIMARY KEY, watermark TEXT)')
+            self._db.execute('CREATE TABLE IF NOT EXISTS records (harvest TEXT, '
+                             'identifier TEXT, modified TEXT, PRIMARY KEY (harvest, identifier))')
+
+    def watermark(self, harvest):
+        """Return the watermark of a harvest, None before its first run"""
+        row = self._db.execute('SELECT watermark FROM watermarks WHERE harvest = ?',
+                               (harvest,)).fetchone()
+        return row[0] if row is not None else None
+
+    def setwatermark(self, harvest, watermark):
+        with self._db:
+            self._db.execute('INSERT OR REPLACE INTO watermarks VALUES (?, ?)', (harvest, watermark))
+
+    def modified(self, harvest, identifier):
+        """Return a pair (seen, modification date) of a record of a harvest"""
+        row = self._db.execute('SELECT modified FROM records WHERE harvest = ? AND identifier = ?',
+                               (harvest, identifier)).fetchone()
+        return (row is not None, row[0] if row is not None else None)
+
+    def setmodified(self, harvest, identifier, modified):
+        # committed by commit(), a page of records at a time
+        self._db.execute('INSERT OR REPLACE INTO records VALUES (?, ?, ?)',
+                         (harvest, identifier, modified))
+
+    def commit(self):
+        self._db.commit()
+
+    def reset(self, harvest):
+        """Forget a harvest, so that its next run fetches all records"""
+        with self._db:
+            self._db.execute('DELETE FROM watermarks WHERE harvest = ?', (harvest,))
+            self._db.execute('DELETE FROM records WHERE harvest = ?', (harvest,))
+
+    def close(self):
+        """Close the database"""
+        self._db.close()
+
+
+class IncrementalHarvest(object):
+    """
+
+    Iterate over the records of a catalogue added or changed since the
+    previous run of the same harvest.
+
+    The first run yields all records.  Later runs only query the records
+    modified at or after the watermark, the latest modification date
+    (dct:modified, or gmd:dateStamp for ISO records) seen by the previous
+    run; records already harvested with the same date are skipped.  The
+    watermark only moves once a run has been iterated to its end, so an
+    interrupted run is caught up by the next one.  Dates are compared as
+    ISO 8601 strings.
+
+    After iteration, added, changed and skipped hold the counts of the run
+    and watermark the new watermark.
+
+    Parameters
+    ----------
+
+    - csw: the CatalogueServiceWeb
+    - state: the HarvestState
+    - name: the name of the harvest in state (default is the URL of the
+      catalogue, typenames and outputschema)
+    - constraints: the list of constraints selecting records, as for getrecords2
+    - typenames, esn, outputschema, pagesize, max_workers: as for
+      CatalogueServiceWeb.iterrecords.  Only the Dublin Core and ISO output
+      schemas are supported
+    - queryable: the modification date queryable (default is dct:modified,
+      apiso:Modified with the ISO output schema)
+
+    """
+
+    def __init__(self, csw, state, name=None, constraints=[], typenames='csw:Record', esn='full',
+                 outputschema=namespaces['csw'], queryable=None, pagesize=100, max_workers=1):
+        if outputschema not in (namespaces['csw'], namespaces['gmd']):
+            raise ValueError('Incremental harvests support Dublin Core and ISO records only')
+        self.csw = csw
+        self.state = state
+        self.name = name or ' '.join((csw.url, typenames, outputschema))
+        self.constraints = constraints
+        self.typenames = typenames
+        self.esn = esn
+        self.outputschema = outputschema
+        if queryable is None:
+            queryable = 'apiso:Modified' if outputschema == namespaces['gmd'] else 'dct:modified'
+        self.queryable = queryable
+        self.pagesize = pagesize
+        self.max_workers = max_workers
+        self.watermark = state.watermark(self.name)
+        self.added = self.changed = self.skipped = 0
+
+    def _stamp(self, record):
+        if self.outputschema == namespaces['gmd']:
+            return record.identifier, record.datestamp
+        return record.identifier, record.modified
+
+    def __iter__(self):
+        constraints = self.constraints
+        if self.watermark is not None:
+            since = fes.PropertyIsGreaterThanOrEqualTo(self.queryable, self.watermark)
+            # a nested list is the And of its constraints, as for getrecords2
+            constraints = [fes.And(c) if isinstance(c, list) else c for c in constraints]
+            if not constraints:
+                constraints = [since]
+            elif len(constraints) == 1:
+                constraints = [[constraints[0], since]]
+            else:
+                constraints = [[fes.Or(constraints), since]]
+
+        watermark = self.watermark
+        self.added = self.changed = self.skipped = 0
+        records = self.csw.iterrecords(constraints, typenames=self.typenames, esn=self.esn,
+                                       outputschema=self.outputschema, pagesize=self.pagesize,
+                                       max_workers=self.max_workers)
+        try:
+            for count, record in enumerate(records):
+                identifier, modified = self._stamp(record)
+                if modified is not None and (watermark is None or modified > watermark):
+                    watermark = modified
+                seen, previous = self.state.modified(self.name, identifier)
+                if seen and previous == modified:
+                    self.skipped += 1
+                    continue
+                if seen:
+                    self.changed += 1
+                else:
+                    self.added += 1
+                self.state.setmodified(self.name, identifier, modified)
+                if count % self.pagesize == 0:
+                    self.state.commit()
+                yield record
+        finally:
+            self.state.commit()
+        if watermark is not None:
+            self.state.setwatermark(self.name, watermark)
+        self.watermark = watermark
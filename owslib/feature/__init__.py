@@ -6,14 +6,27 @@
 # =============================================================================
 
 from owslib.crs import Crs
+from owslib.feature.gml import iterfeatures
 
 from urllib import urlencode
 import logging
-from owslib.util import log
+from owslib.util import log, concurrent_map, reraise
 
 class WebFeatureService_:
     """Base class for WebFeatureService implementations"""
 
+    def iterfeatures(self, *args, **kwargs):
+        """Request features as for getfeature, and iterate over them one at a
+        time as owslib.feature.gml.Feature records, in constant memory"""
+        return iterfeatures(self.getfeature(*args, **kwargs))
+
+    def extractfeatures(self, typename, bbox, grid=(2, 2), limit=None, max_depth=6,
+                        max_workers=4, **kwargs):
+        """Extract the features of a bounding box with concurrent GetFeature
+        requests over partitions of it; see owslib.feature.extractfeatures"""
+        return extractfeatures(self, typename, bbox, grid, limit, max_depth,
+                               max_workers, **kwargs)
+
     def getBBOXKVP (self,bbox,typename):
         """Formate bounding box for KVP request type (HTTP GET)
 
@@ -136,3 +149,73 @@ class WebFeatureService_:
         data = urlencode(request)
 
         return base_url+data
+
+
+def _partition(bbox, columns, rows):
+    """Split bbox (minx, miny, maxx, maxy[, srs]) into a grid of columns x rows bboxes"""
+    minx, miny, maxx, maxy = [float(v) for v in bbox[:4]]
+    xs = [minx + (maxx - minx) * i / columns for i in range(columns)] + [maxx]
+    ys = [miny + (maxy - miny) * j / rows for j in range(rows)] + [maxy]
+    return [(xs[i], ys[j], xs[i + 1], ys[j + 1]) + tuple(bbox[4:])
+            for j in range(rows) for i in range(columns)]
+
+
+def extractfeatures(wfs, typename, bbox, grid=(2, 2), limit=None, max_depth=6,
+                    max_workers=4, **kwargs):
+    """
+    Extract the features of a bounding box from a WFS, with concurrent
+    GetFeature requests over partitions of the box.
+
+    Yields owslib.feature.gml.Feature records as partitions complete.
+    Features of several partitions (straddling their borders) are yielded
+    once, by feature id; features without id straddling borders may be
+    yielded more than once.
+
+    Parameters
+    ----------
+
+    - wfs: a WebFeatureService (any version)
+    - typename: the feature type name
+    - bbox: (minx, miny, maxx, maxy[, srs]), as for getfeature
+    - grid: (columns, rows) of the initial partitions
+    - limit: maximum number of features the server returns for a request,
+      by default the CountDefault constraint of WFS 2.0 servers.  Partitions
+      holding limit features are split in four (quadtree) and requested
+      again, at most max_depth times; without a limit partitions are not
+      split
+    - max_workers: number of concurrent requests
+    - kwargs: other arguments of getfeature, e.g. propertyname or srsname
+
+    """
+    if limit is None:
+        countdefault = getattr(wfs, 'constraints', {}).get('CountDefault')
+        if countdefault and countdefault.isdigit():
+            limit = int(countdefault)
+
+    def fetch(box):
+        return list(iterfeatures(wfs.getfeature(typename=[typename], bbox=box,
+                                                maxfeatures=limit, **kwargs)))
+
+    seen = set()
+    partitions = _partition(bbox, *grid)
+    depth = 0
+    while partitions:
+        full = []
+        for box, features, error in concurrent_map(fetch, partitions, max_workers):
+            if error is not None:
+                reraise(error)
+            if limit is not None and len(features) >= limit:
+                if depth < max_depth:
+                    # its features are yielded from its parts
+                    full.append(box)
+                    continue
+                log.warning('Partition %s of %s holds %d features or more, '
+                            'some features may be missing' % (box, typename, limit))
+            for feature in features:
+                if feature.id is not None:
+                    if feature.id in seen:
+                        continue
+                    seen.add(feature.id)
+                yield feature
+        partitions = [part for box in full for part in _partition(box, 2, 2)]
+        depth += 1
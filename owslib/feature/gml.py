@@ -0,0 +1,248 @@
+# -*- coding: ISO-8859-15 -*-
+
+"""
+Streaming reader of GML feature collections, such as the responses of WFS
+GetFeature requests.
+
+The collection is parsed incrementally and each feature is dropped from the
+tree once read, so collections of any size are read in constant memory.
+Features of WFS 1.0 (GML 2), WFS 1.1 (GML 3.1) and WFS 2.0 (GML 3.2)
+responses are supported.
+"""
+
+from owslib.etree import etree
+from owslib.util import xmltag_split, ServiceException
+
+_GML_NAMESPACES = ('http://www.opengis.net/gml', 'http://www.opengis.net/gml/3.2')
+
+# elements holding the features of a collection
+_MEMBER_NAMES = ('featureMember', 'featureMembers', 'member')
+# collections nested in members (WFS 2.0 joins and multiple queries)
+_COLLECTION_NAMES = ('FeatureCollection', 'SimpleFeatureCollection')
+_EXCEPTION_NAMES = ('ExceptionReport', 'ServiceExceptionReport')
+
+_MULTI_TYPES = {
+    'MultiPoint': 'MultiPoint',
+    'MultiLineString': 'MultiLineString',
+    'MultiCurve': 'MultiLineString',
+    'MultiPolygon': 'MultiPolygon',
+    'MultiSurface': 'MultiPolygon',
+    'MultiGeometry': 'GeometryCollection',
+}
+_LINE_NAMES = ('LineString', 'LinearRing', 'Curve', 'Ring')
+_POLYGON_NAMES = ('Polygon', 'Surface', 'PolygonPatch')
+# the GML elements read by parse_geometry; other GML values (temporal ones,
+# solids...) are read as complex properties
+_GEOMETRY_NAMES = ('Point', 'Envelope', 'Box') + _LINE_NAMES + _POLYGON_NAMES + tuple(_MULTI_TYPES)
+
+
+class Feature(object):
+    """
+    A feature read from a GML feature collection.
+
+    - id: the gml:id (or fid) of the feature
+    - type: the name of the feature type, without namespace
+    - geometry: the first geometry of the feature, as a GeoJSON-like dict
+    - properties: the properties of the feature, by name; simple values are
+      strings, geometries dicts as above and complex values dicts of their
+      properties.  Repeated properties are lists.
+
+    Coordinates are kept in the axis order of the document.
+    """
+    __slots__ = ('id', 'type', 'geometry', 'properties')
+
+    def __init__(self, id, type, geometry=None, properties=None):
+        self.id = id
+        self.type = type
+        self.geometry = geometry
+        self.properties = properties or {}
+
+    def __repr__(self):
+        return '<Feature %s: %s>' % (self.type, self.id)
+
+
+def _namespace(tag):
+    return tag[1:].split('}')[0] if tag.startswith('{') else None
+
+
+def _is_gml(elem):
+    return _namespace(elem.tag) in _GML_NAMESPACES
+
+
+def _dimension(elem, default):
+    return int(elem.get('srsDimension') or elem.get('dimension') or default)
+
+
+def _coordinates(elem, dimension):
+    """Return the coordinates held by elem and its descendants, in document order"""
+    coords = []
+    for e in elem.iter():
+        if not isinstance(e.tag, basestring) or not _is_gml(e):
+            continue
+        name = xmltag_split(e.tag)
+        if name in ('pos', 'posList', 'coordinates') and not (e.text and e.text.strip()):
+            # an empty geometry
+            continue
+        if name == 'pos':
+            coords.append(tuple(float(v) for v in e.text.split()))
+        elif name == 'posList':
+            values = [float(v) for v in e.text.split()]
+            n = _dimension(e, dimension)
+            coords.extend(tuple(values[i:i + n]) for i in range(0, len(values), n))
+        elif name == 'coordinates':
+            cs, ts = e.get('cs', ','), e.get('ts', ' ')
+            decimal = e.get('decimal', '.')
+            tuples = e.text.split() if ts.isspace() else e.text.strip().split(ts)
+            for t in tuples:
+                if decimal != '.':
+                    t = t.replace(decimal, '.')
+                coords.append(tuple(float(v) for v in t.split(cs)))
+        elif name == 'coord':
+            coords.append(tuple(float(c.text) for c in e if isinstance(c.tag, basestring)))
+    return coords
+
+
+def _rings(elem, dimension):
+    return [_coordinates(ring, dimension) for ring in elem.iter()
+            if isinstance(ring.tag, basestring) and xmltag_split(ring.tag) in ('LinearRing', 'Ring')]
+
+
+def parse_geometry(elem, dimension=2):
+    """Return a GML geometry element as a GeoJSON-like dict"""
+    name = xmltag_split(elem.tag)
+    dimension = _dimension(elem, dimension)
+    if name == 'Point':
+        coords = _coordinates(elem, dimension)
+        geometry = {'type': 'Point', 'coordinates': coords[0] if coords else None}
+    elif name in _LINE_NAMES:
+        geometry = {'type': 'LineString', 'coordinates': _coordinates(elem, dimension)}
+    elif name in _POLYGON_NAMES:
+        geometry = {'type': 'Polygon', 'coordinates': _rings(elem, dimension)}
+    elif name in ('Envelope', 'Box'):
+        geometry = {'type': 'Envelope', 'coordinates': _coordinates(elem, dimension)}
+    elif name in _MULTI_TYPES:
+        members = []
+        for member in elem:
+            if not isinstance(member.tag, basestring):
+                continue
+            members.extend(parse_geometry(g, dimension) for g in member
+                           if isinstance(g.tag, basestring) and _is_gml(g))
+        geometry = {'type': _MULTI_TYPES[name]}
+        if geometry['type'] == 'GeometryCollection':
+            geometry['geometries'] = members
+        else:
+            geometry['coordinates'] = [g['coordinates'] for g in members]
+    else:
+        raise ValueError('Unsupported GML geometry %s' % name)
+    if elem.get('srsName'):
+        geometry['crs'] = elem.get('srsName')
+    return geometry
+
+
+def _properties(elem):
+    """Return the properties of a feature (or complex value) and its first geometry"""
+    properties = {}
+    geometry = None
+    for child in elem:
+        if not isinstance(child.tag, basestring):
+            continue
+        name = xmltag_split(child.tag)
+        if _is_gml(child) and name == 'boundedBy':
+            continue
+        values = [c for c in child if isinstance(c.tag, basestring)]
+        value = None
+        if values and _is_gml(values[0]) and xmltag_split(values[0].tag) in _GEOMETRY_NAMES:
+            try:
+                value = parse_geometry(values[0])
+            except ValueError:
+                # e.g. a multi geometry of unsupported members
+                pass
+            else:
+                # the feature geometry is the first non-empty one
+                if geometry is None and (value.get('coordinates') or value.get('geometries')):
+                    geometry = value
+        if value is None and values:
+            value = _properties(child)[0]
+        elif value is None:
+            value = child.text.strip() if child.text and child.text.strip() else None
+        if name in properties:
+            if not isinstance(properties[name], list):
+                properties[name] = [properties[name]]
+            properties[name].append(value)
+        else:
+            properties[name] = value
+    return properties, geometry
+
+
+def parse_feature(elem):
+    """Return the Feature of a GML feature element"""
+    fid = elem.get('fid')
+    for ns in _GML_NAMESPACES:
+        fid = elem.get('{%s}id' % ns, fid)
+    properties, geometry = _properties(elem)
+    return Feature(fid, xmltag_split(elem.tag), geometry, properties)
+
+
+def iterfeatures(source):
+    """
+    Iterate over the features of a GML feature collection, yielding one
+    Feature at a time.
+
+    source is a file name or a file-like object, for instance the response
+    of a WFS GetFeature request.  Raises ServiceException when source is an
+    OGC exception report.
+    """
+    stack = []
+    depth = None  # depth of the feature being read
+    exception = False
+    for event, elem in etree.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            stack.append(elem)
+            n = len(stack)
+            if n == 1:
+                exception = xmltag_split(elem.tag) in _EXCEPTION_NAMES
+            elif depth is None and n >= 3 and \
+                    xmltag_split(stack[-2].tag) in _MEMBER_NAMES and \
+                    (n == 3 or xmltag_split(stack[-3].tag) in _COLLECTION_NAMES) and \
+                    xmltag_split(elem.tag) not in _COLLECTION_NAMES:
+                depth = n
+            continue
+
+        n = len(stack)
+        stack.pop()
+        if n == 1:
+            if exception:
+                message = ' '.join(t.strip() for t in elem.itertext() if t.strip())
+                raise ServiceException(message)
+            break
+        if depth == n:
+            feature = parse_feature(elem)
+            stack[-1].remove(elem)
+            depth = None
+            yield feature
+        elif depth is None and not exception:
+            # members, nested collections and the like, already read
+            stack[-1].remove(elem)
+
+
+def numbermatched(source):
+    """
+    Return the number of features matched by the query of a GML feature
+    collection: the numberMatched (WFS 2.0) or numberOfFeatures (WFS 1.1)
+    attribute of its root element, None when the number is unknown.
+
+    Only the start of the root element is parsed, which makes this cheap for
+    resultType=hits responses and full collections alike.  Raises
+    ServiceException when source is an OGC exception report.
+    """
+    context = etree.iterparse(source, events=('start',))
+    event, root = next(context)
+    if xmltag_split(root.tag) in _EXCEPTION_NAMES:
+        for event, elem in context:
+            pass
+        raise ServiceException(' '.join(t.strip() for t in root.itertext() if t.strip()))
+    for name in ('numberMatched', 'numberOfFeatures'):
+        value = root.get(name, '')
+        if value.isdigit():
+            return int(value)
+    return None
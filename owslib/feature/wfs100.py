@@ -10,11 +10,14 @@ import cgi
 from cStringIO import StringIO
 from urllib import urlencode
 from urllib2 import urlopen
-from owslib.util import openURL, testXMLValue, extract_xml_list, ServiceException, xmltag_split
+from owslib.util import openURL, http_open, testXMLValue, extract_xml_list, ServiceException, xmltag_split, \
+    fetch_remote_metadata, parse_metadata_url
 from owslib.etree import etree
 from owslib.fgdc import Metadata
 from owslib.iso import MD_Metadata
 from owslib.crs import Crs
+from owslib.feature import extractfeatures
+from owslib.feature.gml import iterfeatures
 from owslib.namespaces import Namespaces
 from owslib.util import log
 
@@ -49,7 +52,7 @@ class WebFeatureService_1_0_0(object):
 
     Implements IWebFeatureService.
     """
-    def __new__(self,url, version, xml, parse_remote_metadata=False):
+    def __new__(self,url, version, xml, parse_remote_metadata=False, session=None, cache=None):
         """ overridden __new__ method 
         
         @type url: string
@@ -58,10 +61,14 @@ class WebFeatureService_1_0_0(object):
         @param xml: elementtree object
         @type parse_remote_metadata: boolean
         @param parse_remote_metadata: whether to fully process MetadataURL elements
+        @type session: owslib.util.Session
+        @param session: optional pooled HTTP transport shared between requests
+        @type cache: owslib.cache.CapabilitiesCache
+        @param cache: optional on-disk cache of the GetCapabilities document
         @return: initialized WebFeatureService_1_0_0 object
         """
         obj=object.__new__(self)
-        obj.__init__(url, version, xml, parse_remote_metadata)
+        obj.__init__(url, version, xml, parse_remote_metadata, session, cache)
         return obj
     
     def __getitem__(self,name):
@@ -72,12 +79,14 @@ class WebFeatureService_1_0_0(object):
             raise KeyError, "No content named %s" % name
     
     
-    def __init__(self, url, version, xml=None, parse_remote_metadata=False):
+    def __init__(self, url, version, xml=None, parse_remote_metadata=False, session=None, cache=None):
         """Initialize."""
         self.url = url
+        self.session = session
+        self.cache = cache
         self.version = version
         self._capabilities = None
-        reader = WFSCapabilitiesReader(self.version)
+        reader = WFSCapabilitiesReader(self.version, session=self.session, cache=self.cache)
         if xml:
             self._capabilities = reader.readString(xml)
         else:
@@ -106,8 +115,10 @@ class WebFeatureService_1_0_0(object):
         featuretypelist=self._capabilities.find(nspath('FeatureTypeList'))
         features = self._capabilities.findall(nspath('FeatureTypeList/FeatureType'))
         for feature in features:
-            cm=ContentMetadata(feature, featuretypelist, parse_remote_metadata)
+            cm=ContentMetadata(feature, featuretypelist)
             self.contents[cm.id]=cm       
+        if parse_remote_metadata:
+            self.fetch_remote_metadata()
         
         #exceptions
         self.exceptions = [f.text for f \
@@ -117,8 +128,8 @@ class WebFeatureService_1_0_0(object):
         """Request and return capabilities document from the WFS as a 
         file-like object.
         NOTE: this is effectively redundant now"""
-        reader = WFSCapabilitiesReader(self.version)
-        return urlopen(reader.capabilities_url(self.url), timeout=timeout)
+        reader = WFSCapabilitiesReader(self.version, session=self.session)
+        return http_open(reader.capabilities_url(self.url), timeout=timeout, session=self.session)
     
     def items(self):
         '''supports dict-like items() access'''
@@ -126,6 +137,13 @@ class WebFeatureService_1_0_0(object):
         for item in self.contents:
             items.append((item,self.contents[item]))
         return items
+
+    def fetch_remote_metadata(self, timeout=30, max_workers=10, callback=None):
+        """Download and parse the MetadataURL documents of all feature types,
+        from a pool of max_workers threads; see util.fetch_remote_metadata.
+        Returns the metrics of the download."""
+        return fetch_remote_metadata(self.contents.values(), _parse_remote_metadata,
+                                     timeout, max_workers, self.session, callback)
     
     def getfeature(self, typename=None, filter=None, bbox=None, featureid=None,
                    featureversion=None, propertyname=['*'], maxfeatures=None,
@@ -192,7 +210,7 @@ class WebFeatureService_1_0_0(object):
 
         data = urlencode(request)
         log.debug("Making request: %s?%s" % (base_url, data))
-        u = openURL(base_url, data, method)
+        u = openURL(base_url, data, method, session=self.session)
         
         
         # check for service exceptions, rewrap, and return
@@ -227,6 +245,18 @@ class WebFeatureService_1_0_0(object):
                 return StringIO(data)
             return u
 
+    def iterfeatures(self, *args, **kwargs):
+        """Request features as for getfeature, and iterate over them one at a
+        time as owslib.feature.gml.Feature records, in constant memory"""
+        return iterfeatures(self.getfeature(*args, **kwargs))
+
+    def extractfeatures(self, typename, bbox, grid=(2, 2), limit=None, max_depth=6,
+                        max_workers=4, **kwargs):
+        """Extract the features of a bounding box with concurrent GetFeature
+        requests over partitions of it; see owslib.feature.extractfeatures"""
+        return extractfeatures(self, typename, bbox, grid, limit, max_depth,
+                               max_workers, **kwargs)
+
     def getOperationByName(self, name):
         """Return a named content item."""
         for item in self.operations:
@@ -255,13 +285,20 @@ class ServiceProvider(object):
         self.url = testXMLValue(self._root.find(nspath('OnlineResource')))
         self.keywords = extract_xml_list(self._root.find(nspath('Keywords')))
 
+# parsers of the MetadataURL documents, by MetadataURL type
+_METADATA_PARSERS = ((('FGDC',), Metadata), (('TC211',), MD_Metadata))
+
+def _parse_remote_metadata(metadataUrl, doc):
+    parse_metadata_url(metadataUrl, doc, _METADATA_PARSERS)
+
+
 class ContentMetadata:
     """Abstraction for WFS metadata.
     
     Implements IMetadata.
     """
 
-    def __init__(self, elem, parent, parse_remote_metadata=False, timeout=30):
+    def __init__(self, elem, parent, parse_remote_metadata=False, timeout=30, session=None):
         """."""
         self.id = testXMLValue(elem.find(nspath('Name')))
         self.title = testXMLValue(elem.find(nspath('Title')))
@@ -308,13 +345,9 @@ class ContentMetadata:
 
             if metadataUrl['url'] is not None and parse_remote_metadata:  # download URL
                 try:
-                    content = urlopen(metadataUrl['url'], timeout=timeout)
+                    content = http_open(metadataUrl['url'], timeout=timeout, session=session)
                     doc = etree.parse(content)
-                    if metadataUrl['type'] is not None:
-                        if metadataUrl['type'] == 'FGDC':
-                            metadataUrl['metadata'] = Metadata(doc)
-                        if metadataUrl['type'] == 'TC211':
-                            metadataUrl['metadata'] = MD_Metadata(doc)
+                    _parse_remote_metadata(metadataUrl, doc)
                 except Exception, err:
                     metadataUrl['metadata'] = None
 
@@ -341,10 +374,12 @@ class WFSCapabilitiesReader(object):
     """Read and parse capabilities document into a lxml.etree infoset
     """
 
-    def __init__(self, version='1.0'):
+    def __init__(self, version='1.0', session=None, cache=None):
         """Initialize"""
         self.version = version
         self._infoset = None
+        self.session = session
+        self.cache = cache
 
     def capabilities_url(self, service_url):
         """Return a capabilities url
@@ -377,7 +412,9 @@ class WFSCapabilitiesReader(object):
             A timeout value (in seconds) for the request.
         """
         request = self.capabilities_url(url)
-        u = urlopen(request, timeout=timeout)
+        if self.cache is not None:
+            return etree.fromstring(self.cache.read(request, timeout=timeout, session=self.session))
+        u = http_open(request, timeout=timeout, session=self.session)
         return etree.fromstring(u.read())
 
     def readString(self, st):
@@ -11,7 +11,8 @@ import cgi
 from cStringIO import StringIO
 from urllib import urlencode
 from urllib2 import urlopen
-from owslib.util import openURL, testXMLValue, nspath_eval, ServiceException
+from owslib.util import openURL, http_open, testXMLValue, nspath_eval, ServiceException, fetch_remote_metadata, \
+    parse_metadata_url
 from owslib.etree import etree
 from owslib.fgdc import Metadata
 from owslib.iso import MD_Metadata
@@ -19,6 +20,7 @@ from owslib.ows import *
 from owslib.fes import *
 from owslib.crs import Crs
 from owslib.feature import WebFeatureService_
+from owslib.feature.gml import numbermatched
 from owslib.namespaces import Namespaces
 from owslib.util import log
 
@@ -32,7 +34,7 @@ class WebFeatureService_1_1_0(WebFeatureService_):
 
     Implements IWebFeatureService.
     """
-    def __new__(self,url, version, xml, parse_remote_metadata=False):
+    def __new__(self,url, version, xml, parse_remote_metadata=False, session=None, cache=None):
         """ overridden __new__ method
 
         @type url: string
@@ -41,10 +43,14 @@ class WebFeatureService_1_1_0(WebFeatureService_):
         @param xml: elementtree object
         @type parse_remote_metadata: boolean
         @param parse_remote_metadata: whether to fully process MetadataURL elements
+        @type session: owslib.util.Session
+        @param session: optional pooled HTTP transport shared between requests
+        @type cache: owslib.cache.CapabilitiesCache
+        @param cache: optional on-disk cache of the GetCapabilities document
         @return: initialized WebFeatureService_1_1_0 object
         """
         obj=object.__new__(self)
-        obj.__init__(url, version, xml, parse_remote_metadata)
+        obj.__init__(url, version, xml, parse_remote_metadata, session, cache)
         return obj
 
     def __getitem__(self,name):
@@ -55,13 +61,15 @@ class WebFeatureService_1_1_0(WebFeatureService_):
             raise KeyError, "No content named %s" % name
 
 
-    def __init__(self, url, version, xml=None, parse_remote_metadata=False):
+    def __init__(self, url, version, xml=None, parse_remote_metadata=False, session=None, cache=None):
         """Initialize."""
         self.url = url
+        self.session = session
+        self.cache = cache
         self.version = version
         self._capabilities = None
         self.owscommon = OwsCommon('1.0.0')
-        reader = WFSCapabilitiesReader(self.version)
+        reader = WFSCapabilitiesReader(self.version, session=self.session, cache=self.cache)
         if xml:
             self._capabilities = reader.readString(xml)
         else:
@@ -92,8 +100,10 @@ class WebFeatureService_1_1_0(WebFeatureService_):
         self.contents={}
         features = self._capabilities.findall(nspath_eval('wfs:FeatureTypeList/wfs:FeatureType', namespaces))
         for feature in features:
-            cm=ContentMetadata(feature, parse_remote_metadata)
+            cm=ContentMetadata(feature)
             self.contents[cm.id]=cm
+        if parse_remote_metadata:
+            self.fetch_remote_metadata()
 
         #exceptions
         self.exceptions = [f.text for f \
@@ -103,8 +113,8 @@ class WebFeatureService_1_1_0(WebFeatureService_):
         """Request and return capabilities document from the WFS as a
         file-like object.
         NOTE: this is effectively redundant now"""
-        reader = WFSCapabilitiesReader(self.version)
-        return urlopen(reader.capabilities_url(self.url), timeout=timeout)
+        reader = WFSCapabilitiesReader(self.version, session=self.session)
+        return http_open(reader.capabilities_url(self.url), timeout=timeout, session=self.session)
 
     def items(self):
         '''supports dict-like items() access'''
@@ -113,6 +123,13 @@ class WebFeatureService_1_1_0(WebFeatureService_):
             items.append((item,self.contents[item]))
         return items
 
+    def fetch_remote_metadata(self, timeout=30, max_workers=10, callback=None):
+        """Download and parse the MetadataURL documents of all feature types,
+        from a pool of max_workers threads; see util.fetch_remote_metadata.
+        Returns the metrics of the download."""
+        return fetch_remote_metadata(self.contents.values(), _parse_remote_metadata,
+                                     timeout, max_workers, self.session, callback)
+
     def getfeature(self, typename=None, filter=None, bbox=None, featureid=None,
                    featureversion=None, propertyname=['*'], maxfeatures=None,
                    srsname=None, outputFormat=None, method='Get'):
@@ -148,6 +165,47 @@ class WebFeatureService_1_1_0(WebFeatureService_):
         2) typename and filter (more expressive)
         3) featureid (direct access to known features)
         """
+        base_url, request = self._getfeaturerequest(typename, filter, bbox, featureid,
+                                                    featureversion, propertyname, maxfeatures,
+                                                    srsname, outputFormat, method)
+        data = urlencode(request)
+        log.debug("Making request: %s?%s" % (base_url, data))
+        u = openURL(base_url, data, method, session=self.session)
+
+        # check for service exceptions, rewrap, and return
+        # We're going to assume that anything with a content-length > 32k
+        # is data. We'll check anything smaller.
+        try:
+            length = int(u.info()['Content-Length'])
+            have_read = False
+        except (KeyError, AttributeError):
+            data = u.read()
+            have_read = True
+            length = len(data)
+
+        if length < 32000:
+            if not have_read:
+                data = u.read()
+
+            try:
+                tree = etree.fromstring(data)
+            except BaseException:
+                # Not XML
+                return StringIO(data)
+            else:
+                if tree.tag == "{%s}ServiceExceptionReport" % namespaces["ogc"]:
+                    se = tree.find(nspath_eval('ServiceException', namespaces["ogc"]))
+                    raise ServiceException(str(se.text).strip())
+                else:
+                    return StringIO(data)
+        else:
+            if have_read:
+                return StringIO(data)
+            return u
+
+    def _getfeaturerequest(self, typename, filter, bbox, featureid, featureversion,
+                           propertyname, maxfeatures, srsname, outputFormat, method):
+        """Return the base URL and KVP parameters of a GetFeature request"""
         try:
             base_url = next((m.get('url') for m in self.getOperationByName('GetFeature').methods if m.get('type').lower() == method.lower()))
         except StopIteration:
@@ -196,41 +254,24 @@ class WebFeatureService_1_1_0(WebFeatureService_):
             request['maxfeatures'] = str(maxfeatures)
         if outputFormat is not None:
             request["outputFormat"] = outputFormat
+        return base_url, request
+
+    def count(self, typename=None, filter=None, bbox=None, featureid=None,
+              featureversion=None, srsname=None, method='Get'):
+        """Return the number of features matching a GetFeature query, without
+        downloading them: a resultType=hits request is made and only the
+        numberOfFeatures attribute of the response is parsed.  Returns None
+        when the server does not report the number.
 
+        Parameters are as for getfeature.
+        """
+        base_url, request = self._getfeaturerequest(typename, filter, bbox, featureid,
+                                                    featureversion, None, None, srsname,
+                                                    None, method)
+        request['resultType'] = 'hits'
         data = urlencode(request)
         log.debug("Making request: %s?%s" % (base_url, data))
-        u = openURL(base_url, data, method)
-
-        # check for service exceptions, rewrap, and return
-        # We're going to assume that anything with a content-length > 32k
-        # is data. We'll check anything smaller.
-        try:
-            length = int(u.info()['Content-Length'])
-            have_read = False
-        except (KeyError, AttributeError):
-            data = u.read()
-            have_read = True
-            length = len(data)
-
-        if length < 32000:
-            if not have_read:
-                data = u.read()
-
-            try:
-                tree = etree.fromstring(data)
-            except BaseException:
-                # Not XML
-                return StringIO(data)
-            else:
-                if tree.tag == "{%s}ServiceExceptionReport" % namespaces["ogc"]:
-                    se = tree.find(nspath_eval('ServiceException', namespaces["ogc"]))
-                    raise ServiceException(str(se.text).strip())
-                else:
-                    return StringIO(data)
-        else:
-            if have_read:
-                return StringIO(data)
-            return u
+        return numbermatched(openURL(base_url, data, method, session=self.session))
 
     def getOperationByName(self, name):
         """Return a named content item."""
@@ -241,13 +282,20 @@ class WebFeatureService_1_1_0(WebFeatureService_):
 
 
 
+# parsers of the MetadataURL documents, by MetadataURL type
+_METADATA_PARSERS = ((('FGDC',), Metadata), (('TC211', '19115', '19139'), MD_Metadata))
+
+def _parse_remote_metadata(metadataUrl, doc):
+    parse_metadata_url(metadataUrl, doc, _METADATA_PARSERS)
+
+
 class ContentMetadata:
     """Abstraction for WFS metadata.
 
     Implements IMetadata.
     """
 
-    def __init__(self, elem, parse_remote_metadata=False, timeout=30):
+    def __init__(self, elem, parse_remote_metadata=False, timeout=30, session=None):
         """."""
         self.id = testXMLValue(elem.find(nspath_eval('wfs:Name', namespaces)))
         self.title = testXMLValue(elem.find(nspath_eval('wfs:Title', namespaces)))
@@ -285,13 +333,9 @@ class ContentMetadata:
 
             if metadataUrl['url'] is not None and parse_remote_metadata:  # download URL
                 try:
-                    content = urlopen(metadataUrl['url'], timeout=timeout)
+                    content = http_open(metadataUrl['url'], timeout=timeout, session=session)
                     doc = etree.parse(content)
-                    if metadataUrl['type'] is not None:
-                        if metadataUrl['type'] == 'FGDC':
-                            metadataUrl['metadata'] = Metadata(doc)
-                        if metadataUrl['type'] in ['TC211', '19115', '19139']:
-                            metadataUrl['metadata'] = MD_Metadata(doc)
+                    _parse_remote_metadata(metadataUrl, doc)
                 except Exception, err:
                     metadataUrl['metadata'] = None
 
@@ -306,10 +350,12 @@ class WFSCapabilitiesReader(object):
     """Read and parse capabilities document into a lxml.etree infoset
     """
 
-    def __init__(self, version='1.0'):
+    def __init__(self, version='1.0', session=None, cache=None):
         """Initialize"""
         self.version = version
         self._infoset = None
+        self.session = session
+        self.cache = cache
 
     def capabilities_url(self, service_url):
         """Return a capabilities url
@@ -342,7 +388,9 @@ class WFSCapabilitiesReader(object):
             A timeout value (in seconds) for the request.
         """
         request = self.capabilities_url(url)
-        u = urlopen(request, timeout=timeout)
+        if self.cache is not None:
+            return etree.fromstring(self.cache.read(request, timeout=timeout, session=self.session))
+        u = http_open(request, timeout=timeout, session=self.session)
         return etree.fromstring(u.read())
 
     def readString(self, st):
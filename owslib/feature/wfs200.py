@@ -9,16 +9,21 @@
 #owslib imports:
 from owslib.ows import ServiceIdentification, ServiceProvider, OperationsMetadata
 from owslib.etree import etree
-from owslib.util import nspath, testXMLValue
+from owslib.util import nspath, testXMLValue, http_open, fetch_remote_metadata, parse_metadata_url
+from owslib.fgdc import Metadata
+from owslib.iso import MD_Metadata
 from owslib.crs import Crs
 from owslib.feature import WebFeatureService_
+from owslib.feature.gml import iterfeatures, numbermatched
 from owslib.namespaces import Namespaces
 
 #other imports
 import cgi
 from cStringIO import StringIO
 from urllib import urlencode
+import urllib2
 from urllib2 import urlopen
+from multiprocessing.pool import ThreadPool
 
 import logging
 from owslib.util import log
@@ -30,6 +35,9 @@ OGC_NAMESPACE = n.get_namespace("ogc")
 GML_NAMESPACE = n.get_namespace("gml")
 FES_NAMESPACE = n.get_namespace("fes")
 
+# page size of paged GetFeature requests, when the server has no CountDefault
+DEFAULT_PAGE_SIZE = 1000
+
 
 class ServiceException(Exception):
     pass
@@ -40,7 +48,7 @@ class WebFeatureService_2_0_0(WebFeatureService_):
 
     Implements IWebFeatureService.
     """
-    def __new__(self,url, version, xml, parse_remote_metadata=False):
+    def __new__(self,url, version, xml, parse_remote_metadata=False, session=None, cache=None):
         """ overridden __new__ method 
         
         @type url: string
@@ -49,10 +57,14 @@ class WebFeatureService_2_0_0(WebFeatureService_):
         @param xml: elementtree object
         @type parse_remote_metadata: boolean
         @param parse_remote_metadata: whether to fully process MetadataURL elements
+        @type session: owslib.util.Session
+        @param session: optional pooled HTTP transport shared between requests
+        @type cache: owslib.cache.CapabilitiesCache
+        @param cache: optional on-disk cache of the GetCapabilities document
         @return: initialized WebFeatureService_2_0_0 object
         """
         obj=object.__new__(self)
-        obj.__init__(url, version, xml, parse_remote_metadata)
+        obj.__init__(url, version, xml, parse_remote_metadata, session, cache)
         return obj
     
     def __getitem__(self,name):
@@ -63,14 +75,16 @@ class WebFeatureService_2_0_0(WebFeatureService_):
             raise KeyError, "No content named %s" % name
     
     
-    def __init__(self, url,  version, xml=None, parse_remote_metadata=False):
+    def __init__(self, url,  version, xml=None, parse_remote_metadata=False, session=None, cache=None):
         """Initialize."""
         if log.isEnabledFor(logging.DEBUG):
             log.debug('building WFS %s'%url)
         self.url = url
+        self.session = session
+        self.cache = cache
         self.version = version
         self._capabilities = None
-        reader = WFSCapabilitiesReader(self.version)
+        reader = WFSCapabilitiesReader(self.version, session=self.session, cache=self.cache)
         if xml:
             self._capabilities = reader.readString(xml)
         else:
@@ -104,6 +118,14 @@ class WebFeatureService_2_0_0(WebFeatureService_):
         for elem in self._capabilities.find(nspath('OperationsMetadata'))[:]:
             if elem.tag !=nspath('ExtendedCapabilities'):
                 self.operations.append(OperationsMetadata(elem))
+
+        #service constraints (ImplementsResultPaging, CountDefault...), the
+        #constraints of the GetFeature operation taking precedence
+        operationsmetadata = self._capabilities.find(nspath('OperationsMetadata'))
+        self.constraints = _constraint_values(operationsmetadata)
+        for elem in operationsmetadata.findall(nspath('Operation')):
+            if elem.get('name') == 'GetFeature':
+                self.constraints.update(_constraint_values(elem))
                    
         #serviceContents metadata: our assumption is that services use a top-level 
         #layer as a metadata organizer, nothing more. 
@@ -112,8 +134,10 @@ class WebFeatureService_2_0_0(WebFeatureService_):
         featuretypelist=self._capabilities.find(nspath('FeatureTypeList',ns=WFS_NAMESPACE))
         features = self._capabilities.findall(nspath('FeatureTypeList/FeatureType', ns=WFS_NAMESPACE))
         for feature in features:
-            cm=ContentMetadata(feature, featuretypelist, parse_remote_metadata)
+            cm=ContentMetadata(feature, featuretypelist)
             self.contents[cm.id]=cm       
+        if parse_remote_metadata:
+            self.fetch_remote_metadata()
         
         #exceptions
         self.exceptions = [f.text for f \
@@ -123,8 +147,8 @@ class WebFeatureService_2_0_0(WebFeatureService_):
         """Request and return capabilities document from the WFS as a 
         file-like object.
         NOTE: this is effectively redundant now"""
-        reader = WFSCapabilitiesReader(self.version)
-        return urlopen(reader.capabilities_url(self.url), timeout=timeout)
+        reader = WFSCapabilitiesReader(self.version, session=self.session)
+        return http_open(reader.capabilities_url(self.url), timeout=timeout, session=self.session)
     
     def items(self):
         '''supports dict-like items() access'''
@@ -132,6 +156,13 @@ class WebFeatureService_2_0_0(WebFeatureService_):
         for item in self.contents:
             items.append((item,self.contents[item]))
         return items
+
+    def fetch_remote_metadata(self, timeout=30, max_workers=10, callback=None):
+        """Download and parse the MetadataURL documents of all feature types,
+        from a pool of max_workers threads; see util.fetch_remote_metadata.
+        Returns the metrics of the download."""
+        return fetch_remote_metadata(self.contents.values(), _parse_remote_metadata,
+                                     timeout, max_workers, self.session, callback)
     
     def getfeature(self, typename=None, filter=None, bbox=None, featureid=None,
                    featureversion=None, propertyname=None, maxfeatures=None,storedQueryID=None, storedQueryParams={},
@@ -183,7 +214,7 @@ class WebFeatureService_2_0_0(WebFeatureService_):
 
 
         # If method is 'Post', data will be None here
-        u = urlopen(url, data, timeout)
+        u = http_open(url, data, timeout, session=self.session)
         
         # check for service exceptions, rewrap, and return
         # We're going to assume that anything with a content-length > 32k
@@ -217,6 +248,115 @@ class WebFeatureService_2_0_0(WebFeatureService_):
             return u
 
 
+    def count(self, typename=None, filter=None, bbox=None, featureid=None,
+              featureversion=None, storedQueryID=None, storedQueryParams={}, timeout=30):
+        """Return the number of features matching a GetFeature query, without
+        downloading them: a resultType=hits request is made and only the
+        numberMatched attribute of the response is parsed.  Returns None when
+        the server does not know the number ("unknown").
+
+        Parameters are as for getfeature.
+        """
+        if typename and type(typename) == type(""):
+            typename = [typename]
+        url = self.getGETGetFeatureRequest(typename, filter, bbox, featureid,
+                                           featureversion, None, None,
+                                           storedQueryID, storedQueryParams)
+        url = '%s&%s' % (url, urlencode({'resultType': 'hits'}))
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug('GetFeature WFS GET url %s' % url)
+        return numbermatched(http_open(url, timeout=timeout, session=self.session))
+
+    def getfeaturepages(self, typename=None, filter=None, bbox=None, featureid=None,
+                        featureversion=None, propertyname=None, maxfeatures=None,
+                        storedQueryID=None, storedQueryParams={}, method='Get',
+                        timeout=30, outputFormat=None, pagesize=None, startindex=0,
+                        prefetch=True):
+        """Request feature data page by page, and iterate over the pages as
+        file-like objects.
+
+        When the server implements result paging (the ImplementsResultPaging
+        constraint) successive GetFeature requests with startIndex and count
+        are made, until the server has no more features; otherwise, or when
+        method is not Get, a single request is made.  While a page is being
+        read, the next one is downloaded in the background.
+
+        Parameters
+        ----------
+        typename, filter, bbox, featureid, featureversion, propertyname,
+        storedQueryID, storedQueryParams, method, timeout, outputFormat :
+            As for getfeature, the arguments being in the same order.
+        maxfeatures : int
+            Maximum number of features of all pages.
+        pagesize : int
+            Number of features per page.  Defaults to the CountDefault
+            constraint of the server, and is never more than it.
+        startindex : int
+            Index of the first feature.
+        prefetch : bool
+            Download the next page while a page is being read.
+        """
+        if typename and type(typename) == type(""):
+            typename = [typename]
+        if str(self.constraints.get('ImplementsResultPaging')).upper() != 'TRUE' or \
+                method.upper() != 'GET':
+            log.debug('WFS %s does not implement result paging' % self.url)
+            yield self.getfeature(typename, filter, bbox, featureid, featureversion,
+                                  propertyname, maxfeatures, storedQueryID,
+                                  storedQueryParams, method, timeout=timeout,
+                                  outputFormat=outputFormat)
+            return
+
+        countdefault = self.constraints.get('CountDefault')
+        if countdefault and countdefault.isdigit() and int(countdefault) > 0:
+            pagesize = min(pagesize or int(countdefault), int(countdefault))
+        pagesize = pagesize or DEFAULT_PAGE_SIZE
+        url = self.getGETGetFeatureRequest(typename, filter, bbox, featureid,
+                                           featureversion, propertyname, None,
+                                           storedQueryID, storedQueryParams,
+                                           outputFormat)
+
+        def fetch(index, count):
+            page_url = '%s&%s' % (url, urlencode({'startIndex': index, 'count': count}))
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug('GetFeature WFS GET url %s' % page_url)
+            data = http_open(page_url, timeout=timeout, session=self.session).read()
+            return data, _page_info(data)
+
+        def count(index):
+            if maxfeatures is None:
+                return pagesize
+            return min(pagesize, startindex + maxfeatures - index)
+
+        pool = ThreadPool(1) if prefetch else None
+        try:
+            index = startindex
+            page = fetch(index, count(index))
+            while True:
+                data, (returned, matched, more) = page
+                index += returned
+                if more is None:
+                    # no next link: the last page is the first short one
+                    more = returned >= count(index - returned) and \
+                        (matched is None or index < matched)
+                more = more and returned > 0 and count(index) > 0
+                if more and pool is not None:
+                    pending = pool.apply_async(fetch, (index, count(index)))
+                yield StringIO(data)
+                if not more:
+                    break
+                page = pending.get() if pool is not None else fetch(index, count(index))
+        finally:
+            if pool is not None:
+                pool.terminate()
+
+    def iterfeatures(self, *args, **kwargs):
+        """Request features page by page as for getfeaturepages, and iterate
+        over them one at a time as owslib.feature.gml.Feature records"""
+        for page in self.getfeaturepages(*args, **kwargs):
+            for feature in iterfeatures(page):
+                yield feature
+
     def getpropertyvalue(self, query=None, storedquery_id=None, valuereference=None, typename=None, method=nspath('Get'),**kwargs):
         ''' the WFS GetPropertyValue method'''
         try:
@@ -236,7 +376,7 @@ class WebFeatureService_2_0_0(WebFeatureService_):
             for kw in kwargs.keys():
                 request[kw]=str(kwargs[kw])
         encoded_request=urlencode(request)
-        u = urlopen(base_url + encoded_request)
+        u = http_open(base_url + encoded_request, session=self.session)
         return u.read()
         
         
@@ -255,7 +395,7 @@ class WebFeatureService_2_0_0(WebFeatureService_):
 
         request = {'service': 'WFS', 'version': self.version, 'request': 'ListStoredQueries'}
         encoded_request = urlencode(request)
-        u = urlopen(base_url, data=encoded_request, timeout=timeout)
+        u = http_open(base_url, data=encoded_request, timeout=timeout, session=self.session)
         tree=etree.fromstring(u.read())
         tempdict={}       
         for sqelem in tree[:]:
@@ -275,7 +415,7 @@ class WebFeatureService_2_0_0(WebFeatureService_):
             base_url = self.url
         request = {'service': 'WFS', 'version': self.version, 'request': 'DescribeStoredQueries'}
         encoded_request = urlencode(request)
-        u = urlopen(base_url, data=encoded_request, timeout=timeout)
+        u = http_open(base_url, data=encoded_request, timeout=timeout, session=self.session)
         tree=etree.fromstring(u.read())
         tempdict2={} 
         for sqelem in tree[:]:
@@ -304,6 +444,46 @@ class WebFeatureService_2_0_0(WebFeatureService_):
                 return item
         raise KeyError, "No operation named %s" % name
 
+def _constraint_values(elem):
+    '''Return the values of the ows:Constraint children of elem, by name'''
+    constraints = {}
+    for constraint in elem.findall(nspath('Constraint', OWS_NAMESPACE)):
+        value = testXMLValue(constraint.find(nspath('DefaultValue', OWS_NAMESPACE)))
+        if value is None:
+            value = testXMLValue(constraint.find(nspath('AllowedValues/Value', OWS_NAMESPACE)))
+        constraints[constraint.get('name')] = value
+    return constraints
+
+
+def _page_info(data):
+    '''Return the number of features returned and matched by a GetFeature
+    response, and whether it links to a next page (None when unknown)'''
+    returned = matched = more = None
+    depth = 0
+    for event, elem in etree.iterparse(StringIO(data), events=('start', 'end')):
+        if event == 'end':
+            depth -= 1
+            continue
+        depth += 1
+        if depth == 1:
+            tag = elem.tag.split('}')[-1]
+            if tag in ('ExceptionReport', 'ServiceExceptionReport'):
+                tree = etree.fromstring(data)
+                raise ServiceException(' '.join(t.strip() for t in tree.itertext() if t.strip()))
+            if elem.get('numberReturned', '').isdigit():
+                returned = int(elem.get('numberReturned'))
+            if elem.get('numberMatched', '').isdigit():
+                matched = int(elem.get('numberMatched'))
+            if elem.get('next'):
+                more = True
+            if returned is not None:
+                break
+            returned = 0
+        elif depth == 2 and elem.tag.split('}')[-1] in ('member', 'featureMember'):
+            returned += 1
+    return returned or 0, matched, more
+
+
 class StoredQuery(object):
     '''' Class to describe a storedquery '''
     def __init__(self, id, title, returntype, abstract, parameters):
@@ -319,13 +499,20 @@ class Parameter(object):
         self.type=type
         
     
+# parsers of the MetadataURL documents, whatever their type: FGDC, or else ISO
+_METADATA_PARSERS = ((None, Metadata), (None, MD_Metadata))
+
+def _parse_remote_metadata(metadataUrl, doc):
+    parse_metadata_url(metadataUrl, doc, _METADATA_PARSERS)
+
+
 class ContentMetadata:
     """Abstraction for WFS metadata.
     
     Implements IMetadata.
     """
 
-    def __init__(self, elem, parent, parse_remote_metadata=False, timeout=30):
+    def __init__(self, elem, parent, parse_remote_metadata=False, timeout=30, session=None):
         """."""
         self.id = elem.find(nspath('Name',ns=WFS_NAMESPACE)).text
         self.title = elem.find(nspath('Title',ns=WFS_NAMESPACE)).text
@@ -383,12 +570,9 @@ class ContentMetadata:
 
             if metadataUrl['url'] is not None and parse_remote_metadata:  # download URL
                 try:
-                    content = urllib2.urlopen(metadataUrl['url'], timeout=timeout)
+                    content = http_open(metadataUrl['url'], timeout=timeout, session=session)
                     doc = etree.parse(content)
-                    try:  # FGDC
-                        metadataUrl['metadata'] = Metadata(doc)
-                    except:  # ISO
-                        metadataUrl['metadata'] = MD_Metadata(doc)
+                    _parse_remote_metadata(metadataUrl, doc)
                 except Exception, err:
                     metadataUrl['metadata'] = None
 
@@ -399,10 +583,12 @@ class WFSCapabilitiesReader(object):
     """Read and parse capabilities document into a lxml.etree infoset
     """
 
-    def __init__(self, version='2.0.0'):
+    def __init__(self, version='2.0.0', session=None, cache=None):
         """Initialize"""
         self.version = version
         self._infoset = None
+        self.session = session
+        self.cache = cache
 
     def capabilities_url(self, service_url):
         """Return a capabilities url
@@ -435,7 +621,9 @@ class WFSCapabilitiesReader(object):
             A timeout value (in seconds) for the request.
         """
         request = self.capabilities_url(url)
-        u = urlopen(request, timeout=timeout)
+        if self.cache is not None:
+            return etree.fromstring(self.cache.read(request, timeout=timeout, session=self.session))
+        u = http_open(request, timeout=timeout, session=self.session)
         return etree.fromstring(u.read())
 
     def readString(self, st):
@@ -24,7 +24,11 @@ namespaces = get_namespaces()
 
 
 class MD_Metadata(object):
-    """ Process gmd:MD_Metadata """
+    """ Process gmd:MD_Metadata
+
+    Properties are parsed from the metadata element when first accessed,
+    and xml is serialized only when asked for.
+    """
     def __init__(self, md=None):
 
         if md is None:
@@ -49,100 +53,129 @@ class MD_Metadata(object):
             self.dataquality = None
         else:
             if hasattr(md, 'getroot'):  # standalone document
-                self.xml = etree.tostring(md.getroot())
-            else:  # part of a larger document
-                self.xml = etree.tostring(md)
-
-            val = md.find(util.nspath_eval('gmd:fileIdentifier/gco:CharacterString', namespaces))
-            self.identifier = util.testXMLValue(val)
-
-            val = md.find(util.nspath_eval('gmd:parentIdentifier/gco:CharacterString', namespaces))
-            self.parentidentifier = util.testXMLValue(val)
-
-            val = md.find(util.nspath_eval('gmd:language/gco:CharacterString', namespaces))
-            self.language = util.testXMLValue(val)
-            
-            val = md.find(util.nspath_eval('gmd:dataSetURI/gco:CharacterString', namespaces))
-            self.dataseturi = util.testXMLValue(val)
-
-            val = md.find(util.nspath_eval('gmd:language/gmd:LanguageCode', namespaces))
-            self.languagecode = util.testXMLValue(val)
-            
-            val = md.find(util.nspath_eval('gmd:dateStamp/gco:Date', namespaces))
-            self.datestamp = util.testXMLValue(val)
-
-            if not self.datestamp:
-                val = md.find(util.nspath_eval('gmd:dateStamp/gco:DateTime', namespaces))
-                self.datestamp = util.testXMLValue(val)
-
-            self.charset = _testCodeListValue(md.find(util.nspath_eval('gmd:characterSet/gmd:MD_CharacterSetCode', namespaces)))
-      
-            self.hierarchy = _testCodeListValue(md.find(util.nspath_eval('gmd:hierarchyLevel/gmd:MD_ScopeCode', namespaces)))
-
-            self.contact = []
-            for i in md.findall(util.nspath_eval('gmd:contact/gmd:CI_ResponsibleParty', namespaces)):
-                o = CI_ResponsibleParty(i)
-                self.contact.append(o)
-            
-            val = md.find(util.nspath_eval('gmd:dateStamp/gco:DateTime', namespaces))
-            self.datetimestamp = util.testXMLValue(val)
-            
-            val = md.find(util.nspath_eval('gmd:metadataStandardName/gco:CharacterString', namespaces))
-            self.stdname = util.testXMLValue(val)
-
-            val = md.find(util.nspath_eval('gmd:metadataStandardVersion/gco:CharacterString', namespaces))
-            self.stdver = util.testXMLValue(val)
-
-            val = md.find(util.nspath_eval('gmd:referenceSystemInfo/gmd:MD_ReferenceSystem', namespaces))
-            if val is not None:
-                self.referencesystem = MD_ReferenceSystem(val)
-            else:
-                self.referencesystem = None
-
-            # TODO: merge .identificationinfo into .identification
-            #warnings.warn(
-            #    'the .identification and .serviceidentification properties will merge into '
-            #    '.identification being a list of properties.  This is currently implemented '
-            #    'in .identificationinfo.  '
-            #    'Please see https://github.com/geopython/OWSLib/issues/38 for more information',
-            #    FutureWarning)
+                md = md.getroot()
+            self._md = md
+
+    def _find(self, path):
+        return util.nsfind(self._md, path, namespaces)
+
+    @util.cached_property
+    def xml(self):
+        return etree.tostring(self._md)
+
+    @util.cached_property
+    def identifier(self):
+        return util.testXMLValue(self._find('gmd:fileIdentifier/gco:CharacterString'))
+
+    @util.cached_property
+    def parentidentifier(self):
+        return util.testXMLValue(self._find('gmd:parentIdentifier/gco:CharacterString'))
+
+    @util.cached_property
+    def language(self):
+        return util.testXMLValue(self._find('gmd:language/gco:CharacterString'))
+
+    @util.cached_property
+    def dataseturi(self):
+        return util.testXMLValue(self._find('gmd:dataSetURI/gco:CharacterString'))
+
+    @util.cached_property
+    def languagecode(self):
+        return util.testXMLValue(self._find('gmd:language/gmd:LanguageCode'))
+
+    @util.cached_property
+    def datestamp(self):
+        datestamp = util.testXMLValue(self._find('gmd:dateStamp/gco:Date'))
+        if not datestamp:
+            datestamp = util.testXMLValue(self._find('gmd:dateStamp/gco:DateTime'))
+        return datestamp
+
+    @util.cached_property
+    def charset(self):
+        return _testCodeListValue(self._find('gmd:characterSet/gmd:MD_CharacterSetCode'))
+
+    @util.cached_property
+    def hierarchy(self):
+        return _testCodeListValue(self._find('gmd:hierarchyLevel/gmd:MD_ScopeCode'))
+
+    @util.cached_property
+    def contact(self):
+        return [CI_ResponsibleParty(i) for i in
+                util.nsfindall(self._md, 'gmd:contact/gmd:CI_ResponsibleParty', namespaces)]
+
+    @util.cached_property
+    def datetimestamp(self):
+        return util.testXMLValue(self._find('gmd:dateStamp/gco:DateTime'))
+
+    @util.cached_property
+    def stdname(self):
+        return util.testXMLValue(self._find('gmd:metadataStandardName/gco:CharacterString'))
+
+    @util.cached_property
+    def stdver(self):
+        return util.testXMLValue(self._find('gmd:metadataStandardVersion/gco:CharacterString'))
+
+    @util.cached_property
+    def referencesystem(self):
+        val = self._find('gmd:referenceSystemInfo/gmd:MD_ReferenceSystem')
+        if val is not None:
+            return MD_ReferenceSystem(val)
+        return None
 
-            val = md.find(util.nspath_eval('gmd:identificationInfo/gmd:MD_DataIdentification', namespaces))
-            val2 = md.find(util.nspath_eval('gmd:identificationInfo/srv:SV_ServiceIdentification', namespaces))
+    # TODO: merge .identificationinfo into .identification
+    #warnings.warn(
+    #    'the .identification and .serviceidentification properties will merge into '
+    #    '.identification being a list of properties.  This is currently implemented '
+    #    'in .identificationinfo.  '
+    #    'Please see https://github.com/geopython/OWSLib/issues/38 for more information',
+    #    FutureWarning)
+
+    @util.cached_property
+    def identification(self):
+        val = self._find('gmd:identificationInfo/gmd:MD_DataIdentification')
+        if val is not None:
+            return MD_DataIdentification(val, 'dataset')
+        val = self._find('gmd:identificationInfo/srv:SV_ServiceIdentification')
+        if val is not None:
+            return MD_DataIdentification(val, 'service')
+        return None
 
-            if val is not None:
-                self.identification = MD_DataIdentification(val, 'dataset')
-                self.serviceidentification = None
-            elif val2 is not None:
-                self.identification = MD_DataIdentification(val2, 'service')
-                self.serviceidentification = SV_ServiceIdentification(val2)
-            else:
-                self.identification = None
-                self.serviceidentification = None
+    @util.cached_property
+    def serviceidentification(self):
+        if self._find('gmd:identificationInfo/gmd:MD_DataIdentification') is not None:
+            return None
+        val = self._find('gmd:identificationInfo/srv:SV_ServiceIdentification')
+        if val is not None:
+            return SV_ServiceIdentification(val)
+        return None
 
-            self.identificationinfo = []
-            for idinfo in md.findall(util.nspath_eval('gmd:identificationInfo', namespaces)):
-                val = list(idinfo)[0]
-                tagval = util.xmltag_split(val.tag)
-                if tagval == 'MD_DataIdentification': 
-                    self.identificationinfo.append(MD_DataIdentification(val, 'dataset'))
-                elif tagval == 'MD_ServiceIdentification': 
-                    self.identificationinfo.append(MD_DataIdentification(val, 'service'))
-                elif tagval == 'SV_ServiceIdentification': 
-                    self.identificationinfo.append(SV_ServiceIdentification(val))
-
-            val = md.find(util.nspath_eval('gmd:distributionInfo/gmd:MD_Distribution', namespaces))
+    @util.cached_property
+    def identificationinfo(self):
+        identificationinfo = []
+        for idinfo in util.nsfindall(self._md, 'gmd:identificationInfo', namespaces):
+            val = list(idinfo)[0]
+            tagval = util.xmltag_split(val.tag)
+            if tagval == 'MD_DataIdentification': 
+                identificationinfo.append(MD_DataIdentification(val, 'dataset'))
+            elif tagval == 'MD_ServiceIdentification': 
+                identificationinfo.append(MD_DataIdentification(val, 'service'))
+            elif tagval == 'SV_ServiceIdentification': 
+                identificationinfo.append(SV_ServiceIdentification(val))
+        return identificationinfo
+
+    @util.cached_property
+    def distribution(self):
+        val = self._find('gmd:distributionInfo/gmd:MD_Distribution')
+        if val is not None:
+            return MD_Distribution(val)
+        return None
 
-            if val is not None:
-                self.distribution = MD_Distribution(val)
-            else:
-                self.distribution = None
-            
-            val = md.find(util.nspath_eval('gmd:dataQualityInfo/gmd:DQ_DataQuality', namespaces))
-            if val is not None:
-                self.dataquality = DQ_DataQuality(val)
-            else:
-                self.dataquality = None
+    @util.cached_property
+    def dataquality(self):
+        val = self._find('gmd:dataQualityInfo/gmd:DQ_DataQuality')
+        if val is not None:
+            return DQ_DataQuality(val)
+        return None
 
 class CI_Date(object):
     """ process CI_Date """
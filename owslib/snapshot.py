@@ -0,0 +1,200 @@
+# -*- coding: ISO-8859-15 -*-
+
+"""
+Versioned snapshots of parsed service metadata.
+
+A snapshot holds the metadata objects built from a capabilities document
+(contents, operations, tile matrix sets, styles, CRS options, ...) so that a
+service object can be restored without fetching or parsing the document
+again.
+
+Snapshots are marshal data: a table of the metadata objects, each stored as
+the index of its class and its attribute dictionary, and the paths of the
+references between them.  Unlike pickle, loading a snapshot never runs code:
+only classes of the modules listed in SNAPSHOT_MODULES are re-created, and
+their constructors are not called.  As for marshal, snapshots are not meant
+to be exchanged with untrusted parties.
+
+The XML infoset (_capabilities and the _root elements), remote metadata
+records, credentials and the session and caches of the service are not part
+of a snapshot, these attributes are None in a restored service.
+"""
+
+import marshal
+import sys
+import types
+import zlib
+
+from owslib import __version__
+from owslib.etree import etree
+from owslib.util import log
+
+SNAPSHOT_FORMAT = 'owslib-snapshot'
+SNAPSHOT_VERSION = 1
+
+# modules whose classes may be stored in and re-created from a snapshot
+SNAPSHOT_MODULES = ('owslib.wms', 'owslib.wmts', 'owslib.ows', 'owslib.crs')
+
+# attributes which are never stored
+_TRANSIENT = ('_capabilities', '_root', 'session', 'cache', 'tile_cache',
+              'password')
+
+_PLAIN_TYPES = (type(None), bool, int, long, float, str, unicode)
+
+# marshal header of zlib compressed snapshots
+_ZLIB_MAGIC = ('\x78\x01', '\x78\x5e', '\x78\x9c', '\x78\xda')
+
+
+class SnapshotError(ValueError):
+    """Raised for snapshots which are not valid or of another version"""
+    pass
+
+
+class _Encoder(object):
+    def __init__(self):
+        self.ids = {}
+        self.objects = []
+        self.classes = []
+        self.class_index = {}
+        self.refs = []
+
+    def add(self, obj):
+        """Add obj to the object table, return its index"""
+        n = self.ids.get(id(obj))
+        if n is not None:
+            return n
+        cls = obj.__class__
+        name = '%s.%s' % (cls.__module__, cls.__name__)
+        if name not in self.class_index:
+            self.class_index[name] = len(self.classes)
+            self.classes.append(name)
+        # registered before the attributes, so that cycles (layer parents) become references
+        n = self.ids[id(obj)] = len(self.objects)
+        self.objects.append(None)
+        # as for pickle, __getstate__ may give the attributes to store
+        getstate = getattr(obj, '__getstate__', None)
+        state = getstate() if getstate is not None else obj.__dict__
+        attrs = {}
+        for k, v in state.iteritems():
+            attrs[k] = None if k in _TRANSIENT else self.encode(v, (n, k))
+        self.objects[n] = (self.class_index[name], attrs)
+        return n
+
+    def encode(self, value, path):
+        """Return the plain data of value, recording references to objects found at path"""
+        if isinstance(value, _PLAIN_TYPES):
+            return value
+        if isinstance(value, list):
+            return [self.encode(v, path + (i,)) for i, v in enumerate(value)]
+        if isinstance(value, tuple):
+            return tuple(self.encode(v, path + (i,)) for i, v in enumerate(value))
+        if isinstance(value, dict):
+            return dict((k, self.encode(v, path + (k,))) for k, v in value.iteritems())
+        if etree.iselement(value):
+            return None
+        if value.__class__.__module__ not in SNAPSHOT_MODULES or not hasattr(value, '__dict__'):
+            log.debug('snapshot: not storing %r' % (value,))
+            return None
+        self.refs.append((path, self.add(value)))
+        return None
+
+
+class _Empty:
+    pass
+
+
+def _snapshot_class(name):
+    module_name, _, class_name = name.rpartition('.')
+    if module_name not in SNAPSHOT_MODULES:
+        raise SnapshotError('Class %s is not allowed in a snapshot' % name)
+    __import__(module_name)
+    cls = getattr(sys.modules[module_name], class_name, None)
+    if not isinstance(cls, (type, types.ClassType)) or cls.__module__ != module_name:
+        raise SnapshotError('Unknown class %s in snapshot' % name)
+    return cls
+
+
+def _patch(container, path, value):
+    """Set container[path[0]]...[path[-1]] to value, return the container"""
+    key = path[0]
+    if len(path) > 1:
+        value = _patch(container[key], path[1:], value)
+    if isinstance(container, tuple):
+        return container[:key] + (value,) + container[key + 1:]
+    container[key] = value
+    return container
+
+
+def dumps(service, compress=False):
+    """
+    Return a snapshot of the metadata of a service, as a string.
+
+    Parameters
+    ----------
+
+    - service: a WebMapService or WebMapTileService instance
+    - compress: zlib compress the snapshot
+
+    """
+    encoder = _Encoder()
+    encoder.add(service)
+    data = marshal.dumps({
+        'format': SNAPSHOT_FORMAT,
+        'version': SNAPSHOT_VERSION,
+        'owslib': __version__,
+        'classes': encoder.classes,
+        'objects': encoder.objects,
+        'refs': encoder.refs,
+    })
+    if compress:
+        data = zlib.compress(data)
+    return data
+
+
+def loads(data, **kwargs):
+    """
+    Return the service object restored from a snapshot.
+
+    Keyword arguments (for instance password or session) are set as
+    attributes of the restored service.
+
+    """
+    try:
+        if data[:2] in _ZLIB_MAGIC:
+            data = zlib.decompress(data)
+        data = marshal.loads(data)
+    except (zlib.error, ValueError, EOFError, TypeError), e:
+        raise SnapshotError('Not a snapshot: %s' % e)
+    if not isinstance(data, dict) or data.get('format') != SNAPSHOT_FORMAT:
+        raise SnapshotError('Not a snapshot')
+    if data.get('version') != SNAPSHOT_VERSION:
+        raise SnapshotError('Unsupported snapshot version %s' % data.get('version'))
+
+    classes = [_snapshot_class(name) for name in data['classes']]
+    objects = []
+    for index, attrs in data['objects']:
+        cls = classes[index]
+        if isinstance(cls, type):
+            obj = cls.__new__(cls)
+        else:
+            obj = _Empty()
+            obj.__class__ = cls
+        obj.__dict__ = attrs
+        objects.append(obj)
+    for path, n in data['refs']:
+        _patch(objects[path[0]].__dict__, path[1:], objects[n])
+
+    service = objects[0]
+    for k, v in kwargs.iteritems():
+        setattr(service, k, v)
+    return service
+
+
+def dump(service, f, compress=True):
+    """Write a snapshot of the metadata of a service to the file object f"""
+    f.write(dumps(service, compress))
+
+
+def load(f, **kwargs):
+    """Return the service object restored from the snapshot in the file object f"""
+    return loads(f.read(), **kwargs)
@@ -13,10 +13,11 @@ Sensor Observation Service (SOS) methods and metadata. Factory function.
 
 from swe.observation import sos100, sos200
 
-def SensorObservationService(url, version='1.0.0', xml=None):
-    """sos factory function, returns a version specific SensorObservationService object"""
+def SensorObservationService(url, version='1.0.0', xml=None, cache=None):
+    """sos factory function, returns a version specific SensorObservationService object,
+    an optional owslib.cache.CapabilitiesCache keeps the GetCapabilities document on disk"""
     if version in  ['1.0', '1.0.0']:
-        return sos100.SensorObservationService_1_0_0.__new__(sos100.SensorObservationService_1_0_0, url, version, xml)
+        return sos100.SensorObservationService_1_0_0.__new__(sos100.SensorObservationService_1_0_0, url, version, xml, cache=cache)
     elif version in ['2.0', '2.0.0']:
-        return sos200.SensorObservationService_2_0_0.__new__(sos200.SensorObservationService_2_0_0, url, version, xml)
+        return sos200.SensorObservationService_2_0_0.__new__(sos200.SensorObservationService_2_0_0, url, version, xml, cache=cache)
 
@@ -24,10 +24,10 @@ class SensorObservationService_2_0_0(object):
         Implements ISensorObservationService.
     """
 
-    def __new__(self,url, version, xml=None, username=None, password=None):
+    def __new__(self,url, version, xml=None, username=None, password=None, cache=None):
         """overridden __new__ method"""
         obj=object.__new__(self)
-        obj.__init__(url, version, xml, username, password)
+        obj.__init__(url, version, xml, username, password, cache)
         return obj
 
     def __getitem__(self,id):
@@ -37,17 +37,19 @@ class SensorObservationService_2_0_0(object):
         else:
             raise KeyError, "No Observational Offering with id: %s" % id
 
-    def __init__(self, url, version='2.0.0', xml=None, username=None, password=None):
+    def __init__(self, url, version='2.0.0', xml=None, username=None, password=None, cache=None):
         """Initialize."""
         self.url = url
         self.username = username
         self.password = password
         self.version = version
+        self.cache = cache
         self._capabilities = None
 
         # Authentication handled by Reader
         reader = SosCapabilitiesReader(
-                version=self.version, url=self.url, username=self.username, password=self.password
+                version=self.version, url=self.url, username=self.username, password=self.password,
+                cache=self.cache
                 )
         if xml:  # read from stored xml
             self._capabilities = reader.read_string(xml)
@@ -264,11 +266,12 @@ class SosObservationOffering(object):
         return 'Offering id: %s, name: %s' % (self.id, self.name)
         
 class SosCapabilitiesReader(object):
-    def __init__(self, version="2.0.0", url=None, username=None, password=None):
+    def __init__(self, version="2.0.0", url=None, username=None, password=None, cache=None):
         self.version = version
         self.url = url
         self.username = username
         self.password = password
+        self.cache = cache
 
     def capabilities_url(self, service_url):
         """
@@ -299,6 +302,8 @@ class SosCapabilitiesReader(object):
             version, and request parameters
         """
         getcaprequest = self.capabilities_url(service_url)
+        if self.cache is not None:
+            return etree.fromstring(self.cache.read(getcaprequest, self.username, self.password))
         spliturl=getcaprequest.split('?')
         u = openURL(spliturl[0], spliturl[1], method='Get', username=self.username, password=self.password)
         return etree.fromstring(u.read())
@@ -16,6 +16,7 @@
 # http://wiki.osgeo.org/wiki/Tile_Map_Service_Specification
 
 from etree import etree
+from .cache import CachedTile
 from .util import openURL, testXMLValue
 
 FORCE900913 = False
@@ -38,12 +39,19 @@ class TileMapService(object):
     """
 
     def __init__(self, url, version='1.0.0', xml=None,
-                username=None, password=None, parse_remote_metadata=False
+                username=None, password=None, parse_remote_metadata=False,
+                cache=None, tile_cache=None
                 ):
-        """Initialize."""
+        """Initialize.
+
+        An optional owslib.cache.TileCache keeps the tiles returned by
+        gettile.
+        """
         self.url = url
         self.username = username
         self.password = password
+        self.cache = cache
+        self.tile_cache = tile_cache
         self.version = version
         self.services = None
         self._capabilities = None
@@ -51,7 +59,8 @@ class TileMapService(object):
 
         # Authentication handled by Reader
         reader = TMSCapabilitiesReader(
-                self.version, url=self.url, un=self.username, pw=self.password
+                self.version, url=self.url, un=self.username, pw=self.password,
+                cache=self.cache
                 )
         if xml:  # read from stored xml
             self._capabilities = reader.readString(xml)
@@ -65,7 +74,8 @@ class TileMapService(object):
     def _getcapproperty(self):
         if not self._capabilities:
             reader = TMSCapabilitiesReader(
-                self.version, url=self.url, un=self.username, pw=self.password
+                self.version, url=self.url, un=self.username, pw=self.password,
+                cache=self.cache
                 )
             self._capabilities = ServiceMetadata(reader.read(self.url))
         return self._capabilities
@@ -124,10 +134,20 @@ class TileMapService(object):
         else:
             raise ValueError('cannot find zoomlevel %i for TileMap' % z)
 
+    def _gettilefromcache(self, tm, x, y, z):
+        # the key does not need the TileMap document, cached tiles are
+        # served without any request
+        key = (self.url, tm.id, '', '', tm.srs, str(z), y, x)
+        data = self.tile_cache.read(key, lambda: self._gettilefromset(
+            tm.tilemap.tilesets, x, y, z, tm.tilemap.extension).read())
+        return CachedTile(data)
+
     def gettile(self, x,y,z, id=None, title=None, srs=None, mimetype=None):
         if not id and not title and not srs:
             raise ValueError('either id or title and srs must be specified')
         if id:
+            if self.tile_cache is not None:
+                return self._gettilefromcache(self.contents[id], x, y, z)
             return self._gettilefromset(self.contents[id].tilemap.tilesets,
                 x, y, z, self.contents[id].tilemap.extension)
 
@@ -136,11 +156,15 @@ class TileMapService(object):
                 if tm.title == title and tm.srs == srs:
                     if mimetype:
                         if tm.tilemap.mimetype == mimetype:
+                            if self.tile_cache is not None:
+                                return self._gettilefromcache(tm, x, y, z)
                             return self._gettilefromset(tm.tilemap.tilesets,
                                 x, y, z, tm.tilemap.extension)
                     else:
                         #if no format is given we return the tile from the
                         # first tilemap that matches name and srs
+                        if self.tile_cache is not None:
+                            return self._gettilefromcache(tm, x, y, z)
                         return self._gettilefromset(tm.tilemap.tilesets,
                             x, y,z, tm.tilemap.extension)
             else:
@@ -306,19 +330,22 @@ class TMSCapabilitiesReader(object):
     """Read and parse capabilities document into a lxml.etree infoset
     """
 
-    def __init__(self, version='1.0.0', url=None, un=None, pw=None):
+    def __init__(self, version='1.0.0', url=None, un=None, pw=None, cache=None):
         """Initialize"""
         self.version = version
         self._infoset = None
         self.url = url
         self.username = un
         self.password = pw
+        self.cache = cache
 
 
     def read(self, service_url):
         """Get and parse a TMS capabilities document, returning an
         elementtree instance
         """
+        if self.cache is not None:
+            return etree.fromstring(self.cache.read(service_url, self.username, self.password))
         u = openURL(service_url, '', method='Get', username = self.username, password = self.password)
         return etree.fromstring(u.read())
 
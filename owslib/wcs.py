@@ -18,14 +18,17 @@ import urllib2
 import etree
 from coverage import wcs100, wcs110, wcsBase
 
-def WebCoverageService(url, version=None, xml=None, cookies=None, timeout=30):
-    ''' wcs factory function, returns a version specific WebCoverageService object '''
+def WebCoverageService(url, version=None, xml=None, cookies=None, timeout=30, cache=None):
+    ''' wcs factory function, returns a version specific WebCoverageService object,
+    an optional owslib.cache.CapabilitiesCache keeps the GetCapabilities document on disk '''
     
     if version is None:
         if xml is None:
             reader = wcsBase.WCSCapabilitiesReader()
             request = reader.capabilities_url(url)
-            if cookies is None:
+            if cache is not None:
+                xml = cache.read(request, cookies=cookies, timeout=timeout)
+            elif cookies is None:
                 xml = urllib2.urlopen(request, timeout=timeout).read()
             else:
                 req = urllib2.Request(request)
@@ -36,6 +39,6 @@ def WebCoverageService(url, version=None, xml=None, cookies=None, timeout=30):
         del capabilities
         
     if version == '1.0.0':
-        return wcs100.WebCoverageService_1_0_0.__new__(wcs100.WebCoverageService_1_0_0, url, xml, cookies)
+        return wcs100.WebCoverageService_1_0_0.__new__(wcs100.WebCoverageService_1_0_0, url, xml, cookies, cache)
     elif version == '1.1.0':
-        return wcs110.WebCoverageService_1_1_0.__new__(wcs110.WebCoverageService_1_1_0,url, xml, cookies)
+        return wcs110.WebCoverageService_1_1_0.__new__(wcs110.WebCoverageService_1_1_0,url, xml, cookies, cache)
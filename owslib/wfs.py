@@ -14,7 +14,7 @@ Web Feature Server (WFS) methods and metadata. Factory function.
 """
 
 from feature import wfs100, wfs110, wfs200 
-def WebFeatureService(url, version='1.0.0', xml=None, parse_remote_metadata=False):
+def WebFeatureService(url, version='1.0.0', xml=None, parse_remote_metadata=False, session=None, cache=None):
     ''' wfs factory function, returns a version specific WebFeatureService object
     
     @type url: string
@@ -23,12 +23,16 @@ def WebFeatureService(url, version='1.0.0', xml=None, parse_remote_metadata=Fals
     @param xml: elementtree object
     @type parse_remote_metadata: boolean
     @param parse_remote_metadata: whether to fully process MetadataURL elements
+    @type session: owslib.util.Session
+    @param session: optional pooled HTTP transport shared between requests
+    @type cache: owslib.cache.CapabilitiesCache
+    @param cache: optional on-disk cache of the GetCapabilities document
     @return: initialized WebFeatureService_2_0_0 object
     '''
     if version in  ['1.0', '1.0.0']:
-        return wfs100.WebFeatureService_1_0_0(url, version, xml, parse_remote_metadata)
+        return wfs100.WebFeatureService_1_0_0(url, version, xml, parse_remote_metadata, session, cache)
     elif version in  ['1.1', '1.1.0']:
-        return wfs110.WebFeatureService_1_1_0(url, version, xml, parse_remote_metadata)
+        return wfs110.WebFeatureService_1_1_0(url, version, xml, parse_remote_metadata, session, cache)
     elif version in ['2.0', '2.0.0']:
-        return wfs200.WebFeatureService_2_0_0(url,  version, xml, parse_remote_metadata)
+        return wfs200.WebFeatureService_2_0_0(url,  version, xml, parse_remote_metadata, session, cache)
 
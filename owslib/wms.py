@@ -17,10 +17,12 @@ Currently supports only version 1.1.1 of the WMS protocol.
 
 import cgi
 import urllib2
+from UserDict import DictMixin
 from urllib import urlencode
 import warnings
 from etree import etree
-from .util import openURL, testXMLValue, extract_xml_list, xmltag_split
+from .util import openURL, http_open, testXMLValue, extract_xml_list, xmltag_split, fetch_remote_metadata, \
+    parse_metadata_url
 from fgdc import Metadata
 from iso import MD_Metadata
 
@@ -52,25 +54,37 @@ class WebMapService(object):
     
     def __getitem__(self,name):
         ''' check contents dictionary to allow dict like access to service layers'''
-        if name in self.__getattribute__('contents').keys():
+        if name in self.__getattribute__('contents'):
             return self.__getattribute__('contents')[name]
         else:
             raise KeyError, "No content named %s" % name
 
     
     def __init__(self, url, version='1.1.1', xml=None, 
-                username=None, password=None, parse_remote_metadata=False
+                username=None, password=None, parse_remote_metadata=False,
+                session=None, cache=None, lazy=False
                 ):
-        """Initialize."""
+        """Initialize.
+
+        With parse_remote_metadata=True the documents of the layer
+        MetadataURLs are downloaded concurrently once the layers are built,
+        see fetch_remote_metadata.
+
+        With lazy=True, contents is a LazyContents mapping which only
+        indexes the layer names, the metadata of a layer (including its
+        remote metadata) is built when it is first accessed."""
         self.url = url
         self.username = username
         self.password = password
+        self.session = session
+        self.cache = cache
         self.version = version
         self._capabilities = None
         
         # Authentication handled by Reader
         reader = WMSCapabilitiesReader(
-                self.version, url=self.url, un=self.username, pw=self.password
+                self.version, url=self.url, un=self.username, pw=self.password,
+                session=self.session, cache=self.cache
                 )
         if xml:  # read from stored xml
             self._capabilities = reader.readString(xml)
@@ -84,17 +98,18 @@ class WebMapService(object):
             raise ServiceException(err_message, xml) 
 
         # build metadata objects
-        self._buildMetadata(parse_remote_metadata)
+        self._buildMetadata(parse_remote_metadata, lazy)
 
     def _getcapproperty(self):
         if not self._capabilities:
             reader = WMSCapabilitiesReader(
-                self.version, url=self.url, un=self.username, pw=self.password
+                self.version, url=self.url, un=self.username, pw=self.password,
+                session=self.session, cache=self.cache
                 )
             self._capabilities = ServiceMetadata(reader.read(self.url))
         return self._capabilities
 
-    def _buildMetadata(self, parse_remote_metadata=False):
+    def _buildMetadata(self, parse_remote_metadata=False, lazy=False):
         ''' set up capabilities metadata objects '''
         
         #serviceIdentification metadata
@@ -111,20 +126,26 @@ class WebMapService(object):
           
         #serviceContents metadata: our assumption is that services use a top-level 
         #layer as a metadata organizer, nothing more.
-        self.contents={}
         caps = self._capabilities.find('Capability')
+        if lazy:
+            self.contents = LazyContents(caps, parse_remote_metadata, self.session)
+        else:
+            self.contents = {}
         
         #recursively gather content metadata for all layer elements.
         #To the WebMapService.contents store only metadata of named layers.
         def gather_layers(parent_elem, parent_metadata):
             for index, elem in enumerate(parent_elem.findall('Layer')):
-                cm = ContentMetadata(elem, parent=parent_metadata, index=index+1, parse_remote_metadata=parse_remote_metadata)
+                cm = ContentMetadata(elem, parent=parent_metadata, index=index+1)
                 if cm.id:
                     if cm.id in self.contents:
                         warnings.warn('Content metadata for layer "%s" already exists. Using child layer' % cm.id)
                     self.contents[cm.id] = cm
                 gather_layers(elem, cm)
-        gather_layers(caps, None)
+        if not lazy:
+            gather_layers(caps, None)
+            if parse_remote_metadata:
+                self.fetch_remote_metadata()
         
         #exceptions
         self.exceptions = [f.text for f \
@@ -143,7 +164,8 @@ class WebMapService(object):
         NOTE: this is effectively redundant now"""
         
         reader = WMSCapabilitiesReader(
-            self.version, url=self.url, un=self.username, pw=self.password
+            self.version, url=self.url, un=self.username, pw=self.password,
+            session=self.session
             )
         u = self._open(reader.capabilities_url(self.url))
         # check for service exceptions, and return
@@ -237,7 +259,8 @@ class WebMapService(object):
 
         data = urlencode(request)
         
-        u = openURL(base_url, data, method, username = self.username, password = self.password)
+        u = openURL(base_url, data, method, username = self.username, password = self.password,
+                    session=self.session)
 
         # check for service exceptions, and return
         if u.info()['Content-Type'] == 'application/vnd.ogc.se_xml':
@@ -256,6 +279,21 @@ class WebMapService(object):
     def getfeatureinfo(self):
         raise NotImplementedError
 
+    def fetch_remote_metadata(self, timeout=30, max_workers=10, callback=None):
+        """Download and parse the MetadataURL documents of all layers,
+        from a pool of max_workers threads; see util.fetch_remote_metadata.
+        Returns the metrics of the download."""
+        # the unnamed parent layers, which are not in contents, too
+        layers = []
+        seen = set()
+        for layer in self.contents.values():
+            while layer is not None and id(layer) not in seen:
+                seen.add(id(layer))
+                layers.append(layer)
+                layer = layer.parent
+        return fetch_remote_metadata(layers, _parse_remote_metadata,
+                                     timeout, max_workers, self.session, callback)
+
     def getOperationByName(self, name): 
         """Return a named content item."""
         for item in self.operations:
@@ -309,13 +347,87 @@ class ServiceProvider(object):
                 return item
         raise KeyError, "No operation named %s" % name
         
-class ContentMetadata:
+# parsers of the MetadataURL documents, by MetadataURL type
+_METADATA_PARSERS = ((('FGDC',), Metadata), (('TC211',), MD_Metadata))
+
+def _parse_remote_metadata(metadataUrl, doc):
+    parse_metadata_url(metadataUrl, doc, _METADATA_PARSERS)
+
+
+class LazyContents(DictMixin):
+    """
+    Mapping of layer names to ContentMetadata, as WebMapService.contents.
+
+    Only the Layer elements and their names are indexed up front, the
+    ContentMetadata of a layer (and of its parents, from which it inherits
+    CRS options, styles and bounding boxes) is built on first access.
+    """
+    def __init__(self, elem, parse_remote_metadata=False, session=None):
+        self._parse_remote_metadata = parse_remote_metadata
+        self._session = session
+        # layer name -> [element, parent entry, index, metadata]
+        self._entries = {}
+
+        def index_layers(parent_elem, parent_entry):
+            for index, elem in enumerate(parent_elem.findall('Layer')):
+                entry = [elem, parent_entry, index+1, None]
+                name = testXMLValue(elem.find('Name'))
+                if name:
+                    if name in self._entries:
+                        warnings.warn('Content metadata for layer "%s" already exists. Using child layer' % name)
+                    self._entries[name] = entry
+                index_layers(elem, entry)
+        index_layers(elem, None)
+
+    def _metadata(self, entry):
+        if entry[3] is None:
+            parent = None
+            if entry[1] is not None:
+                parent = self._metadata(entry[1])
+            entry[3] = ContentMetadata(entry[0], parent=parent, index=entry[2],
+                                       parse_remote_metadata=self._parse_remote_metadata, lazy=True,
+                                       session=self._session)
+        return entry[3]
+
+    def __getitem__(self, name):
+        return self._metadata(self._entries[name])
+
+    def __setitem__(self, name, metadata):
+        self._entries[name] = [None, None, 0, metadata]
+
+    def __delitem__(self, name):
+        del self._entries[name]
+
+    def __contains__(self, name):
+        return name in self._entries
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def keys(self):
+        return self._entries.keys()
+
+    def __repr__(self):
+        return '<LazyContents: %d layers>' % len(self._entries)
+
+    def __getstate__(self):
+        # the metadata of all layers, without the elements
+        entries = dict((name, [None, None, entry[2], self._metadata(entry)])
+                       for name, entry in self._entries.iteritems())
+        return {'_parse_remote_metadata': self._parse_remote_metadata, '_session': None, '_entries': entries}
+
+
+class ContentMetadata(object):
     """
     Abstraction for WMS layer metadata.
 
     Implements IContentMetadata.
     """
-    def __init__(self, elem, parent=None, index=0, parse_remote_metadata=False, timeout=30):
+    def __init__(self, elem, parent=None, index=0, parse_remote_metadata=False, timeout=30, lazy=False,
+                 session=None):
         if elem.tag != 'Layer':
             raise ValueError('%s should be a Layer' % (elem,))
         
@@ -477,13 +589,9 @@ class ContentMetadata:
 
             if metadataUrl['url'] is not None and parse_remote_metadata:  # download URL
                 try:
-                    content = urllib2.urlopen(metadataUrl['url'], timeout=timeout)
+                    content = http_open(metadataUrl['url'], timeout=timeout, session=session)
                     doc = etree.parse(content)
-                    if metadataUrl['type'] is not None:
-                        if metadataUrl['type'] == 'FGDC':
-                            metadataUrl['metadata'] = Metadata(doc)
-                        if metadataUrl['type'] == 'TC211':
-                            metadataUrl['metadata'] = MD_Metadata(doc)
+                    _parse_remote_metadata(metadataUrl, doc)
                 except Exception, err:
                     metadataUrl['metadata'] = None
 
@@ -498,9 +606,27 @@ class ContentMetadata:
             }
             self.dataUrls.append(dataUrl)
                 
-        self.layers = []
-        for child in elem.findall('Layer'):
-            self.layers.append(ContentMetadata(child, self))
+        # child layers are built on first access when lazy
+        self._elem = None
+        self._layers = None
+        if lazy:
+            self._elem = elem
+        else:
+            self._layers = [ContentMetadata(child, self) for child in elem.findall('Layer')]
+
+    @property
+    def layers(self):
+        if self._layers is None:
+            self._layers = [ContentMetadata(child, self, lazy=True) for child in self._elem.findall('Layer')]
+            self._elem = None
+        return self._layers
+
+    def __getstate__(self):
+        # the child layers, without the element
+        state = self.__dict__.copy()
+        state['_layers'] = self.layers
+        state['_elem'] = None
+        return state
 
     def __str__(self):
         return 'Layer Name: %s Title: %s' % (self.name, self.title)
@@ -569,13 +695,15 @@ class WMSCapabilitiesReader:
     """Read and parse capabilities document into a lxml.etree infoset
     """
 
-    def __init__(self, version='1.1.1', url=None, un=None, pw=None):
+    def __init__(self, version='1.1.1', url=None, un=None, pw=None, session=None, cache=None):
         """Initialize"""
         self.version = version
         self._infoset = None
         self.url = url
         self.username = un
         self.password = pw
+        self.session = session
+        self.cache = cache
 
         #if self.username and self.password:
             ## Provide login information in order to use the WMS server
@@ -614,10 +742,14 @@ class WMSCapabilitiesReader:
         version, and request parameters
         """
         getcaprequest = self.capabilities_url(service_url)
+        if self.cache is not None:
+            return etree.fromstring(self.cache.read(getcaprequest, self.username, self.password,
+                                                    session=self.session))
 
         #now split it up again to use the generic openURL function...
         spliturl=getcaprequest.split('?')
-        u = openURL(spliturl[0], spliturl[1], method='Get', username = self.username, password = self.password)
+        u = openURL(spliturl[0], spliturl[1], method='Get', username = self.username, password = self.password,
+                    session=self.session)
         return etree.fromstring(u.read())
 
     def readString(self, st):
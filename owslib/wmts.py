@@ -29,16 +29,28 @@ would be appreciated.
 
 """
 
+import math
+import re
 import warnings
+import threading
+import time
 import urlparse
 import urllib2
-from urllib import urlencode
+from urllib import urlencode, quote, quote_plus
 from etree import etree
-from .util import openURL, testXMLValue, getXMLInteger
+from .cache import CachedTile
+from .crs import Crs
+from .util import openURL, testXMLValue, getXMLInteger, Session, \
+    concurrent_map, is_transient_error, log, OrderedDict, reraise
 from fgdc import Metadata
 from iso import MD_Metadata
 from ows import ServiceProvider, ServiceIdentification, OperationsMetadata
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 _OWS_NS = '{http://www.opengis.net/ows/1.1}'
 _WMTS_NS = '{http://www.opengis.net/wmts/1.0}'
@@ -83,6 +95,10 @@ _TOP_LEFT_CORNER_TAG = _WMTS_NS + 'TopLeftCorner'
 
 _HREF_TAG = _XLINK_NS + 'href'
 
+# the tile URL builders kept by a service are cleared beyond this number,
+# as they are also kept for the values of per-call dimensions e.g. TIME
+_TILE_URL_BUILDERS_SIZE = 200
+
 
 class ServiceException(Exception):
     """WMTS ServiceException
@@ -120,7 +136,8 @@ class WebMapTileService(object):
 
     def __init__(self, url, version='1.0.0', xml=None, username=None,
                  password=None, parse_remote_metadata=False,
-                 vendor_kwargs=None):
+                 vendor_kwargs=None, session=None, cache=None,
+                 tile_cache=None):
         """Initialize.
 
         Parameters
@@ -141,6 +158,12 @@ class WebMapTileService(object):
         vendor_kwargs : dict
             Optional vendor-specific parameters to be included in all
             requests.
+        session : owslib.util.Session
+            Optional pooled HTTP transport shared between requests.
+        cache : owslib.cache.CapabilitiesCache
+            Optional on-disk cache of the GetCapabilities document.
+        tile_cache : owslib.cache.TileCache
+            Optional local cache of the tiles of gettile and gettiles.
 
         """
         self.url = url
@@ -148,11 +171,16 @@ class WebMapTileService(object):
         self.password = password
         self.version = version
         self.vendor_kwargs = vendor_kwargs
+        self.session = session
+        self.cache = cache
+        self.tile_cache = tile_cache
         self._capabilities = None
+        self._tile_url_builders = {}
 
         # Authentication handled by Reader
         reader = WMTSCapabilitiesReader(self.version, url=self.url,
-                                        un=self.username, pw=self.password)
+                                        un=self.username, pw=self.password,
+                                        session=self.session, cache=self.cache)
 
         if xml:  # read from stored xml
             self._capabilities = reader.readString(xml)
@@ -173,7 +201,8 @@ class WebMapTileService(object):
     def _getcapproperty(self):
         if not self._capabilities:
             reader = WMTSCapabilitiesReader(
-                self.version, url=self.url, un=self.username, pw=self.password
+                self.version, url=self.url, un=self.username, pw=self.password,
+                session=self.session, cache=self.cache
                 )
             xml = reader.read(self.url, self.vendor_kwargs)
             self._capabilities = ServiceMetadata(xml)
@@ -286,16 +315,6 @@ LAYER=VIIRS_CityLights_2012&STYLE=default&TILEMATRIXSET=EPSG4326_500m&\
 TILEMATRIX=6&TILEROW=4&TILECOL=4&FORMAT=image%2Fjpeg'
 
         """
-        request = {'version': self.version, 'request': 'GetTile'}
-
-        if (layer is None):
-            raise ValueError("layer is mandatory (cannot be None)")
-        if style is None:
-            style = self[layer].styles.keys()[0]
-        if format is None:
-            format = self[layer].formats[0]
-        if tilematrixset is None:
-            tilematrixset = sorted(self[layer].tilematrixsetlinks.keys())[0]
         if tilematrix is None:
             msg = 'tilematrix (zoom level) is mandatory (cannot be None)'
             raise ValueError(msg)
@@ -304,23 +323,70 @@ TILEMATRIX=6&TILEROW=4&TILECOL=4&FORMAT=image%2Fjpeg'
         if column is None:
                 raise ValueError("column is mandatory (cannot be None)")
 
-        request = list()
-        request.append(('SERVICE', 'WMTS'))
-        request.append(('REQUEST', 'GetTile'))
-        request.append(('VERSION', '1.0.0'))
-        request.append(('LAYER', layer))
-        request.append(('STYLE', style))
-        request.append(('TILEMATRIXSET', tilematrixset))
-        request.append(('TILEMATRIX', tilematrix))
-        request.append(('TILEROW', str(row)))
-        request.append(('TILECOL', str(column)))
-        request.append(('FORMAT', format))
+        builder = self.tileurlbuilder(layer, style, format, tilematrixset,
+                                      **kwargs)
+        return builder.query(tilematrix, row, column)
 
-        for key, value in kwargs.iteritems():
-            request.append((key, value))
+    def tileurlbuilder(self, layer=None, style=None, format=None,
+                       tilematrixset=None, base_url=None, rest=False,
+                       **kwargs):
+        """Return the TileURLBuilder of GetTile requests for a layer.
 
-        data = urlencode(request, True)
-        return data
+        Builders are kept by the service, so the defaults of the layer and
+        the constant part of the URL are only worked out once; they are
+        cleared beyond _TILE_URL_BUILDERS_SIZE builders.
+
+        Parameters
+        ----------
+        layer, style, format, tilematrixset, base_url :
+            As for gettile.
+        rest : bool
+            Optional. Use the tile ResourceURL template of the layer
+            instead of KVP requests.
+        **kwargs : extra arguments
+            anything else e.g. vendor specific parameters, or values of
+            the dimensions of ResourceURL templates
+
+        """
+        try:
+            key = (layer, style, format, tilematrixset, base_url, rest,
+                   tuple(sorted(kwargs.items())))
+            hash(key)
+        except TypeError:  # unhashable vendor parameters
+            key = None
+        builder = self._tile_url_builders.get(key)
+        if builder is not None:
+            return builder
+
+        if (layer is None):
+            raise ValueError("layer is mandatory (cannot be None)")
+        if style is None:
+            style = self[layer].styles.keys()[0]
+        if format is None:
+            format = self[layer].formats[0]
+        if tilematrixset is None:
+            tilematrixset = sorted(self[layer].tilematrixsetlinks.keys())[0]
+
+        template = None
+        if rest:
+            for resource in self[layer].resourceURLs:
+                if resource['resourceType'] == 'tile' and \
+                        resource['format'] == format:
+                    template = resource['template']
+                    break
+            else:
+                raise ValueError('Layer %s has no tile ResourceURL in %s'
+                                 % (layer, format))
+        elif base_url is None:
+            base_url = self._gettile_base_url()
+
+        builder = TileURLBuilder(base_url, layer, style, format,
+                                 tilematrixset, template, **kwargs)
+        if key is not None:
+            if len(self._tile_url_builders) >= _TILE_URL_BUILDERS_SIZE:
+                self._tile_url_builders.clear()
+            self._tile_url_builders[key] = builder
+        return builder
 
     def gettile(self, base_url=None, layer=None, style=None, format=None,
                 tilematrixset=None, tilematrix=None, row=None, column=None,
@@ -370,33 +436,184 @@ TILEMATRIX=6&TILEROW=4&TILECOL=4&FORMAT=image%2Fjpeg'
             >>> out.close()
 
         """
-        vendor_kwargs = self.vendor_kwargs or {}
+        if tilematrix is None:
+            msg = 'tilematrix (zoom level) is mandatory (cannot be None)'
+            raise ValueError(msg)
+        if row is None:
+                raise ValueError("row is mandatory (cannot be None)")
+        if column is None:
+                raise ValueError("column is mandatory (cannot be None)")
+
+        vendor_kwargs = dict(self.vendor_kwargs or {})
         vendor_kwargs.update(kwargs)
-        data = self.buildTileRequest(layer, style, format, tilematrixset,
-                                     tilematrix, row, column, **vendor_kwargs)
-
-        if base_url is None:
-            base_url = self.url
-            try:
-                get_verbs = filter(
-                    lambda x: x.get('type').lower() == 'get',
-                    self.getOperationByName('GetTile').methods)
-                if len(get_verbs) > 1:
-                    # Filter by constraints
-                    base_url = next(
-                        x for x in filter(
-                            list,
-                            ([pv.get('url')
-                                for const in pv.get('constraints')
-                                if 'kvp' in map(
-                                    lambda x: x.lower(), const.values)]
-                             for pv in get_verbs if pv.get('constraints'))))[0]
-                elif len(get_verbs) == 1:
-                    base_url = get_verbs[0].get('url')
-            except StopIteration:
-                pass
+        builder = self.tileurlbuilder(layer, style, format, tilematrixset,
+                                      base_url, **vendor_kwargs)
+        url = builder.url(tilematrix, row, column)
+        if self.tile_cache is None:
+            return self._opentile(url, self.session)
+        data = self.tile_cache.read(
+            self._tilecachekey(builder, tilematrix, row, column),
+            lambda: self._opentile(url, self.session).read())
+        return CachedTile(data, url, builder.format)
+
+    def gettiles(self, layer=None, style=None, format=None,
+                 tilematrixset=None, tilematrix=None, rows=None,
+                 columns=None, bbox=None, base_url=None, rest=False,
+                 max_workers=8,
+                 max_per_host=4, retries=3, backoff=0.5, timeout=30,
+                 **kwargs):
+        """Fetch a block of tiles from the WMTS concurrently.
+
+        Yields (row, column, data) tuples as the tiles are downloaded,
+        data being the tile image as a string.  Requests failing with a
+        transient error (connection failure, timeout or an HTTP 408, 429 or
+        5xx status) are retried; a tile which cannot be fetched raises its
+        error.
+
+        Parameters
+        ----------
+        layer, style, format, tilematrixset, tilematrix, base_url :
+            As for gettile.
+        rest : bool
+            Optional. Use the tile ResourceURL template of the layer
+            instead of KVP requests.
+        rows : sequence of integers
+            Row indices of the tiles to request, for instance range(4, 8).
+        columns : sequence of integers
+            Column indices of the tiles to request.
+        bbox : (minx, miny, maxx, maxy)
+            Optional, instead of rows and columns. Request the tiles
+            covering bbox, in the CRS of the tile matrix set with x east
+            and y north, within the TileMatrixLimits of the layer.
+        max_workers : integer
+            Number of tiles downloaded at the same time.
+        max_per_host : integer
+            Maximum number of tiles downloaded at the same time from one
+            host.
+        retries : integer
+            Number of times a request failing with a transient error is
+            retried.
+        backoff : float
+            Seconds to wait before the first retry, doubled for each
+            further retry.
+        timeout : integer
+            Timeout of each request in seconds.
+        **kwargs : extra arguments
+            anything else e.g. vendor specific parameters
+
+        Example
+        -------
+            for row, column, data in wmts.gettiles(
+                    layer='VIIRS_CityLights_2012',
+                    tilematrixset='EPSG4326_500m', tilematrix='6',
+                    rows=range(4, 8), columns=range(4, 8)):
+                open('tile_%d_%d.jpg' % (row, column), 'wb').write(data)
+
+        """
+        if bbox is None and (rows is None or columns is None):
+            raise ValueError("rows and columns are mandatory (cannot be None)")
+        if tilematrix is None:
+            msg = 'tilematrix (zoom level) is mandatory (cannot be None)'
+            raise ValueError(msg)
+        vendor_kwargs = dict(self.vendor_kwargs or {})
+        vendor_kwargs.update(kwargs)
+        builder = self.tileurlbuilder(layer, style, format, tilematrixset,
+                                      base_url, rest, **vendor_kwargs)
+        if bbox is not None:
+            tms = self.tilematrixsets[builder.tilematrixset]
+            limits = None
+            link = self[builder.layer].tilematrixsetlinks.get(tms.identifier)
+            if link is not None:
+                limits = link.tilematrixlimits.get(tilematrix)
+            tilerange = tms.tilematrix[tilematrix].tilerange(bbox, tms.crs,
+                                                             limits)
+            if tilerange is None:
+                return
+            rows = range(tilerange[0], tilerange[1] + 1)
+            columns = range(tilerange[2], tilerange[3] + 1)
+
+        # a private connection pool, unless the service has a session
+        session = self.session
+        if session is None:
+            session = Session(pool_size=max_per_host)
+
+        host_limits = {}
+        lock = threading.Lock()
+
+        def host_limit(url):
+            host = urlparse.urlsplit(url).netloc
+            with lock:
+                if host not in host_limits:
+                    host_limits[host] = threading.BoundedSemaphore(max_per_host)
+                return host_limits[host]
+
+        def download(url):
+            attempt = 0
+            while True:
+                try:
+                    with host_limit(url):
+                        return self._opentile(url, session, timeout).read()
+                except Exception, e:
+                    if attempt >= retries or not is_transient_error(e):
+                        raise
+                    log.debug('Retrying tile %s: %s' % (url, e))
+                    time.sleep(backoff * 2 ** attempt)
+                    attempt += 1
+
+        def fetch(tile):
+            url = builder.url(tilematrix, tile[0], tile[1])
+            if self.tile_cache is None:
+                return download(url)
+            return self.tile_cache.read(
+                self._tilecachekey(builder, tilematrix, tile[0], tile[1]),
+                lambda: download(url))
+
+        tiles = [(row, column) for row in rows for column in columns]
+        try:
+            for tile, data, error in concurrent_map(fetch, tiles, max_workers):
+                if error is not None:
+                    reraise(error)
+                yield tile[0], tile[1], data
+        finally:
+            if session is not self.session:
+                session.close()
+
+    def _tilecachekey(self, builder, tilematrix, row, column):
+        """Return the tile cache key of a tile"""
+        service = self.url
+        if builder.kwargs:
+            # vendor parameters and dimensions select other tiles
+            service += '?' + urlencode(sorted(builder.kwargs.items()), True)
+        return (service, builder.layer, builder.style, builder.format,
+                builder.tilematrixset, tilematrix, row, column)
+
+    def _gettile_base_url(self):
+        """Return the URL of the KVP GetTile operation"""
+        base_url = self.url
+        try:
+            get_verbs = filter(
+                lambda x: x.get('type').lower() == 'get',
+                self.getOperationByName('GetTile').methods)
+            if len(get_verbs) > 1:
+                # Filter by constraints
+                base_url = next(
+                    x for x in filter(
+                        list,
+                        ([pv.get('url')
+                            for const in pv.get('constraints')
+                            if 'kvp' in map(
+                                lambda x: x.lower(), const.values)]
+                         for pv in get_verbs if pv.get('constraints'))))[0]
+            elif len(get_verbs) == 1:
+                base_url = get_verbs[0].get('url')
+        except StopIteration:
+            pass
+        return base_url
+
+    def _opentile(self, url, session, timeout=30):
+        base_url, _, data = url.partition('?')
         u = openURL(base_url, data, username=self.username,
-                    password=self.password)
+                    password=self.password, timeout=timeout, session=session)
 
         # check for service exceptions, and return
         if u.info()['Content-Type'] == 'application/vnd.ogc.se_xml':
@@ -423,6 +640,154 @@ TILEMATRIX=6&TILEROW=4&TILECOL=4&FORMAT=image%2Fjpeg'
         raise KeyError("No operation named %s" % name)
 
 
+class TileURLBuilder(object):
+    """
+    Compiled GetTile URL builder for one layer, style, format and tile
+    matrix set, made by WebMapTileService.tileurlbuilder.
+
+    The constant part of the URL is worked out once, rendering the URL of
+    a tile is a single string formatting operation.  KVP requests are sent
+    to base_url, RESTful requests follow a ResourceURL template.
+    """
+    # template variables which vary from tile to tile
+    _TILE_VARIABLES = ('tilematrix', 'tilerow', 'tilecol')
+
+    def __init__(self, base_url, layer, style, format, tilematrixset,
+                 template=None, **kwargs):
+        self.layer = layer
+        self.style = style
+        self.format = format
+        self.tilematrixset = tilematrixset
+        self.template = template
+        self.kwargs = kwargs
+        # tile variables not in TileMatrix, TileRow, TileCol order
+        self._named = False
+        # quoted TileMatrix identifiers
+        self._matrices = {}
+        if template is None:
+            prefix = base_url
+            if '?' not in base_url:
+                prefix += '?'
+            elif base_url[-1] not in '?&':
+                prefix += '&'
+            head = urlencode([('SERVICE', 'WMTS'), ('REQUEST', 'GetTile'),
+                              ('VERSION', '1.0.0'), ('LAYER', layer),
+                              ('STYLE', style),
+                              ('TILEMATRIXSET', tilematrixset)], True)
+            tail = urlencode([('FORMAT', format)] + kwargs.items(), True)
+            self._query_format = (head.replace('%', '%%') +
+                                  '&TILEMATRIX=%s&TILEROW=%s&TILECOL=%s&' +
+                                  tail.replace('%', '%%'))
+            self._format = prefix.replace('%', '%%') + self._query_format
+        else:
+            values = {'layer': layer, 'style': style,
+                      'tilematrixset': tilematrixset}
+            values.update((k.lower(), v) for k, v in kwargs.iteritems())
+            order = []
+            parts = re.split(r'\{(\w+)\}', template)
+            for i in range(len(parts)):
+                if i % 2 == 0:
+                    parts[i] = parts[i].replace('%', '%%')
+                    continue
+                name = parts[i].lower()
+                if name in self._TILE_VARIABLES:
+                    order.append(self._TILE_VARIABLES.index(name))
+                    parts[i] = '%(' + name + ')s'
+                elif name in values:
+                    parts[i] = self._quote(values[name]).replace('%', '%%')
+                else:
+                    raise ValueError('No value for {%s} in %s'
+                                     % (parts[i], template))
+            self._format = ''.join(parts)
+            if order == [0, 1, 2]:
+                # the common case, formatted from a tuple
+                for name in self._TILE_VARIABLES:
+                    self._format = self._format.replace('%(' + name + ')s',
+                                                        '%s')
+            else:
+                self._named = True
+
+    def _quote(self, value):
+        if self.template is None:
+            return quote_plus(value)
+        return quote(value, '')
+
+    def _matrix(self, tilematrix):
+        quoted = self._matrices.get(tilematrix)
+        if quoted is None:
+            quoted = self._matrices[tilematrix] = self._quote(str(tilematrix))
+        return quoted
+
+    def url(self, tilematrix, row, column):
+        """Return the URL of a tile"""
+        if self._named:
+            return self._format % {'tilematrix': self._matrix(tilematrix),
+                                   'tilerow': row, 'tilecol': column}
+        return self._format % (self._matrix(tilematrix), row, column)
+
+    def query(self, tilematrix, row, column):
+        """Return the URL-encoded parameters of a KVP GetTile request"""
+        if self.template is not None:
+            raise ValueError('ResourceURL templates have no KVP parameters')
+        return self._query_format % (self._matrix(tilematrix), row, column)
+
+
+# size of a pixel (in meters) of the well-known scale sets of WMTS
+_PIXEL_SIZE = 0.00028
+# meters per degree, for tile matrix sets of geographic CRSs
+_METERS_PER_DEGREE = 6378137 * 2 * math.pi / 360
+_GEOGRAPHIC_OGC_CODES = ('CRS84', 'CRS83', 'CRS27')
+# fraction of a tile ignored at the edges of a bbox (rounding errors)
+_TILE_EPSILON = 1e-6
+
+
+def _meters_per_unit(crs):
+    """Return the meters per unit of a Crs, for the scale denominators"""
+    if crs.authority == 'OGC' and crs.code in _GEOGRAPHIC_OGC_CODES:
+        return _METERS_PER_DEGREE
+    if crs.authority == 'EPSG' and isinstance(crs.code, int) and \
+            4000 <= crs.code < 5000:
+        return _METERS_PER_DEGREE
+    return 1.0
+
+
+def _tile_range(bbox, x0, y0, dx, dy, bounds):
+    """
+    Return the (minrow, maxrow, mincol, maxcol) range of the tiles of
+    size dx, dy from the top left corner x0, y0 which cover bbox,
+    clipped to bounds, or None when no tile is left.
+
+    """
+    minx, miny, maxx, maxy = bbox
+    mincol = int(math.floor((minx - x0) / dx + _TILE_EPSILON))
+    maxcol = max(int(math.ceil((maxx - x0) / dx - _TILE_EPSILON)) - 1, mincol)
+    minrow = int(math.floor((y0 - maxy) / dy + _TILE_EPSILON))
+    maxrow = max(int(math.ceil((y0 - miny) / dy - _TILE_EPSILON)) - 1, minrow)
+    minrow, maxrow = max(minrow, bounds[0]), min(maxrow, bounds[1])
+    mincol, maxcol = max(mincol, bounds[2]), min(maxcol, bounds[3])
+    if minrow > maxrow or mincol > maxcol:
+        return None
+    return (minrow, maxrow, mincol, maxcol)
+
+
+def _tile_bboxes(rows, columns, x0, y0, dx, dy):
+    """
+    Return the (minx, miny, maxx, maxy) bboxes of the tiles at rows and
+    columns, as an array of shape (n, 4) when numpy is available.
+
+    """
+    if numpy is not None:
+        minx = x0 + numpy.asarray(columns, dtype=float) * dx
+        maxy = y0 - numpy.asarray(rows, dtype=float) * dy
+        return numpy.column_stack((minx, maxy - dy, minx + dx, maxy))
+    bboxes = []
+    for row, column in zip(rows, columns):
+        minx = x0 + column * dx
+        maxy = y0 - row * dy
+        bboxes.append((minx, maxy - dy, minx + dx, maxy))
+    return bboxes
+
+
 class TileMatrixSet(object):
     '''Holds one TileMatrixSet'''
     def __init__(self, elem):
@@ -441,6 +806,43 @@ class TileMatrixSet(object):
                                    'already exists' % tm.identifier)
                 self.tilematrix[tm.identifier] = tm
 
+    def tileranges(self, bbox, tilematrixsetlink=None, metersperunit=None):
+        """
+        Return the ranges of the tiles covering a bounding box, for each
+        tile matrix from the smallest to the largest scale.
+
+        Parameters
+        ----------
+
+        - bbox: (minx, miny, maxx, maxy) in the CRS of the tile matrix
+          set, with x east and y north whatever the axis order of the CRS
+        - tilematrixsetlink: a TileMatrixSetLink of a layer, whose
+          TileMatrixLimits clip the ranges
+        - metersperunit: meters per CRS unit, by default guessed from
+          the CRS (geographic or projected)
+
+        Returns an ordered dictionary of (minrow, maxrow, mincol, maxcol)
+        ranges, or None where no tile is left, by tile matrix identifier.
+
+        """
+        crs = Crs(self.crs)
+        if metersperunit is None:
+            metersperunit = _meters_per_unit(crs)
+        limits = {}
+        if tilematrixsetlink is not None:
+            limits = tilematrixsetlink.tilematrixlimits
+            if limits and tilematrixsetlink.tilematrixset != self.identifier:
+                raise ValueError('TileMatrixSetLink of %s used with %s' %
+                                 (tilematrixsetlink.tilematrixset,
+                                  self.identifier))
+        matrices = sorted(self.tilematrix.values(),
+                          key=lambda tm: -tm.scaledenominator)
+        ranges = OrderedDict()
+        for tm in matrices:
+            ranges[tm.identifier] = tm.tilerange(
+                bbox, crs, limits.get(tm.identifier), metersperunit)
+        return ranges
+
 
 class TileMatrix(object):
     '''Holds one TileMatrix'''
@@ -472,6 +874,63 @@ class TileMatrix(object):
         self.matrixwidth = int(mw)
         self.matrixheight = int(mh)
 
+    def _geometry(self, crs, metersperunit=None):
+        """Return the x, y top left corner and the x, y size of a tile"""
+        if not isinstance(crs, Crs):
+            crs = Crs(crs)
+        if metersperunit is None:
+            metersperunit = _meters_per_unit(crs)
+        x0, y0 = self.topleftcorner
+        if crs.axisorder == 'yx':
+            x0, y0 = y0, x0
+        span = self.scaledenominator * _PIXEL_SIZE / metersperunit
+        return x0, y0, span * self.tilewidth, span * self.tileheight
+
+    def tilerange(self, bbox, crs, limits=None, metersperunit=None):
+        """
+        Return the (minrow, maxrow, mincol, maxcol) range of the tiles
+        covering a bounding box, clipped to the matrix and to limits, or
+        None when no tile is left.
+
+        Parameters
+        ----------
+
+        - bbox: (minx, miny, maxx, maxy), with x east and y north
+        - crs: the CRS of the tile matrix set, as a string or Crs
+        - limits: the TileMatrixLimits of a layer in this matrix
+        - metersperunit: meters per CRS unit, guessed from the CRS by
+          default
+
+        """
+        x0, y0, dx, dy = self._geometry(crs, metersperunit)
+        bounds = [0, self.matrixheight - 1, 0, self.matrixwidth - 1]
+        if limits is not None:
+            bounds = [max(bounds[0], limits.mintilerow),
+                      min(bounds[1], limits.maxtilerow),
+                      max(bounds[2], limits.mintilecol),
+                      min(bounds[3], limits.maxtilecol)]
+        return _tile_range(bbox, x0, y0, dx, dy, bounds)
+
+    def tilebbox(self, row, column, crs, metersperunit=None):
+        """Return the (minx, miny, maxx, maxy) bounding box of a tile"""
+        x0, y0, dx, dy = self._geometry(crs, metersperunit)
+        minx = x0 + column * dx
+        maxy = y0 - row * dy
+        return (minx, maxy - dy, minx + dx, maxy)
+
+    def tilebboxes(self, rows, columns, crs, metersperunit=None):
+        """
+        Return the (minx, miny, maxx, maxy) bounding boxes of a batch of
+        tiles, given as sequences (or numpy arrays) of rows and columns.
+
+        The bounding boxes are computed at once in a numpy array of shape
+        (n, 4) when numpy is installed, and are a list of tuples
+        otherwise.
+
+        """
+        x0, y0, dx, dy = self._geometry(crs, metersperunit)
+        return _tile_bboxes(rows, columns, x0, y0, dx, dy)
+
 
 class Theme:
     """
@@ -688,13 +1147,16 @@ class WMTSCapabilitiesReader:
     """Read and parse capabilities document into a lxml.etree infoset
     """
 
-    def __init__(self, version='1.0.0', url=None, un=None, pw=None):
+    def __init__(self, version='1.0.0', url=None, un=None, pw=None,
+                 session=None, cache=None):
         """Initialize"""
         self.version = version
         self._infoset = None
         self.url = url
         self.username = un
         self.password = pw
+        self.session = session
+        self.cache = cache
 
     def capabilities_url(self, service_url, vendor_kwargs=None):
         """Return a capabilities url
@@ -726,11 +1188,16 @@ class WMTSCapabilitiesReader:
         parameters can also be supplied as a dict.
         """
         getcaprequest = self.capabilities_url(service_url, vendor_kwargs)
+        if self.cache is not None:
+            return etree.fromstring(self.cache.read(
+                getcaprequest, self.username, self.password,
+                session=self.session))
 
         # now split it up again to use the generic openURL function...
         spliturl = getcaprequest.split('?')
         u = openURL(spliturl[0], spliturl[1], method='Get',
-                    username=self.username, password=self.password)
+                    username=self.username, password=self.password,
+                    session=self.session)
         return etree.fromstring(u.read())
 
     def readString(self, st):
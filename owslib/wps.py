@@ -87,8 +87,16 @@ Also, the directory tests/ contains several examples of well-formed "Execute" re
 from owslib.etree import etree
 from owslib.ows import DEFAULT_OWS_NAMESPACE, ServiceIdentification, ServiceProvider, OperationsMetadata
 from time import sleep
+import heapq
+import httplib
+import re
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+from xml.sax.saxutils import escape
 from owslib.util import (testXMLValue, build_get_url, dump, getTypedValue, 
-                  getNamespace, element_to_string, nspath, openURL, nspath_eval, log)
+                  getNamespace, element_to_string, nspath, openURL, nspath_eval, log,
+                  is_transient_error, concurrent_map, reraise)
 from xml.dom.minidom import parseString
 from owslib.namespaces import Namespaces
 
@@ -108,6 +116,9 @@ DRAW_SCHEMA_LOCATION = 'http://cida.usgs.gov/climate/derivative/xsd/draw.xsd'
 WPS_DEFAULT_SCHEMA_LOCATION = 'http://schemas.opengis.net/wps/1.0.0/wpsExecute_request.xsd'
 WPS_DEFAULT_VERSION = '1.0.0'
 
+# characters lxml does not accept in the text of a request
+_XML_INCOMPATIBLE = re.compile(r'[^\t\n\r\x20-\x7f]')
+
 def get_namespaces():
     ns = n.get_namespaces(["ogc","wfs","wps","gml","xsi","xlink"])
     ns[None]  = n.get_namespace("wps")
@@ -158,11 +169,15 @@ class WebProcessingService(object):
     Implements IWebProcessingService.
     """
     
-    def __init__(self, url, version=WPS_DEFAULT_VERSION, username=None, password=None, verbose=False, skip_caps=False):
+    def __init__(self, url, version=WPS_DEFAULT_VERSION, username=None, password=None, verbose=False, skip_caps=False,
+                 session=None, cache=None, registry=None):
         """
         Initialization method resets the object status.
         By default it will execute a GetCapabilities invocation to the remote service, 
         which can be skipped by using skip_caps=True.
+        An optional util.Session may be given to pool HTTP connections between requests,
+        an optional cache.CapabilitiesCache to keep the GetCapabilities document on disk,
+        and an optional ProcessRegistry to reuse the process descriptions of earlier DescribeProcess requests.
         """
         
         # fields passed in from object initializer
@@ -171,6 +186,9 @@ class WebProcessingService(object):
         self.password = password
         self.version = version
         self.verbose = verbose
+        self.session = session
+        self.cache = cache
+        self.registry = registry
                 
         # fields populated by method invocations
         self._capabilities = None
@@ -178,6 +196,7 @@ class WebProcessingService(object):
         self.provider = None
         self.operations=[]
         self.processes=[]
+        self._templates = {}
 
         if not skip_caps:
             self.getcapabilities()
@@ -189,7 +208,8 @@ class WebProcessingService(object):
         """
         
         # read capabilities document
-        reader = WPSCapabilitiesReader(version=self.version, verbose=self.verbose)
+        reader = WPSCapabilitiesReader(version=self.version, verbose=self.verbose, session=self.session,
+                                       cache=self.cache)
         if xml:
             # read from stored XML file
             self._capabilities = reader.readFromString(xml)
@@ -205,21 +225,44 @@ class WebProcessingService(object):
         """
         Requests a process document from a WPS service and populates the process metadata.
         Returns the process object.
+        identifier may also be a list of identifiers, described in a single request (identifier=a,b,c):
+        the list of process objects is returned then, None for processes the server did not describe.
+        With a registry, processes described already are taken from it and only the others are requested.
         """
         
-        # read capabilities document
-        reader = WPSDescribeProcessReader(version=self.version, verbose=self.verbose)
-        if xml:
-            # read from stored XML file
-            rootElement = reader.readFromString(xml)
-        else:
-            # read from server
-            rootElement = reader.readFromUrl(self.url, identifier)
-            
-        log.info(element_to_string(rootElement))
+        identifiers = identifier if isinstance(identifier, list) else [identifier]
+        processes = {}
+        if self.registry is not None and not xml:
+            for id in identifiers:
+                process = self.registry.get(self.url, id, self.version)
+                if process is not None:
+                    processes[id] = self._addProcess(process)
+        missing = [id for id in identifiers if id not in processes]
+        
+        if missing:
+            # read capabilities document
+            reader = WPSDescribeProcessReader(version=self.version, verbose=self.verbose, session=self.session)
+            if xml:
+                # read from stored XML file
+                rootElement = reader.readFromString(xml)
+            else:
+                # read from server
+                rootElement = reader.readFromUrl(self.url, ','.join(missing))
+                
+            log.info(element_to_string(rootElement))
 
-        # build metadata objects
-        return self._parseProcessMetadata(rootElement)
+            # build metadata objects
+            described = self._parseProcessDescriptions(rootElement)
+            for process in described:
+                processes[process.identifier] = process
+                if self.registry is not None and not xml:
+                    self.registry.put(self.url, process, self.version)
+            if not isinstance(identifier, list):
+                return described[0]
+        
+        if isinstance(identifier, list):
+            return [processes.get(id) for id in identifiers]
+        return processes[identifier]
         
     def execute(self, identifier, inputs, output=None, request=None, response=None):
         """
@@ -231,17 +274,24 @@ class WebProcessingService(object):
         output: optional identifier for process output reference (if not provided, output will be embedded in the response)
         request: optional pre-built XML request document, prevents building of request from other arguments
         response: optional pre-built XML response document, prevents submission of request to live WPS server
+        
+        Requests with LiteralData inputs only are rendered from an ExecuteRequestTemplate kept per identifier,
+        input keys and output, so repeated executions only fill in the input values.
         """
         
         # instantiate a WPSExecution object
         log.info('Executing WPS request...')
-        execution = WPSExecution(version=self.version, url=self.url, username=self.username, password=self.password, verbose=self.verbose)
+        execution = WPSExecution(version=self.version, url=self.url, username=self.username, password=self.password, verbose=self.verbose,
+                                 session=self.session)
 
         # build XML request from parameters 
         if request is None:
-           requestElement = execution.buildRequest(identifier, inputs, output)
-           request = etree.tostring( requestElement )
-           execution.request = request   
+            if all(isinstance(val, str) for (key,val) in inputs):
+                request = self._template(identifier, inputs, output).render(inputs)
+            else:
+                requestElement = execution.buildRequest(identifier, inputs, output)
+                request = etree.tostring( requestElement )
+        execution.request = request   
         log.debug(request)
         
         # submit the request to the live server
@@ -257,15 +307,17 @@ class WebProcessingService(object):
                         
         return execution
     
-        
-    def _parseProcessMetadata(self, rootElement):
-        """
-        Method to parse a <ProcessDescriptions> XML element and returned the constructed Process object
-        """
-        
-        processDescriptionElement = rootElement.find( 'ProcessDescription' )
-        process = Process(processDescriptionElement, verbose=self.verbose)
-    
+    def _template(self, identifier, inputs, output):
+        key = (identifier, tuple(key for (key,val) in inputs),
+               tuple(output) if isinstance(output, list) else output)
+        template = self._templates.get(key)
+        if template is None:
+            if len(self._templates) >= 100:
+                self._templates.clear()
+            template = self._templates[key] = ExecuteRequestTemplate(identifier, inputs, output)
+        return template
+        
+    def _addProcess(self, process):
         # override existing processes in object metadata, if existing already
         found = False
         for n, p in enumerate(self.processes):
@@ -275,8 +327,23 @@ class WebProcessingService(object):
         # otherwise add it
         if not found:
             self.processes.append(process)
-            
         return process
+        
+    def _parseProcessMetadata(self, rootElement):
+        """
+        Method to parse a <ProcessDescriptions> XML element and returned the constructed Process object
+        """
+        
+        processDescriptionElement = rootElement.find( 'ProcessDescription' )
+        return self._addProcess(Process(processDescriptionElement, verbose=self.verbose))
+        
+    def _parseProcessDescriptions(self, rootElement):
+        """
+        Method to parse all the processes of a <ProcessDescriptions> XML element and return the constructed Process objects
+        """
+        
+        return [self._addProcess(Process(element, verbose=self.verbose))
+                for element in rootElement.findall( 'ProcessDescription' )]
                 
         
     def _parseCapabilitiesMetadata(self, root):         
@@ -335,14 +402,115 @@ class WebProcessingService(object):
 
                    
         
+class ProcessRegistry(object):
+    """
+    In-memory cache of the Process objects parsed from DescribeProcess responses, by service url,
+    process identifier and service version.  A registry may be shared by several WebProcessingService
+    objects and threads.  Descriptions older than ttl seconds are requested again (None keeps them
+    until clear() is called).
+    """
+
+    def __init__(self, ttl=3600):
+        self.ttl = ttl
+        self._processes = {}
+        self._lock = threading.Lock()
+
+    def get(self, url, identifier, version=WPS_DEFAULT_VERSION):
+        """
+        Returns the registered description of a process, None if unknown or expired.
+        """
+        with self._lock:
+            entry = self._processes.get((url, identifier, version))
+            if entry is None:
+                return None
+            registered, process = entry
+            if self.ttl is not None and time.time() - registered >= self.ttl:
+                del self._processes[(url, identifier, version)]
+                return None
+            return process
+
+    def put(self, url, process, version=WPS_DEFAULT_VERSION):
+        with self._lock:
+            self._processes[(url, process.identifier, version)] = (time.time(), process)
+
+    def clear(self, url=None):
+        """
+        Forgets the processes of the service at url, or of all services.
+        """
+        with self._lock:
+            if url is None:
+                self._processes.clear()
+            else:
+                for key in [key for key in self._processes if key[0] == url]:
+                    del self._processes[key]
+
+
+class ExecuteRequestTemplate(object):
+    """
+    Execute request document built and serialized once, for repeated executions of a process
+    which only differ by the values of their LiteralData inputs.
+
+    identifier, inputs and output are as for WPSExecution.buildRequest(); the literal values of
+    inputs are the defaults of the rendered requests.
+    """
+
+    def __init__(self, identifier, inputs, output=None):
+        self.keys = []
+        markers = []
+        placeholders = []
+        for (key, val) in inputs:
+            if isinstance(val, str):
+                self.keys.append(key)
+                markers.append('@@owslib-input-%d@@' % len(markers))
+                placeholders.append((key, markers[-1]))
+            else:
+                placeholders.append((key, val))
+        self.defaults = [val for (key, val) in inputs if isinstance(val, str)]
+        request = etree.tostring(WPSExecution().buildRequest(identifier, placeholders, output))
+        # the serialized document, cut around the literal values
+        self._parts = []
+        for marker in markers:
+            before, request = request.split(marker)
+            self._parts.append(before)
+        self._parts.append(request)
+
+    def render(self, inputs=None):
+        """
+        Returns the Execute request document, with the literal inputs set from inputs:
+        a dictionary or a list of (key, value) tuples, repeated keys being set in order.
+        Values with control characters or non ASCII bytes raise a ValueError, as they
+        do with buildRequest().
+        """
+        values = list(self.defaults)
+        if inputs is not None:
+            items = inputs.items() if isinstance(inputs, dict) else inputs
+            used = {}
+            for (key, val) in items:
+                positions = [i for i, k in enumerate(self.keys) if k == key]
+                n = used.get(key, 0)
+                if n >= len(positions) or not isinstance(val, str):
+                    raise ValueError('Input %s is not a literal input of the request template' % key)
+                values[positions[n]] = val
+                used[key] = n + 1
+        parts = [self._parts[0]]
+        for val, part in zip(values, self._parts[1:]):
+            if _XML_INCOMPATIBLE.search(val):
+                raise ValueError('All strings must be XML compatible: Unicode or ASCII, '
+                                 'no NULL bytes or control characters')
+            parts.append(escape(val, {'\r': '&#13;'}))
+            parts.append(part)
+        return ''.join(parts)
+
+
 class WPSReader(object):
     """
     Superclass for reading a WPS document into a lxml.etree infoset.
     """
 
-    def __init__(self, version=WPS_DEFAULT_VERSION, verbose=False):        
+    def __init__(self, version=WPS_DEFAULT_VERSION, verbose=False, session=None):        
         self.version = version
         self.verbose = verbose
+        self.session = session
                 
     def _readFromUrl(self, url, data, method='Get', username=None, password=None):
         """
@@ -359,11 +527,11 @@ class WPSReader(object):
     
             # split URL into base url and query string to use utility function
             spliturl=request_url.split('?')
-            u = openURL(spliturl[0], spliturl[1], method='Get', username=username, password=password)
+            u = openURL(spliturl[0], spliturl[1], method='Get', username=username, password=password, session=self.session)
             return etree.fromstring(u.read())
         
         elif method == 'Post':
-            u = openURL(url, data, method='Post', username = username, password = password)
+            u = openURL(url, data, method='Post', username = username, password = password, session=self.session)
             return etree.fromstring(u.read())
             
         else:
@@ -384,9 +552,10 @@ class WPSCapabilitiesReader(WPSReader):
     Utility class that reads and parses a WPS GetCapabilities document into a lxml.etree infoset.
     """
     
-    def __init__(self, version=WPS_DEFAULT_VERSION, verbose=False):
+    def __init__(self, version=WPS_DEFAULT_VERSION, verbose=False, session=None, cache=None):
         # superclass initializer
-        super(WPSCapabilitiesReader,self).__init__(version=version, verbose=verbose)
+        super(WPSCapabilitiesReader,self).__init__(version=version, verbose=verbose, session=session)
+        self.cache = cache
         
     def readFromUrl(self, url, username=None, password=None):
         """
@@ -394,18 +563,20 @@ class WPSCapabilitiesReader(WPSReader):
         url: WPS service base url, to which is appended the HTTP parameters: service, version, and request.
         username, password: optional user credentials
         """
-        return self._readFromUrl(url, 
-                                 {'service':'WPS', 'request':'GetCapabilities', 'version':self.version}, 
-                                 username=username, password=password)
+        data = {'service':'WPS', 'request':'GetCapabilities', 'version':self.version}
+        if self.cache is not None:
+            return etree.fromstring(self.cache.read(build_get_url(url, data), username, password,
+                                                    session=self.session))
+        return self._readFromUrl(url, data, username=username, password=password)
             
 class WPSDescribeProcessReader(WPSReader):
     """
     Class that reads and parses a WPS DescribeProcess document into a etree infoset
     """
 
-    def __init__(self, version=WPS_DEFAULT_VERSION, verbose=False):
+    def __init__(self, version=WPS_DEFAULT_VERSION, verbose=False, session=None):
         # superclass initializer
-        super(WPSDescribeProcessReader,self).__init__(version=version, verbose=verbose)
+        super(WPSDescribeProcessReader,self).__init__(version=version, verbose=verbose, session=session)
 
                 
     def readFromUrl(self, url, identifier, username=None, password=None):
@@ -422,9 +593,9 @@ class WPSExecuteReader(WPSReader):
     """
     Class that reads and parses a WPS Execute response document into a etree infoset
     """
-    def __init__(self, verbose=False):
+    def __init__(self, verbose=False, session=None):
         # superclass initializer
-        super(WPSExecuteReader,self).__init__(verbose=verbose)
+        super(WPSExecuteReader,self).__init__(verbose=verbose, session=session)
         
     def readFromUrl(self, url, data={}, method='Get', username=None, password=None):
          """
@@ -440,7 +611,7 @@ class WPSExecution():
     Class that represents a single WPS process executed on a remote WPS service.
     """
     
-    def __init__(self, version=WPS_DEFAULT_VERSION, url=None, username=None, password=None, verbose=False):
+    def __init__(self, version=WPS_DEFAULT_VERSION, url=None, username=None, password=None, verbose=False, session=None):
         
         # initialize fields
         self.url = url
@@ -448,6 +619,7 @@ class WPSExecution():
         self.username = username
         self.password = password
         self.verbose = verbose
+        self.session = session
         
         # request document
         self.request = None
@@ -571,8 +743,21 @@ class WPSExecution():
              If not provided, the current 'statusLocation' URL will be used.
         sleepSecs: number of seconds to sleep before returning control to the caller.
         """
-                    
-        reader = WPSExecuteReader(verbose=self.verbose)
+
+        self.updateStatus(url, response)
+
+        # sleep given number of seconds
+        if self.isComplete()==False:
+            log.info('Sleeping %d seconds...' % sleepSecs)
+            sleep(sleepSecs)
+
+    def updateStatus(self, url=None, response=None):
+        """
+        Method to read and parse the current status document of a job execution, without sleeping;
+        see checkStatus.
+        """
+
+        reader = WPSExecuteReader(verbose=self.verbose, session=self.session)
         if response is None:
             # override status location
             if url is not None:
@@ -587,11 +772,6 @@ class WPSExecution():
         log.debug(self.response)
 
         self.parseResponse(response)
-                    
-        # sleep given number of seconds
-        if self.isComplete()==False:
-            log.info('Sleeping %d seconds...' % sleepSecs)
-            sleep(sleepSecs)
 
         
     def getStatus(self):
@@ -620,39 +800,52 @@ class WPSExecution():
         """
         Method to write the outputs of a WPS process to a file: 
         either retrieves the referenced files from the server, or writes out the content of response embedded output.
+        The outputs are streamed to the file one after the other, see Output.download().
         
         filepath: optional path to the output file, otherwise a file will be created in the local directory with the name assigned by the server, 
                   or default name 'wps.out' for embedded output.
         """
         
         if self.isSucceded():
-            content = ''
-            for output in self.processOutputs:
-                
-                output_content = output.retrieveData(self.username, self.password)
-                
-                # ExecuteResponse contains reference to server-side output
-                if output_content is not "":
-                    content = content + output_content
-                    if filepath is None:
-                        filepath = output.fileName
-                    
-                # ExecuteResponse contain embedded output   
-                if len(output.data)>0:
-                    if filepath is None:
+            outputs = [output for output in self.processOutputs
+                       if output.reference is not None or len(output.data)>0]
+            if len(outputs)>0:
+                if filepath is None:
+                    # ExecuteResponse contains reference to server-side output, or embedded output
+                    if outputs[0].reference is not None:
+                        filepath = outputs[0]._referenceFileName()
+                    else:
                         filepath = 'wps.out'
-                    for data in output.data:
-                        content = content + data
-                    
-            # write out content
-            if content is not '':
                 out = open(filepath, 'wb')
-                out.write(content)
-                out.close()
+                try:
+                    for output in outputs:
+                        output.download(out, self.username, self.password, session=self.session)
+                finally:
+                    out.close()
                 log.info('Output written to file: %s' %filepath)
             
         else:
             raise Exception("Execution not successfully completed: status=%s" % self.status)
+
+    def getOutputs(self, path='', max_workers=4):
+        """
+        Method to write each output of a WPS process to its own file, as Output.writeToDisk does,
+        downloading the referenced outputs concurrently from max_workers threads.
+        Returns the paths of the files written; the first failed download is raised once the others complete.
+
+        path: optional directory of the output files, prefixed to the names assigned by the server
+        """
+
+        if not self.isSucceded():
+            raise Exception("Execution not successfully completed: status=%s" % self.status)
+        outputs = [output for output in self.processOutputs
+                   if output.reference is not None or len(output.data)>0]
+        write = lambda output: output.writeToDisk(path, self.username, self.password, session=self.session)
+        errors = [error for output, result, error in concurrent_map(write, outputs, max_workers)
+                  if error is not None]
+        if errors:
+            reraise(errors[0])
+        return [output.filePath for output in outputs]
     
     def submitRequest(self, request):
         """
@@ -663,7 +856,7 @@ class WPSExecution():
         """ 
         
         self.request = request
-        reader = WPSExecuteReader(verbose=self.verbose)
+        reader = WPSExecuteReader(verbose=self.verbose, session=self.session)
         response = reader.readFromUrl(self.url, request, method='Post', username=self.username, password=self.password)
         self.response = response
         return response
@@ -758,6 +951,10 @@ class WPSExecution():
 
         self.process = Process(root.find(nspath('Process', ns=wpsns)), verbose=self.verbose)
         
+        # inputs and outputs of the latest status document replace earlier ones
+        self.dataInputs = []
+        self.processOutputs = []
+
         #<wps:DataInputs xmlns:wps="http://www.opengis.net/wps/1.0.0"
         #                xmlns:ows="http://www.opengis.net/ows/1.1" xmlns:xlink="http://www.w3.org/1999/xlink">
         for inputElement in root.findall( nspath('DataInputs/Input', ns=wpsns) ):
@@ -1031,61 +1228,124 @@ class Output(InputOutput):
                 if literalDataElement.text is not None and literalDataElement.text.strip() is not '':
                     self.data.append(literalDataElement.text.strip())
                     
-    def retrieveData(self, username=None, password=None):
+    def retrieveData(self, username=None, password=None, session=None):
         """
         Method to retrieve data from server-side reference: 
         returns "" if the reference is not known.
+        The whole output is read into memory, see download() to stream it to a file instead.
         
         username, password: credentials to access the remote WPS server 
+        session: optional util.Session used for the download
         """
         
-        url = self.reference
-        if url is None: 
+        if self.reference is None: 
             return ""
-        
+        return self._openReference(username, password, session).read()
+
+    def _referenceFileName(self):
         # a) 'http://cida.usgs.gov/climate/gdp/process/RetrieveResultServlet?id=1318528582026OUTPUT.601bb3d0-547f-4eab-8642-7c7d2834459e'
         # b) 'http://rsg.pml.ac.uk/wps/wpsoutputs/outputImage-11294Bd6l2a.tif'
+        if '?' in self.reference:
+            # extract output filepath from URL query string
+            return self.reference.split('?')[1].split('=')[1]
+        # extract output filepath from base URL
+        return self.reference.split('/')[-1]
+
+    def _openReference(self, username=None, password=None, session=None, headers=None):
+        url = self.reference
         log.info('Output URL=%s' % url)
+        self.fileName = self._referenceFileName()
         if '?' in url:
             spliturl=url.split('?')
-            u = openURL(spliturl[0], spliturl[1], method='Get', username = username, password = password)
-            # extract output filepath from URL query string
-            self.fileName = spliturl[1].split('=')[1]
-        else:
-            u = openURL(url, '', method='Get', username = username, password = password)
-            # extract output filepath from base URL
-            self.fileName = url.split('/')[-1]
-                
-        return u.read()      
+            return openURL(spliturl[0], spliturl[1], method='Get', username = username, password = password,
+                           session=session, headers=headers)
+        return openURL(url, '', method='Get', username = username, password = password, session=session,
+                       headers=headers)
 
-                    
-    def writeToDisk(self, path=None, username=None, password=None):
+    def download(self, target, username=None, password=None, session=None, chunksize=65536, retries=3):
+        """
+        Method to stream an output to a file, chunk by chunk, without holding it in memory:
+        the referenced file is downloaded from the server, then any content embedded in the response is written.
+        A download interrupted by a transient error (connection reset, timeout, truncated body or 5xx status) is
+        retried up to retries times, resuming from the bytes already written with an HTTP Range request.
+        When the server does not honor the range the download starts over, which requires target to be seekable.
+        Returns the number of bytes written.
+
+        target: path of the output file, or a file-like object with a write() method
+        username, password: credentials to access the remote WPS server
+        session: optional util.Session used for the download
+        chunksize: size in bytes of the chunks read and written
+        """
+
+        if isinstance(target, basestring):
+            out = open(target, 'wb')
+            try:
+                return self.download(out, username, password, session, chunksize, retries)
+            finally:
+                out.close()
+
+        written = 0
+        if self.reference is not None:
+            start = target.tell() if hasattr(target, 'tell') else None
+            attempt = 0
+            while True:
+                headers = {'Range': 'bytes=%d-' % written} if written else None
+                try:
+                    u = self._openReference(username, password, session, headers)
+                    if written and getattr(u, 'code', None) != 206:
+                        # the server ignored the range: start over
+                        if start is None or not hasattr(target, 'truncate'):
+                            raise IOError('Cannot resume download of %s' % self.reference)
+                        log.info('Restarting download of %s' % self.reference)
+                        target.seek(start)
+                        target.truncate()
+                        written = 0
+                    length = u.info().getheader('Content-Length')
+                    received = 0
+                    while True:
+                        chunk = u.read(chunksize)
+                        if not chunk:
+                            break
+                        target.write(chunk)
+                        received += len(chunk)
+                        written += len(chunk)
+                    u.close()
+                    if length is not None and received < int(length):
+                        raise httplib.IncompleteRead('', int(length) - received)
+                    break
+                except Exception, e:
+                    if attempt >= retries or not is_transient_error(e):
+                        raise
+                    attempt += 1
+                    log.warning('Download of %s interrupted after %d bytes, retrying: %s' % (self.reference, written, e))
+
+        for data in self.data:
+            target.write(data)
+            written += len(data)
+        return written
+
+    def writeToDisk(self, path=None, username=None, password=None, session=None):
         """
         Method to write an output of a WPS process to disk: 
         it either retrieves the referenced file from the server, or write out the content of response embedded output.
+        The output is streamed to the file, see download().
         
-        filepath: optional path to the output file, otherwise a file will be created in the local directory with the name assigned by the server,
+        path: optional directory of the output file, prefixed to the name assigned by the server (or the output identifier)
         username, password: credentials to access the remote WPS server
+        session: optional util.Session used for the download
         """ 
         
-        # Check if ExecuteResponse contains reference to server-side output    
-        content = self.retrieveData(username, password)
-         
-        # ExecuteResponse contain embedded output   
-        if content is "" and len(self.data)>0:
+        if self.reference is None and len(self.data) == 0:
+            return
+        if self.reference is not None:
+            self.fileName = self._referenceFileName()
+        else:
             self.fileName = self.identifier
-            for data in self.data:
-                content = content + data
-                    
-        # write out content
-        if content is not "":
-            if self.fileName == "":
-                self.fileName = self.identifier
-            self.filePath = path + self.fileName
-            out = open(self.filePath, 'wb')
-            out.write(content)
-            out.close()
-            log.info('Output written to file: %s' %self.filePath)
+        if not self.fileName:
+            self.fileName = self.identifier
+        self.filePath = (path or '') + self.fileName
+        self.download(self.filePath, username, password, session)
+        log.info('Output written to file: %s' %self.filePath)
                 
                     
 class WPSException:
@@ -1316,6 +1576,229 @@ class GMLMultiPolygonFeatureCollection(FeatureCollection):
         idElement.text = "0"
         return dataElement
     
+class TimeoutError(Exception):
+    """
+    Raised when the result of an ExecutionFuture is not available in time.
+    """
+    pass
+
+
+class ExecutionFuture(object):
+    """
+    Result of a WPS execution tracked by a WPSExecutionManager, in the manner of concurrent.futures.Future.
+    The result is the WPSExecution itself, once complete (succesfully or not).
+    """
+
+    def __init__(self, execution):
+        self.execution = execution
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self._exception = None
+        self._cancelled = False
+
+    def done(self):
+        return self._done.is_set()
+
+    def cancelled(self):
+        return self._cancelled
+
+    def cancel(self):
+        """
+        Stop tracking the execution (the remote process is not dismissed). Returns False if already done.
+        """
+        if self.done():
+            return False
+        self._cancelled = True
+        self._finish(None)
+        return True
+
+    def result(self, timeout=None):
+        """
+        Wait for the execution to complete and return it; raises the exception of a failed status check.
+        """
+        if not self._done.wait(timeout):
+            raise TimeoutError('Execution %s not complete' % self.execution.statusLocation)
+        if self._exception is not None:
+            raise self._exception
+        return self.execution
+
+    def exception(self, timeout=None):
+        if not self._done.wait(timeout):
+            raise TimeoutError('Execution %s not complete' % self.execution.statusLocation)
+        return self._exception
+
+    def add_done_callback(self, fn):
+        """
+        Call fn with this future once it is done, at once if it is already.
+        Callbacks run in the threads of the manager, and should return quickly.
+        """
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(fn)
+                return
+        self._call(fn)
+
+    def _call(self, fn):
+        try:
+            fn(self)
+        except Exception, e:
+            log.exception('Execution callback failed: %s' % e)
+
+    def _finish(self, exception):
+        with self._lock:
+            if self._done.is_set():
+                return
+            self._exception = exception
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            self._call(fn)
+
+
+class WPSExecutionManager(object):
+    """
+    Tracks many asynchronous WPS executions at once, polling their status documents until they complete.
+
+    A single scheduling thread keeps the executions in order of their next poll and hands due polls to a
+    pool of max_workers threads, so the number of threads does not grow with the number of executions.
+    Polling adapts to each execution: when its percentCompleted progresses, the next poll is planned around
+    half the estimated remaining time, otherwise the interval grows by backoff; either way it stays between
+    min_interval and max_interval seconds.  Transient HTTP errors are retried at the next poll, up to
+    max_retries in a row.
+
+    Usage:
+        manager = WPSExecutionManager()
+        futures = [manager.submit(wps.execute(identifier, inputs)) for inputs in batch]
+        for future in futures:
+            execution = future.result()
+        manager.shutdown()
+    """
+
+    def __init__(self, min_interval=1, max_interval=60, backoff=1.5, max_workers=4, max_retries=3):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.max_retries = max_retries
+        self._pool = ThreadPool(max_workers)
+        self._condition = threading.Condition()
+        self._queue = []  # heap of (time of next poll, sequence, job)
+        self._sequence = 0
+        self._pending = 0
+        self._shutdown = False
+        self._thread = threading.Thread(target=self._run, name='WPSExecutionManager')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def submit(self, execution, callback=None):
+        """
+        Track an execution, submitted with statusLocation, and return its ExecutionFuture;
+        callback is added to the future as by add_done_callback.
+        """
+        future = ExecutionFuture(execution)
+        if callback is not None:
+            future.add_done_callback(callback)
+        if execution.status is not None and execution.isComplete():
+            future._finish(None)
+        elif execution.statusLocation is None:
+            future._finish(ValueError('Execution without statusLocation can not be monitored'))
+        else:
+            job = {'future': future, 'interval': self.min_interval, 'polled': time.time(),
+                   'percent': execution.percentCompleted, 'retries': 0}
+            with self._condition:
+                if self._shutdown:
+                    raise RuntimeError('WPSExecutionManager is shut down')
+                self._pending += 1
+            future.add_done_callback(self._forget)
+            self._schedule(job, self.min_interval)
+        return future
+
+    def wait(self, timeout=None):
+        """
+        Wait until all tracked executions are complete; returns False on timeout.
+        """
+        end = None if timeout is None else time.time() + timeout
+        with self._condition:
+            while self._pending:
+                remaining = None if end is None else end - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def shutdown(self, wait=True):
+        """
+        Stop the manager, after all tracked executions complete if wait is True (otherwise they are cancelled).
+        """
+        if wait:
+            self.wait()
+        with self._condition:
+            self._shutdown = True
+            jobs = [job for t, n, job in self._queue]
+            del self._queue[:]
+            self._condition.notify_all()
+        for job in jobs:
+            job['future'].cancel()
+        self._thread.join()
+        self._pool.terminate()
+
+    def _forget(self, future):
+        with self._condition:
+            self._pending -= 1
+            self._condition.notify_all()
+
+    def _schedule(self, job, delay):
+        with self._condition:
+            if self._shutdown:
+                return
+            self._sequence += 1
+            heapq.heappush(self._queue, (time.time() + delay, self._sequence, job))
+            self._condition.notify_all()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._shutdown and (not self._queue or self._queue[0][0] > time.time()):
+                    self._condition.wait(self._queue[0][0] - time.time() if self._queue else None)
+                if self._shutdown:
+                    return
+                t, n, job = heapq.heappop(self._queue)
+            if not job['future'].done():
+                self._pool.apply_async(self._poll, (job,))
+
+    def _interval(self, job, execution, now):
+        percent = execution.percentCompleted or 0
+        if percent > job['percent'] and percent < 100:
+            rate = (percent - job['percent']) / max(now - job['polled'], 1e-3)
+            interval = (100 - percent) / rate / 2.
+        else:
+            interval = job['interval'] * self.backoff
+        job['percent'] = percent
+        job['polled'] = now
+        job['interval'] = max(self.min_interval, min(self.max_interval, interval))
+        return job['interval']
+
+    def _poll(self, job):
+        future = job['future']
+        execution = future.execution
+        try:
+            execution.updateStatus()
+            complete = execution.isComplete()
+        except Exception, e:
+            if is_transient_error(e) and job['retries'] < self.max_retries:
+                job['retries'] += 1
+                log.warning('Status check of %s failed, retrying: %s' % (execution.statusLocation, e))
+                self._schedule(job, self._interval(job, execution, time.time()))
+            else:
+                future._finish(e)
+            return
+        job['retries'] = 0
+        if complete:
+            future._finish(None)
+        else:
+            self._schedule(job, self._interval(job, execution, time.time()))
+
+
 def monitorExecution(execution, sleepSecs=3, download=False, filepath=None):
     '''
     Convenience method to monitor the status of a WPS execution till it completes (succesfully or not),
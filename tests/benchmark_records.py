@@ -0,0 +1,104 @@
+"""
+Per-record parse time of CswRecord and MD_Metadata on the CSW and ISO test
+resources, with the memoized namespace paths and the compiled nsfind and
+nsfindall of owslib.util ("after"), and with the plain path building and
+find/findall calls they replaced ("before").
+
+Run from the top directory of the source tree:
+
+    python -m tests.benchmark_records [repeat]
+
+Each figure is the best of repeat (5 by default) runs, in microseconds per
+record.
+"""
+
+import sys
+import timeit
+from contextlib import contextmanager
+
+from owslib import util
+from owslib.csw import CswRecord
+from owslib.etree import etree
+from owslib.iso import MD_Metadata
+from tests.utils import resource_file
+
+
+def _nspath_eval(xpath, namespaces):
+    # util.nspath_eval without memoization
+    out = []
+    for chunks in xpath.split('/'):
+        namespace, element = chunks.split(':')
+        out.append('{%s}%s' % (namespaces[namespace], element))
+    return '/'.join(out)
+
+
+def _nsfind(elem, xpath, namespaces):
+    return elem.find(_nspath_eval(xpath, namespaces))
+
+
+def _nsfindall(elem, xpath, namespaces):
+    return elem.findall(_nspath_eval(xpath, namespaces))
+
+
+@contextmanager
+def unoptimized():
+    """Parse with the path helpers as they were before memoization"""
+    saved = util.nspath_eval, util.nsfind, util.nsfindall
+    util.nspath_eval, util.nsfind, util.nsfindall = _nspath_eval, _nsfind, _nsfindall
+    try:
+        yield
+    finally:
+        util.nspath_eval, util.nsfind, util.nsfindall = saved
+
+
+def touch(obj, seen=None):
+    """Read all the fields of a record, and of the objects they hold"""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return
+    seen.add(id(obj))
+    if isinstance(obj, (list, tuple)):
+        for value in obj:
+            touch(value, seen)
+        return
+    for name in dir(type(obj)):
+        if isinstance(getattr(type(obj), name, None), util.cached_property):
+            touch(getattr(obj, name), seen)
+
+
+def benchmarks():
+    iso = etree.parse(resource_file('9250AA67-F3AC-6C12-0CB9-0662231AA181_iso.xml')).getroot()
+    dc = etree.parse(resource_file('9250AA67-F3AC-6C12-0CB9-0662231AA181_dc.xml')).getroot()
+
+    def iso_summary():
+        md = MD_Metadata(iso)
+        return md.identifier, md.identification.title, md.identification.bbox
+
+    def dc_summary():
+        record = CswRecord(dc)
+        return record.identifier, record.title, record.bbox
+
+    return [
+        ('MD_Metadata, all fields', lambda: touch(MD_Metadata(iso))),
+        ('MD_Metadata, identifier/title/bbox', iso_summary),
+        ('CswRecord, all fields', lambda: touch(CswRecord(dc))),
+        ('CswRecord, identifier/title/bbox', dc_summary),
+    ]
+
+
+def best(func, repeat, number=200):
+    return min(timeit.repeat(func, repeat=repeat, number=number)) / number * 1e6
+
+
+def main(repeat=5):
+    print '%-36s %10s %10s' % ('us per record', 'before', 'after')
+    for name, func in benchmarks():
+        with unoptimized():
+            before = best(func, repeat)
+        after = best(func, repeat)
+        print '%-36s %10.0f %10.0f' % (name, before, after)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -1,8 +1,11 @@
 import logging
 import os
 import sys
+import threading
+import BaseHTTPServer
+import SocketServer
 from owslib.etree import etree
-from urlparse import urlparse
+from urlparse import urlparse, parse_qsl
 
 def setup_logging(loglevel='INFO'):
     """Helper function to setup logging for tests"""
@@ -68,3 +71,72 @@ def cast_tuple_int_list_srs(tup):
 
 def sorted_url_query(url):
     return sorted(urlparse(url).query.split("&"))
+
+
+class _StubHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        with self.server.stub.lock:
+            self.server.stub.connections += 1
+
+    def _respond(self):
+        stub = self.server.stub
+        length = int(self.headers.get('Content-Length') or 0)
+        self.body = self.rfile.read(length) if length else None
+        pieces = urlparse(self.path)
+        self.query = dict((k.lower(), v) for k, v in parse_qsl(pieces.query))
+        with stub.lock:
+            stub.requests.append(self)
+        response = stub.responses.get(pieces.path, (404, {}, 'Not Found'))
+        if callable(response):
+            response = response(self)
+        if isinstance(response, basestring):
+            response = (200, {'Content-Type': 'text/xml'}, response)
+        status, headers, body = response
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = _respond
+    do_POST = _respond
+
+    def log_message(self, *args):
+        pass
+
+
+class _ThreadedServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # clients closing idle keep-alive connections are not errors
+        pass
+
+
+class StubServer(object):
+    """Local keep-alive HTTP server answering requests with canned responses.
+
+    responses maps a URL path to a body string (served as text/xml), a
+    (status, headers, body) tuple, or a callable receiving the request
+    handler (with method, path, query, headers and body) and returning
+    either of those."""
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.requests = []
+        self.connections = 0
+        self.lock = threading.Lock()
+        self._server = _ThreadedServer(('127.0.0.1', 0), _StubHandler)
+        self._server.stub = self
+        self.url = 'http://127.0.0.1:%d' % self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()